@@ -2,6 +2,7 @@
 Building commands
 """
 
+import os
 from .command import MuxCommand
 from evennia import utils, CmdSet
 from evennia.utils.evtable import EvTable
@@ -10,6 +11,7 @@ from evennia.utils.utils import inherits_from
 from evennia.commands.default.building import _convert_from_string
 from world.archetypes import ALL_TRAITS
 from world.skills import ALL_SKILLS
+from world import telemetry
 from typeclasses.npcshop.npcshop import CmdBuildShop
 
 
@@ -26,6 +28,7 @@ class AinneveBuildingCmdSet(CmdSet):
         self.add(CmdSetTraits())
         self.add(CmdSetSkills())
         self.add(CmdBuildShop())
+        self.add(CmdDice())
 
 #
 # To use the prototypes with the @spawn function set
@@ -371,3 +374,92 @@ class CmdSetSkills(MuxCommand):
              for i in xrange(3)]
         table = EvTable(header=False, table=data)
         caller.msg(unicode(table))
+
+
+class CmdDice(MuxCommand):
+    """
+    dice fairness telemetry
+
+    Usage
+      @dice
+      @dice/on [<n>]
+      @dice/off
+      @dice/sites [<expression>]
+
+    Switches:
+      on    - start counting one roll in <n> (default 32),
+              discarding previous counts
+      off   - stop counting; counts are kept for display
+      sites - show counts by the line of code making each roll,
+              optionally for one dice expression only
+
+    Without switches, shows counts by dice expression. Each line is
+    tested against the exact distribution of its expression: 'p' is the
+    p value over all counted rolls, 'recent p' over the last complete
+    window of rolls. Lines with a p value below 0.001 are flagged, as
+    fair dice rarely produce them.
+    """
+
+    key = "@dice"
+    locks = "cmd:perm(Wizards)"
+    help_category = "Admin"
+
+    def _format_p(self, p):
+        """Return a p value formatted and colored for display"""
+        if p is None:
+            return "|x--|n"
+        color = "|r" if p < telemetry.ALERT_P else "|w"
+        return "{}{:.4f}|n".format(color, p)
+
+    def func(self):
+        caller = self.caller
+
+        if "on" in self.switches:
+            every = int(self.args) if self.args.isdigit() else \
+                telemetry.SAMPLE_EVERY
+            telemetry.enable(sample_every=max(1, every))
+            caller.msg("Dice telemetry on, counting 1 roll in {}.".format(
+                max(1, every)))
+            return
+        if "off" in self.switches:
+            telemetry.disable()
+            caller.msg("Dice telemetry off.")
+            return
+
+        stats = telemetry.TELEMETRY
+        if stats is None:
+            caller.msg("Dice telemetry has not been started. "
+                       "Use |w@dice/on|n to start it.")
+            return
+
+        sites = "sites" in self.switches
+        rows = []
+        for key, check in stats.report(sites=sites):
+            if sites:
+                expr, filename, function, line = key
+                if self.args and expr != self.args:
+                    continue
+                label = "{} {}:{} ({})".format(
+                    expr, os.path.relpath(filename), line, function)
+            else:
+                label = key
+            rows.append([label, check['rolls'],
+                         "{:.2f}".format(check['mean'])
+                         if check['mean'] is not None else "--",
+                         "{:.2f}".format(check['expected']),
+                         self._format_p(check['p']),
+                         self._format_p(check['window_p'])])
+
+        caller.msg("Dice telemetry is {}, counting 1 roll in {}.".format(
+            "on" if telemetry.enabled() else "off", stats.sample_every))
+        if not rows:
+            caller.msg("No rolls counted.")
+            return
+        table = EvTable("Call site" if sites else "Expression", "Rolls",
+                        "Mean", "Expected", "p", "recent p")
+        for row in rows:
+            table.add_row(*row)
+        caller.msg(unicode(table))
+        if stats.untracked:
+            caller.msg("{} rolls of untracked expressions were not "
+                       "counted.".format(stats.untracked))
@@ -44,12 +44,14 @@ class CmdSheet(MuxCommand):
             return
 
         form = EvForm('commands.templates.charsheet', align='r')
-        tr = self.caller.traits
+        # read all trait values in one pass
+        tr = self.caller.traits.snapshot()
+        boundaries = self.caller.traits.XP.level_boundaries
         fields = {
             'A': self.caller.name,
             'B': self.caller.db.archetype,
             'C': tr.XP.actual,
-            'D': tr.XP.level_boundaries[tr.LV.actual],
+            'D': boundaries[tr.LV.actual],
             'E': tr.LV.actual,
             'F': tr.STR.actual,
             'G': tr.PER.actual,
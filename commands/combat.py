@@ -154,7 +154,7 @@ class CmdInitiateAttack(default_cmds.MuxCommand):
                 target.get_display_name(caller)))
             target.msg("{} attacks you!".format(
                 caller.get_display_name(target)))
-            for char in chandler.db.characters.values():
+            for char in chandler.ndb.characters.values():
                 char.execute_cmd("look")
             chandler.msg_all("The turn begins. Declare your actions!")
 
@@ -213,7 +213,7 @@ class CmdAttack(default_cmds.MuxCommand):
     def func(self):
         caller = self.caller
         ch = caller.ndb.combat_handler
-        combat_chars = ch.db.characters.values()
+        combat_chars = ch.ndb.characters.values()
 
         attack_type = getattr(self, 'attack_type', 'attack')
         duration = getattr(self, 'duration', 1)
@@ -412,7 +412,7 @@ class CmdAdvance(default_cmds.MuxCommand):
 
     def func(self):
         caller = self.caller
-        combat_chars = caller.ndb.combat_handler.db.characters.values()
+        combat_chars = caller.ndb.combat_handler.ndb.characters.values()
         target = None
         if not self.args:
             if len(combat_chars) == 2:
@@ -659,7 +659,7 @@ class CmdWrestle(default_cmds.MuxCommand):
         else:
             switch = ''
 
-        combat_chars = caller.ndb.combat_handler.db.characters.values()
+        combat_chars = caller.ndb.combat_handler.ndb.characters.values()
 
         target = caller.search(
                     self.args,
@@ -711,7 +711,7 @@ class CmdTackle(default_cmds.MuxCommand):
             caller.msg("Usage: tackle <target>")
             return
 
-        combat_chars = caller.ndb.combat_handler.db.characters.values()
+        combat_chars = caller.ndb.combat_handler.ndb.characters.values()
 
         target = caller.search(
                     self.args,
@@ -798,7 +798,7 @@ class CmdCombatLook(default_cmds.MuxCommand):
         opponents_by_range = ch.get_proximity(caller)
         for rng in opponents_by_range:
             for opp_id in opponents_by_range[rng]:
-                opponent = ch.db.characters[opp_id]
+                opponent = ch.ndb.characters[opp_id]
                 caller.msg(
                     "    {opponent} at |G{range}|n range.".format(
                         opponent=opponent.get_display_name(caller),
@@ -808,17 +808,17 @@ class CmdCombatLook(default_cmds.MuxCommand):
             caller.msg(
                 "  The current turn timer has |y{}|n seconds remaining.".format(
                     ch.time_until_next_repeat()))
-            if len(ch.db.turn_actions[caller.id]):
+            if len(ch.ndb.turn_actions[caller.id]):
                 caller.msg("  You have entered the following actions:")
                 durations = ['free', 'half-turn', 'full-turn', 'multi-turn']
-                for idx, (action, _, target, duration) \
-                        in enumerate(ch.db.turn_actions[caller.id]):
+                for idx, (name, _, target, duration, args) \
+                        in enumerate(ch.ndb.turn_actions[caller.id]):
                     duration = duration if duration < len(durations) \
                         else len(durations)-1
                     caller.msg(
                         "    {idx}: |w{action:<25}|n {target:<30} (|Y{duration} action|n)".format(
                             idx=idx+1,
-                            action=action,
+                            action='/'.join((name,) + tuple(args)),
                             target='' if target == caller
                                    else target.get_display_name(caller),
                             duration=durations[duration]))
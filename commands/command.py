@@ -7,6 +7,7 @@ Commands describe the input the player can do to the game.
 
 from evennia import Command as BaseCommand
 from evennia import default_cmds
+from world.traits import get_trait_handlers
 
 
 class Command(BaseCommand):
@@ -39,8 +40,12 @@ class Command(BaseCommand):
     def at_pre_cmd(self):
         """
         This hook is called before `self.parse()` on all commands.
+
+        Trait changes on the caller are batched for the duration
+        of the command and written once in `at_post_cmd`.
         """
-        pass
+        for handler in get_trait_handlers(self.caller):
+            handler.start_batch()
 
     def parse(self):
         """
@@ -83,7 +88,8 @@ class Command(BaseCommand):
         """
         This hook is called after `self.func()`.
         """
-        pass
+        for handler in get_trait_handlers(self.caller):
+            handler.end_batch()
 
 
 class MuxCommand(default_cmds.MuxCommand):
@@ -118,6 +124,23 @@ class MuxCommand(default_cmds.MuxCommand):
     strings, but case is preserved.
     """
 
+    def at_pre_cmd(self):
+        """
+        This hook is called before `self.parse()` on all commands.
+
+        Trait changes on the caller are batched for the duration
+        of the command and written once in `at_post_cmd`.
+        """
+        for handler in get_trait_handlers(self.caller):
+            handler.start_batch()
+
+    def at_post_cmd(self):
+        """
+        This hook is called after `self.func()`.
+        """
+        for handler in get_trait_handlers(self.caller):
+            handler.end_batch()
+
     def func(self):
         """
         This is the hook function that actually does all the work. It is called
@@ -6,11 +6,12 @@ from evennia.commands.default.tests import CommandTest
 from commands.equip import *
 from commands.chartraits import CmdSheet, CmdTraits
 from commands.room_exit import CmdCapacity, CmdTerrain
-from commands.building import CmdSpawn, CmdSetTraits, CmdSetSkills
+from commands.building import CmdSpawn, CmdSetTraits, CmdSetSkills, CmdDice
 from typeclasses.characters import Character, NPC
 from typeclasses.weapons import Weapon
 from typeclasses.rooms import Room
 from world.archetypes import apply_archetype, calculate_secondary_traits
+from world import rulebook
 from utils.utils import sample_char
 
 
@@ -147,6 +148,15 @@ class EquipTestCase(CommandTest):
         self.char1.execute_cmd('get Obj')
         self.call(CmdWear(), 'Obj', "You can't wear Obj(#4).")
 
+    def test_remove_legacy_armor(self):
+        """test armor worn without a modifier record is removed"""
+        self.char1.execute_cmd('get Obj2')
+        base = self.char1.traits.DEF.actual
+        # armor worn before it was applied as a named modifier
+        self.char1.traits.DEF.mod += self.obj2.db.toughness
+        self.obj2.at_remove(self.char1)
+        self.assertEqual(self.char1.traits.DEF.actual, base)
+
     def test_equip_list(self):
         """test the equip command"""
         self.call(CmdEquip(), "", "You have nothing in your equipment.")
@@ -323,6 +333,14 @@ class BuildingTestCase(CommandTest):
         self.call(CmdSetSkills(), "Obj leadership, animal = 2, 3, 2", "Incorrect number of assignment values.")
         self.call(CmdSetSkills(), "Obj escape = X", "Assignment values must be numeric.")
 
+    def test_dice_cmd(self):
+        """test @dice command"""
+        self.call(CmdDice(), "/on 1", "Dice telemetry on, counting 1 roll in 1.")
+        rulebook.std_roll()
+        self.call(CmdDice(), "", "Dice telemetry is on, counting 1 roll in 1.|")
+        self.call(CmdDice(), "/off", "Dice telemetry off.")
+        self.call(CmdDice(), "/sites std_roll", "Dice telemetry is off, counting 1 roll in 1.|")
+
     def test_spawn_cmd(self):
         """test overridden @spawn command"""
         # no args
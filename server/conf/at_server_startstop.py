@@ -15,6 +15,9 @@ at_server_cold_start()
 at_server_cold_stop()
 
 """
+from world.combat_registry import COMBATS
+from world.regen import REGEN
+from world.traits import MODIFIER_SCHEDULER
 
 
 def at_server_start():
@@ -22,7 +25,9 @@ def at_server_start():
     This is called every time the server starts up, regardless of
     how it was shut down.
     """
-    pass
+    REGEN.start()
+    COMBATS.start()
+    MODIFIER_SCHEDULER.start()
 
 
 def at_server_stop():
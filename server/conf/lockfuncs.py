@@ -35,14 +35,19 @@ def in_range(accessing_obj, accessed_obj, *args, **kwargs):
     """returns true if accessing_obj has any targets in specified range"""
     range = args[0] if args else 0
     if isinstance(range, basestring):
-        range = COMBAT_DISTANCES.indexof(range)
+        if range.isdigit():
+            range = int(range)
+        else:
+            range = COMBAT_DISTANCES.index(range) \
+                if range in COMBAT_DISTANCES else -1
     if range < 0:
         return False
     if hasattr(accessing_obj, 'nattributes') and \
             accessing_obj.nattributes.has('combat_handler'):
         ch = accessing_obj.ndb.combat_handler
-        return any(y <= range for x,y in ch.db.distances.iteritems()
-                    if accessing_obj.id in x)
+        nearest = ch.get_min_range(accessing_obj)
+        return nearest is not None and \
+            COMBAT_DISTANCES.index(nearest) <= range
     return False
 
 
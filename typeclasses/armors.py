@@ -19,10 +19,12 @@ class Armor(Equippable):
         self.db.toughness = self.toughness
 
     def at_equip(self, character):
-        character.traits.DEF.mod += self.db.toughness
+        character.traits.add_mod('DEF', self.dbref, self.db.toughness)
 
     def at_remove(self, character):
-        character.traits.DEF.mod -= self.db.toughness
+        if not character.traits.remove_mod('DEF', self.dbref):
+            # worn before armor was applied as a named modifier
+            character.traits.DEF.mod -= self.db.toughness
 
 
 class Shield(Armor):
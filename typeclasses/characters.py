@@ -10,11 +10,20 @@ creation commands.
 from evennia.contrib.rpsystem import ContribRPCharacter
 from evennia.utils import lazy_property, utils
 from world.equip import EquipHandler
-from world.traits import TraitHandler
-from world.skills import apply_skills
-from world.archetypes import Archetype
+from world.traits import TraitHandler, register_names, register_template
+from world.skills import skill_template
+from world.archetypes import Archetype, register_derived_traits
+from world.combat_registry import COMBATS
 from world.death import CharDeathHandler, NPCDeathHandler
 
+# NPCs share the base archetype's trait data and store only their changes
+register_template('npc', Archetype().traits)
+register_template('npc_skills', skill_template(Archetype().traits))
+# trait names are not repeated in compact character data
+register_names(dict((key, data['name']) for key, data in
+                    Archetype().traits.items() +
+                    skill_template(Archetype().traits).items()))
+
 
 class Character(ContribRPCharacter):
     """Base character typeclass for Ainneve.
@@ -38,12 +47,14 @@ class Character(ContribRPCharacter):
     @lazy_property
     def traits(self):
         """TraitHandler that manages character traits."""
-        return TraitHandler(self)
+        traits = TraitHandler(self, compact=True)
+        register_derived_traits(traits)
+        return traits
 
     @lazy_property
     def skills(self):
-        """TraitHandler that manages character traits."""
-        return TraitHandler(self, db_attribute='skills')
+        """TraitHandler that manages character skills."""
+        return TraitHandler(self, db_attribute='skills', compact=True)
 
     @lazy_property
     def equip(self):
@@ -51,7 +62,7 @@ class Character(ContribRPCharacter):
         return EquipHandler(self)
 
     def at_turn_start(self):
-        """Hook called at the start of each combat turn or by a 6s ticker."""
+        """Hook called at the start of each combat turn or by `world.regen`."""
         # refill traits that are allocated every turn
         self.traits.MV.fill_gauge()
         self.traits.BM.fill_gauge()
@@ -84,10 +95,31 @@ class Character(ContribRPCharacter):
         if self.nattributes.has('combat_handler'):
             self.ndb.combat_handler.remove_character(self)
 
+    def at_after_move(self, source_location, **kwargs):
+        """Called after moving; keeps the combat registry's room index
+        current for characters in combat."""
+        super(Character, self).at_after_move(source_location, **kwargs)
+        if self.nattributes.has('combat_handler'):
+            COMBATS.moved(self)
+
 
 class NPC(Character):
     """Base character typeclass for NPCs and enemies.
     """
+    @lazy_property
+    def traits(self):
+        """TraitHandler that manages NPC traits.
+
+        NPC traits are set individually by prototypes, so no
+        derived traits are registered.
+        """
+        return TraitHandler(self, template='npc')
+
+    @lazy_property
+    def skills(self):
+        """TraitHandler that manages NPC skills."""
+        return TraitHandler(self, db_attribute='skills', template='npc_skills')
+
     def at_object_creation(self):
         super(NPC, self).at_object_creation()
 
@@ -96,13 +128,6 @@ class NPC(Character):
         self.db.slots = {'wield': None,
                          'armor': None}
 
-        # initialize traits
-        npc = Archetype()
-        for key, kwargs in npc.traits.iteritems():
-            self.traits.add(key, **kwargs)
-
-        apply_skills(self)
-
     def at_death(self):
         """Hook called when an NPC dies."""
         self.scripts.add(NPCDeathHandler)
@@ -114,7 +139,7 @@ class NPC(Character):
         if "aggressive" in self.tags.all() and self.nattributes.has('combat_handler'):
 
             ch = self.ndb.combat_handler
-            opponent = ch.db.characters[[cid for cid in ch.db.characters.keys()
+            opponent = ch.ndb.characters[[cid for cid in ch.ndb.characters.keys()
                                     if cid != self.id][0]]
 
             if ch.get_range(opponent, self) != 'melee':
@@ -1,20 +1,134 @@
 
 from collections import deque, OrderedDict
-from operator import add
 import random
 from .scripts import Script
 from evennia import TICKER_HANDLER as tickerhandler
 from evennia.utils import utils, make_iter
+from world.combat_clock import COMBAT_CLOCK
+from world.combat_registry import COMBATS
+from world.prompts import PROMPTS
+from world.regen import REGEN
+from world.traits import get_trait_handlers
 
 
 COMBAT_DISTANCES = ['melee', 'reach', 'ranged']
 WRESTLING_POSITIONS = ('STANDING', 'CLINCHED', 'TAKE DOWN', 'PINNED')
 
 _ACTIONS_PER_TURN = utils.variable_from_module('world.rulebook', 'ACTIONS_PER_TURN')
-_COMBAT_PROMPT = ("|M[|n HP: |g{tr.HP.actual}|n "
-                  "|| WM: |w{tr.WM.actual}|n "
-                  "|| BM: |x{tr.BM.actual}|n "
-                  "|| SP: |y{tr.SP.actual}|n |M]|n")
+
+
+class RangeBands(object):
+    """Index of the distances between the combatants of a fight.
+
+    Each combatant has a set of combatant ids for each range in
+    `COMBAT_DISTANCES`, so the distance between two combatants and the
+    opponents at a given range are found in constant time, and a move
+    touches only the combatants whose distance changes.
+
+    Args:
+        data (dict, optional): index data, as returned by `dump()`
+    """
+    def __init__(self, data=None):
+        self._bands = {}
+        for cid, bands in (data or {}).items():
+            self._bands[cid] = dict((rng, set(bands.get(rng, ())))
+                                    for rng in COMBAT_DISTANCES)
+
+    def __len__(self):
+        """Return number of combatants."""
+        return len(self._bands)
+
+    def __contains__(self, cid):
+        return cid in self._bands
+
+    def add(self, cid, rng='ranged'):
+        """Adds a combatant at range `rng` from all others."""
+        bands = self._bands[cid] = dict((r, set()) for r in COMBAT_DISTANCES)
+        for other, other_bands in self._bands.items():
+            if other != cid:
+                other_bands[rng].add(cid)
+                bands[rng].add(other)
+
+    def remove(self, cid):
+        """Removes a combatant."""
+        bands = self._bands.pop(cid, None)
+        if bands:
+            for rng, others in bands.items():
+                for other in others:
+                    self._bands[other][rng].discard(cid)
+
+    def get(self, cid, other):
+        """Returns the range between two combatants.
+
+        Raises:
+            KeyError: if either combatant is not in the index
+        """
+        bands = self._bands[cid]
+        for rng in COMBAT_DISTANCES:
+            if other in bands[rng]:
+                return rng
+        raise KeyError(other)
+
+    def set(self, cid, other, rng):
+        """Sets the range between two combatants."""
+        old = self.get(cid, other)
+        if old != rng:
+            self._bands[cid][old].discard(other)
+            self._bands[cid][rng].add(other)
+            self._bands[other][old].discard(cid)
+            self._bands[other][rng].add(cid)
+
+    def band(self, cid, rng):
+        """Returns the ids of the combatants at range `rng` from `cid`.
+
+        The set returned is the index's own and must not be modified.
+        """
+        return self._bands[cid][rng]
+
+    def nearest(self, cid):
+        """Returns the nearest range with opponents, or None."""
+        bands = self._bands[cid]
+        for rng in COMBAT_DISTANCES:
+            if bands[rng]:
+                return rng
+        return None
+
+    def dump(self):
+        """Returns the index data as a dict of sorted id lists."""
+        return dict((cid, dict((rng, sorted(ids))
+                               for rng, ids in bands.items()))
+                    for cid, bands in self._bands.items())
+
+
+class _MessageBatch(object):
+    """Combat messages held back until the end of a subturn.
+
+    Display names are looked up once per viewer and object for as long
+    as the batch is held.
+    """
+    def __init__(self):
+        # combatant: [line, ...]
+        self.lines = OrderedDict()
+        # (location, message, mapping, exclude) for bystanders
+        self.room = []
+        # (viewer, obj): display name
+        self.names = {}
+
+    def display_name(self, obj, viewer):
+        """Returns the name of `obj` as seen by `viewer`."""
+        if not hasattr(obj, 'get_display_name'):
+            return str(obj)
+        key = (viewer, obj)
+        name = self.names.get(key)
+        if name is None:
+            name = self.names[key] = obj.get_display_name(viewer)
+        return name
+
+    def format(self, message, mapping, viewer):
+        """Returns `message` with `mapping` substituted for `viewer`."""
+        return message.format(**dict(
+            (token, self.display_name(val, viewer))
+            for token, val in mapping.items()))
 
 
 class CombatHandler(Script):
@@ -27,72 +141,100 @@ class CombatHandler(Script):
     def at_script_creation(self):
         "Called when script is first created"
 
-        self.key = "combat_handler_%i" % random.randint(1, 1000)
+        self.db.combat_id = COMBATS.next_id()
+        self.key = "combat_handler_%i" % self.db.combat_id
         self.desc = "handles combat"
         self.interval = 2 * 60  # two minute timeout
         self.start_delay = True
         self.persistent = True
 
+        # live combat state, kept in memory; see `checkpoint`
         # store all combatants
-        self.db.characters = {}
-        # distance between combatants
-        self.db.distances = {}
+        self.ndb.characters = {}
+        # distance between combatants; see `RangeBands`
+        self.ndb.bands = RangeBands()
         # store all actions for each turn
-        self.db.turn_actions = {}
+        self.ndb.turn_actions = {}
         # number of actions entered per combatant
-        self.db.action_count = {}
+        self.ndb.action_count = {}
+        # order of action and progress through the turn being resolved
+        self.ndb.turn_order = []
+        self.ndb.subturn = 0
+        self.ndb.actor_idx = 0
+        # seed of the combat's random streams and number of turns resolved
+        self.db.rng_seed = random.getrandbits(32)
+        self.db.turn = 0
+        self.checkpoint()
 
     def _init_character(self, character):
         """
         This initializes handler back-reference
         and combat cmdset on a character. It also
-        stops the tickerhandler that normally calls
-        at_turn_start every 6s
+        removes it from the out-of-combat regen service
         """
         if not character.nattributes.has('combat_handler'):
+            REGEN.remove(character)
+            # characters registered before the regen service
             tickerhandler.remove(6, character.at_turn_start)
             character.ndb.combat_handler = self
             character.cmdset.add("commands.combat.CombatBaseCmdSet")
             character.cmdset.add("commands.combat.CombatCmdSet")
-            prompt = _COMBAT_PROMPT.format(tr=character.traits)
-            character.msg(prompt=prompt)
+            PROMPTS.send(character)
 
     def _cleanup_character(self, character):
         """
         Remove character from handler and clean
         it of the back-reference and cmdset. Also
-        re-starts the tickerhandler
+        returns it to the regen service
         """
         dbref = character.id
-        del self.db.characters[dbref]
-        del self.db.turn_actions[dbref]
-        del self.db.action_count[dbref]
-        for key in [k for k in self.db.distances.keys()
-                    if dbref in k]:
-            del self.db.distances[key]
+        self.flush_traits(character)
+        self.flush_messages(character)
+        del self.ndb.characters[dbref]
+        del self.ndb.turn_actions[dbref]
+        del self.ndb.action_count[dbref]
+        self.bands.remove(dbref)
+        COMBATS.leave(character)
 
         character.at_turn_end()
         del character.ndb.combat_handler
         if character.cmdset.has_cmdset("combat_cmdset"):
             character.cmdset.remove("commands.combat.CombatCmdSet")
         character.cmdset.remove("commands.combat.CombatBaseCmdSet")
-        tickerhandler.add(6, character.at_turn_start)
-        character.msg(prompt=' ')
+        REGEN.add(character)
+        PROMPTS.send(character, idle=True)
 
     def at_start(self):
         """
         This is called on first start but also when the script is restarted
-        after a server reboot. We need to re-assign this combat handler to
-        all characters as well as re-assign the cmdset.
+        after a server reboot. We need to restore the combat state from its
+        last checkpoint, then re-assign this combat handler to all characters
+        as well as re-assign the cmdset.
         """
-        for character in self.db.characters.values():
+        if self.ndb.characters is None:
+            self.restore()
+        COMBATS.add(self)
+        for character in self.ndb.characters.values():
             self._init_character(character)
 
     def at_stop(self):
         "Called just before the script is stopped/destroyed."
-        for character in self.db.characters.values():
+        # discard actions still scheduled for this combat
+        COMBAT_CLOCK.cancel(self)
+        self.flush_traits()
+        self.flush_messages()
+        for character in self.ndb.characters.values():
             # note: the list() call above disconnects list from database
             self._cleanup_character(character)
+        COMBATS.remove(self)
+
+    def at_server_reload(self):
+        "Called before the server reloads; saves the combat state."
+        self.checkpoint()
+
+    def at_server_shutdown(self):
+        "Called before the server shuts down; saves the combat state."
+        self.checkpoint()
 
     def at_repeat(self, *args):
         """
@@ -112,29 +254,29 @@ class CombatHandler(Script):
     def add_character(self, character):
         "Add combatant to handler"
         dbref = character.id
-        for cid in self.db.characters.keys():
-            # all characters start at 'ranged' distance from each other
-            self.db.distances[frozenset((cid, character.id))] = 'ranged'
+        # all characters start at 'ranged' distance from each other
+        self.bands.add(dbref, 'ranged')
 
-        self.db.characters[dbref] = character
-        self.db.action_count[dbref] = 0
-        self.db.turn_actions[dbref] = deque([])
+        self.ndb.characters[dbref] = character
+        self.ndb.action_count[dbref] = 0
+        self.ndb.turn_actions[dbref] = deque([])
+        COMBATS.join(self, character)
         # set up back-reference
         self._init_character(character)
         character.at_turn_start()
 
     def remove_character(self, character):
         "Remove combatant from handler"
-        if character.id in self.db.characters:
+        if character.id in self.ndb.characters:
             self._cleanup_character(character)
 
-        if len(self.db.characters) <= 1:
+        if len(self.ndb.characters) <= 1:
             # if we have no more than one character in battle, kill this handler
             self.stop()
  
     def msg_all(self, message, exclude=()):
         "Send message to all combatants"
-        for character in self.db.characters.values():
+        for character in self.ndb.characters.values():
             if character not in exclude:
                 character.msg(message)
 
@@ -165,8 +307,12 @@ class CombatHandler(Script):
         exclude = make_iter(exclude) if exclude else []
 
         kwargs.update(dict(actor=actor, target=target))
+        batch = self.ndb.messages
+        held = batch is not None
+        if not held:
+            batch = _MessageBatch()
 
-        for character in self.db.characters.values():
+        for character in self.ndb.characters.values():
             if character == actor:
                 cbt_prefix = '|b->|n '
             elif character == target:
@@ -175,44 +321,129 @@ class CombatHandler(Script):
                 cbt_prefix = '|x..|n '
 
             if character not in exclude:
-                mapping = {token: val.get_display_name(character)
-                                   if hasattr(val, 'get_display_name')
-                                   else str(val)
-                           for token, val in kwargs.items()}
-
-                character.msg(
-                    (cbt_prefix + message).format(**mapping),
-                    prompt=_COMBAT_PROMPT.format(tr=character.traits))
+                text = batch.format(cbt_prefix + message, kwargs, character)
+                if held:
+                    batch.lines.setdefault(character, []).append(text)
+                else:
+                    PROMPTS.send(character, text)
 
         # send messaging to others in the same room but not in combat
-        actor.location.msg_contents(
-            text=message,
-            mapping=kwargs,
-            exclude=exclude + self.db.characters.values()
-        )
+        exclude = exclude + self.ndb.characters.values()
+        if held:
+            batch.room.append((actor.location, message, kwargs, exclude))
+        else:
+            actor.location.msg_contents(
+                text=message,
+                mapping=kwargs,
+                exclude=exclude
+            )
+
+    def hold_messages(self):
+        """Holds back combat messages until `flush_messages` is called.
+
+        While messages are held, each recipient's lines are collected and
+        sent as one message with a single prompt, and display names are
+        looked up once per viewer and object.
+        """
+        if self.ndb.messages is None:
+            self.ndb.messages = _MessageBatch()
+
+    def flush_messages(self, character=None):
+        """Sends held combat messages and stops holding them.
 
-    def add_action(self, action, character, target, duration, longturn=False):
+        Args:
+            character (Character, optional): only send the messages held
+                for this combatant, and keep holding the others
+        """
+        batch = self.ndb.messages
+        if batch is None:
+            return
+        if character is not None:
+            lines = batch.lines.pop(character, None)
+            if lines:
+                PROMPTS.send(character, '\n'.join(lines))
+            return
+        self.ndb.messages = None
+
+        for character, lines in batch.lines.items():
+            PROMPTS.send(character, '\n'.join(lines))
+
+        # one message per bystander, in the order the lines were held
+        bystanders = OrderedDict()
+        for location, message, mapping, exclude in batch.room:
+            for obj in location.contents:
+                if obj not in exclude and hasattr(obj, 'msg'):
+                    bystanders.setdefault(obj, []).append(
+                        batch.format(message, mapping, obj))
+        for obj, lines in bystanders.items():
+            obj.msg('\n'.join(lines))
+
+    def hold_traits(self):
+        """Holds back trait writes until `flush_traits` is called.
+
+        While writes are held, the traits of every combatant are changed
+        in memory and written at most once, when they are flushed.
+        """
+        if self.ndb.trait_batch is None:
+            batch = dict((cid, get_trait_handlers(character))
+                         for cid, character in self.ndb.characters.items())
+            for handlers in batch.values():
+                for handler in handlers:
+                    handler.start_batch(held=True)
+            self.ndb.trait_batch = batch
+
+    def flush_traits(self, character=None):
+        """Writes held trait changes and stops holding them.
+
+        Args:
+            character (Character, optional): only write the traits of
+                this combatant, and keep holding the others
+        """
+        batch = self.ndb.trait_batch
+        if batch is None:
+            return
+        if character is not None:
+            batch = {character.id: batch.pop(character.id, ())}
+        else:
+            self.ndb.trait_batch = None
+        for handlers in batch.values():
+            for handler in handlers:
+                handler.end_batch()
+
+    def add_action(self, action, character, target, duration=None,
+                   longturn=False):
         """
         Called by combat commands to register an action with the handler.
 
-         action - string identifying the action
+         action - string identifying the action and its switches,
+                  as in 'advance/reach'
          character - the character performing the action
          target - the target character or None
-         duration - the duration of the action
+         duration - the duration of the action, or None for the
+                    duration the action was registered with
 
         actions are stored in a dictionary keyed to each character, each
         of which holds a list of actions. An action is stored as
-        a tuple (action, character, target, duration).
+        a tuple (name, character, target, duration, args), where name
+        is the action's key in `world.rulebook.ACTIONS` and args are
+        its parsed switches.
+
+        Raises CombatActionError if the action is not registered.
         """
+        from world.rulebook import ACTIONS, parse_action
+        name, args = parse_action(action)
+        if duration is None:
+            duration = ACTIONS[name].duration
         dbref = character.id
-        count = self.db.action_count[dbref]
+        count = self.ndb.action_count[dbref]
         if 0 <= count < _ACTIONS_PER_TURN or longturn:
-            self.db.turn_actions[dbref].append((action, character, target, duration))
+            self.ndb.turn_actions[dbref].append(
+                (name, character, target, duration, args))
         else:
             # report if we already used too many actions
             return False
-        self.db.action_count[dbref] = \
-            sum([x[3] for x in self.db.turn_actions[dbref]])
+        self.ndb.action_count[dbref] = \
+            sum([x[3] for x in self.ndb.turn_actions[dbref]])
         return True
 
     def remove_last_action(self, character):
@@ -224,17 +455,91 @@ class CombatHandler(Script):
         """
         dbref = character.id
 
-        if len(self.db.turn_actions[dbref]) == 0:
+        if len(self.ndb.turn_actions[dbref]) == 0:
             return False
         else:
-            action, _, target, _ = self.db.turn_actions[dbref].pop()
-            self.db.action_count[dbref] = \
-                sum([x[3] for x in self.db.turn_actions[dbref]])
-            return action, target
+            name, _, target, _, args = self.ndb.turn_actions[dbref].pop()
+            self.ndb.action_count[dbref] = \
+                sum([x[3] for x in self.ndb.turn_actions[dbref]])
+            return '/'.join((name,) + tuple(args)), target
+
+    # Combat state persistence
+
+    def checkpoint(self):
+        """Saves the live combat state to the database.
+
+        While a combat runs, its state is kept in plain structures in
+        `ndb`, so queueing and resolving actions never touches the
+        database. The state is written as a single attribute at the
+        start of each turn and before the server reloads or shuts
+        down; `restore` reads it back.
+        """
+        self.db.state = {
+            'characters': dict(self.ndb.characters),
+            'ranges': self.bands.dump(),
+            'turn_actions': dict((cid, list(actions)) for cid, actions
+                                 in self.ndb.turn_actions.items()),
+            'action_count': dict(self.ndb.action_count),
+            'turn_order': list(self.ndb.turn_order),
+            'subturn': self.ndb.subturn,
+            'actor_idx': self.ndb.actor_idx,
+        }
+
+    def restore(self):
+        """Restores the live combat state from the last checkpoint."""
+        state = self.db.state
+        if state is None:
+            # combat started before its state was checkpointed
+            state = dict((key, self.attributes.get(key)) for key in
+                         ('characters', 'ranges', 'turn_actions',
+                          'action_count', 'turn_order', 'subturn',
+                          'actor_idx'))
+        self.ndb.characters = dict(state['characters'] or {})
+        self.ndb.bands = bands = RangeBands(state['ranges'])
+        if state['ranges'] is None and self.db.distances:
+            # distances stored by pair before they were indexed
+            for pair, rng in self.db.distances.items():
+                cid, other = tuple(pair)
+                for dbref in (cid, other):
+                    if dbref not in bands:
+                        bands.add(dbref)
+                bands.set(cid, other, rng)
+        self.ndb.turn_actions = dict(
+            (cid, deque(self._restore_action(action) for action in actions))
+            for cid, actions in (state['turn_actions'] or {}).items())
+        self.ndb.action_count = dict(state['action_count'] or {})
+        self.ndb.turn_order = list(state['turn_order'] or [])
+        self.ndb.subturn = state['subturn'] or 0
+        self.ndb.actor_idx = state['actor_idx'] or 0
+
+    @staticmethod
+    def _restore_action(action):
+        """Returns a saved action as a `(name, character, target,
+        duration, args)` tuple.
+
+        Actions queued before they were registered are stored as
+        `(action, character, target, duration)` with the switches still
+        in the action string, as in 'advance/reach'.
+        """
+        if len(action) == 5:
+            return tuple(action)
+        from world.rulebook import parse_action
+        action, character, target, duration = action
+        name, args = parse_action(action)
+        return name, character, target, duration, args
+
+    @property
+    def bands(self):
+        """The `RangeBands` index of distances between combatants."""
+        return self.ndb.bands
 
     def get_range(self, character, target):
         """Returns the range for a pair of combatants."""
-        return self.db.distances[frozenset((character.id, target.id))]
+        return self.bands.get(character.id, target.id)
+
+    def set_range(self, character, target, to_range):
+        """Sets the range between a pair of combatants."""
+        self.bands.set(character.id, target.id, to_range)
 
     def get_min_range(self, character):
         """Returns the name of the nearest range wth opponents.
@@ -242,48 +547,36 @@ class CombatHandler(Script):
         Args:
           character (Character): character object to center on
             """
-        char_prox = self.get_proximity(character)
-        for rng in char_prox:
-            if len(char_prox[rng]) > 0:
-                return rng
-        return None
+        return self.bands.nearest(character.id)
 
     def get_proximity(self, character):
         """Returns a list of lists of character dbrefs by distance."""
         proximities = OrderedDict()
         for rng in COMBAT_DISTANCES:
-            proximities[rng] = []
-
-        if character:
-            for id, rng in [(next(iter(k.difference(frozenset((character.id,))))), r)
-                            for k, r in self.db.distances.items()
-                            if character.id in k]:
-                proximities[rng].append(id)
-
+            proximities[rng] = (sorted(self.bands.band(character.id, rng))
+                                if character else [])
         return proximities
 
     def move_character(self, character, to_range, target=None):
         """Changes a character's range with respect to one or more other combatants."""
-        _CD = COMBAT_DISTANCES
-        distances = self.db.distances
-        char_prox = self.get_proximity(character)
-        targ_prox = self.get_proximity(target)
+        bands = self.bands
+        cid = character.id
 
         if target:
             # advancing; set the distance between the character and target
-            distances[frozenset((character.id, target.id))] = to_range
+            bands.set(cid, target.id, to_range)
 
             if to_range == 'melee':
                 # char takes on target's distances for all others
-                for rng in _CD:
-                    for cid in targ_prox[rng]:
-                        if cid != character.id:
-                            distances[frozenset((character.id, cid))] = rng
+                for rng in COMBAT_DISTANCES:
+                    for other in list(bands.band(target.id, rng)):
+                        if other != cid:
+                            bands.set(cid, other, rng)
 
         else:  # retreating; to_range is either 'reach' or 'ranged'
-            for cid in reduce(add, [char_prox[rng] for rng
-                                    in _CD[:_CD.index(to_range)]]):
-                distances[frozenset((character.id, cid))] = to_range
+            for rng in COMBAT_DISTANCES[:COMBAT_DISTANCES.index(to_range)]:
+                for other in list(bands.band(cid, rng)):
+                    bands.set(cid, other, to_range)
 
     def check_end_turn(self):
         """
@@ -291,7 +584,7 @@ class CombatHandler(Script):
         the resolution of the turn. We check if everyone
         has added all their actions; if so we call self.end_turn()
         """
-        if all(count > 1 for count in self.db.action_count.values()):
+        if all(count > 1 for count in self.ndb.action_count.values()):
             # this will both reset timer and trigger self.end_turn()
             self.at_repeat("endturn")
 
@@ -303,28 +596,50 @@ class CombatHandler(Script):
         """
         self.pause()
 
-        for character in self.db.characters.values():
+        for character in self.ndb.characters.values():
             character.cmdset.remove("commands.combat.CombatCmdSet")
             character.at_turn_end()
 
         from world.rulebook import resolve_combat
-        resolve_combat(self)
+        self.db.turn = (self.db.turn or 0) + 1
+        resolve_combat(self, self.turn_rng())
+
+    def turn_rng(self, turn=None):
+        """Returns a new random stream for a turn of this combat.
+
+        Every roll made while resolving a turn is drawn from the same
+        stream, which is derived from `db.rng_seed` and the turn number
+        alone. Restoring the combatants' state and resolving with
+        `turn_rng(turn)` replays the turn exactly.
+
+        Args:
+            turn (int, optional): turn number; the current turn if None
+
+        Returns:
+            (random.Random): the turn's random stream
+        """
+        if self.db.rng_seed is None:
+            # combat started before streams were recorded
+            self.db.rng_seed = random.getrandbits(32)
+        turn = self.db.turn if turn is None else turn
+        return random.Random((self.db.rng_seed << 20) + turn)
 
     def begin_turn(self):
-        if len(self.db.characters) < 2:
+        if len(self.ndb.characters) < 2:
             # if we have less than 2 characters in battle, kill this handler
             self.msg_all("Combat has ended")
-            for character in self.db.characters.values():
+            for character in self.ndb.characters.values():
                 self._cleanup_character(character)
             self.stop()
         else:
             # reset counters before next turn
-            for character in self.db.characters.values():
-                self.db.characters[character.id] = character
-                self.db.action_count[character.id] = \
-                    sum([x[3] for x in self.db.turn_actions[character.id]])
+            for character in self.ndb.characters.values():
+                self.ndb.characters[character.id] = character
+                self.ndb.action_count[character.id] = \
+                    sum([x[3] for x in self.ndb.turn_actions[character.id]])
                 character.cmdset.add("commands.combat.CombatCmdSet")
                 character.at_turn_start()
 
+            self.checkpoint()
             self.msg_all("Next turn begins. Declare your actions!")
             self.unpause()
@@ -3,7 +3,9 @@ Combat handler test module
 """
 
 import re
+from collections import deque
 from django.conf import settings
+from django.test import TestCase
 from mock import Mock
 from evennia.utils.test_resources import EvenniaTest
 from evennia.utils.spawner import spawn
@@ -11,12 +13,17 @@ from evennia.utils import ansi, create
 from server.conf import settings as ainneve_settings
 from typeclasses.characters import Character, NPC
 from typeclasses.rooms import Room
-from typeclasses.combat_handler import CombatHandler
+from typeclasses.combat_handler import CombatHandler, RangeBands
 from utils.utils import sample_char
+from world.combat_registry import COMBATS
 
 _RE = re.compile(r"^\+|-+\+|\+-+|--*|\|(?:\s|$)", re.MULTILINE)
 
 
+class _Session(object):
+    """Stand-in for a connected session."""
+
+
 class AinneveCombatTest(EvenniaTest):
     """Base test case for combat handler tests"""
     def setUp(self):
@@ -59,6 +66,10 @@ class AinneveCombatTest(EvenniaTest):
         self.obj1.msg = Mock()
         self.obj2.msg = Mock()
         self.obj3.msg = Mock()
+        # prompts are only sent to characters with sessions; a new session
+        # on every lookup has each of their prompts sent
+        self.char1.sessions.all = lambda: [_Session()]
+        self.char2.sessions.all = lambda: [_Session()]
         # add combatants
         self.script.add_character(self.char1)
         self.script.add_character(self.char2)
@@ -90,39 +101,47 @@ class AinneveCombatHandlerTestCase(AinneveCombatTest):
         # the default script already has characters; create our own
         ch = create.create_script('typeclasses.combat_handler.CombatHandler', key="Script")
 
-        self.assertEqual(len(ch.db.characters), 0)
-        self.assertEqual(len(ch.db.action_count), 0)
-        self.assertEqual(len(ch.db.turn_actions), 0)
+        self.assertEqual(len(ch.ndb.characters), 0)
+        self.assertEqual(len(ch.ndb.action_count), 0)
+        self.assertEqual(len(ch.ndb.turn_actions), 0)
 
         # add a character
         ch.add_character(self.char1)
 
-        self.assertEqual(len(ch.db.characters), 1)
-        self.assertEqual(len(ch.db.action_count), 1)
-        self.assertEqual(len(ch.db.turn_actions), 1)
-        self.assertEqual(len(ch.db.distances), 0)
+        self.assertEqual(len(ch.ndb.characters), 1)
+        self.assertEqual(len(ch.ndb.action_count), 1)
+        self.assertEqual(len(ch.ndb.turn_actions), 1)
+        self.assertEqual(len(ch.bands), 1)
+        self.assertEqual(ch.get_min_range(self.char1), None)
+        combat_id = ch.db.combat_id
+        self.assertIs(COMBATS.get(combat_id), ch)
+        self.assertIs(COMBATS.by_participant(self.char1), ch)
 
         # add a second character (NPC)
         ch.add_character(self.obj1)
 
-        self.assertEqual(len(ch.db.characters), 2)
-        self.assertEqual(len(ch.db.action_count), 2)
-        self.assertEqual(len(ch.db.turn_actions), 2)
-        self.assertEqual(len(ch.db.distances), 1)
+        self.assertEqual(len(ch.ndb.characters), 2)
+        self.assertEqual(len(ch.ndb.action_count), 2)
+        self.assertEqual(len(ch.ndb.turn_actions), 2)
+        self.assertEqual(len(ch.bands), 2)
 
-        self.assertIn(self.char1.id, ch.db.characters)
-        self.assertIn(self.char1.id, ch.db.action_count)
-        self.assertIn(self.char1.id, ch.db.turn_actions)
+        self.assertIn(self.char1.id, ch.ndb.characters)
+        self.assertIn(self.char1.id, ch.ndb.action_count)
+        self.assertIn(self.char1.id, ch.ndb.turn_actions)
 
-        self.assertIn(self.obj1.id, ch.db.characters)
-        self.assertIn(self.obj1.id, ch.db.action_count)
-        self.assertIn(self.obj1.id, ch.db.turn_actions)
+        self.assertIn(self.obj1.id, ch.ndb.characters)
+        self.assertIn(self.obj1.id, ch.ndb.action_count)
+        self.assertIn(self.obj1.id, ch.ndb.turn_actions)
 
-        self.assertIn(frozenset((self.char1.id, self.obj1.id)), ch.db.distances)
+        self.assertEqual(ch.get_range(self.char1, self.obj1), 'ranged')
+        self.assertEqual(ch.bands.band(self.char1.id, 'ranged'),
+                         set([self.obj1.id]))
 
         # remove the NPC; this ends the combat
         ch.remove_character(self.obj1)
         self.assertFalse(ch.is_valid())
+        self.assertIsNone(COMBATS.get(combat_id))
+        self.assertIsNone(COMBATS.by_participant(self.char1))
 
     def test_actions(self):
         """test adding and removing combat actions"""
@@ -133,33 +152,33 @@ class AinneveCombatHandlerTestCase(AinneveCombatTest):
 
         # adding a single half turn action
         self.assertTrue(ch.add_action("advance", self.char1, self.obj1, 1))
-        self.assertEqual(len(ch.db.turn_actions[self.char1.id]), 1)
-        self.assertEqual(ch.db.action_count[self.char1.id], 1)
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 1)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 1)
 
         # adding a free action doesn't increment `action_count`
         self.assertTrue(ch.add_action("drop", self.char1, self.melee, 0))
-        self.assertEqual(len(ch.db.turn_actions[self.char1.id]), 2)
-        self.assertEqual(ch.db.action_count[self.char1.id], 1)
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 2)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 1)
 
         # adding a second half turn action
         self.assertTrue(ch.add_action("retreat", self.char1, self.char1, 1))
-        self.assertEqual(len(ch.db.turn_actions[self.char1.id]), 3)
-        self.assertEqual(ch.db.action_count[self.char1.id], 2)
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 3)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 2)
 
         # adding a third isn't possible
         self.assertFalse(ch.add_action("advance", self.char1, self.obj1, 1))
-        self.assertEqual(len(ch.db.turn_actions[self.char1.id]), 3)
-        self.assertEqual(ch.db.action_count[self.char1.id], 2)
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 3)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 2)
 
         # canceling the most recent action
         self.assertEqual(("retreat", self.char1), ch.remove_last_action(self.char1))
-        self.assertEqual(len(ch.db.turn_actions[self.char1.id]), 2)
-        self.assertEqual(ch.db.action_count[self.char1.id], 1)
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 2)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 1)
 
         # adding a full-turn action on top of a half-turn action is allowed
         self.assertTrue(ch.add_action("kick", self.char1, self.char1, 2))
-        self.assertEqual(len(ch.db.turn_actions[self.char1.id]), 3)
-        self.assertEqual(ch.db.action_count[self.char1.id], 3)
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 3)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 3)
 
     def test_range_and_movement(self):
         """test methods for working with combat range and movement"""
@@ -298,12 +317,123 @@ class AinneveCombatHandlerTestCase(AinneveCombatTest):
         """test the get_proximity method"""
         ch = self.script
         self.assertEqual(repr(ch.get_proximity(self.char1)),
-                         "OrderedDict([('melee', []), ('reach', []), ('ranged', [5, 7, 12, 4])])")
+                         "OrderedDict([('melee', []), ('reach', []), ('ranged', [4, 5, 7, 12])])")
 
         ch.move_character(self.obj1, 'melee', self.char2)
         ch.move_character(self.obj2, 'reach', self.char2)
         ch.move_character(self.char1, 'melee', self.char2)
 
         self.assertEqual(repr(ch.get_proximity(self.char1)),
-                         "OrderedDict([('melee', [7, 4]), ('reach', [5]), ('ranged', [12])])")
+                         "OrderedDict([('melee', [4, 7]), ('reach', [5]), ('ranged', [12])])")
+
 
+    def test_checkpoint(self):
+        """test the live combat state is restored from its checkpoint"""
+        ch = self.script
+        ch.add_action("advance/reach", self.char1, self.char2, 1)
+        ch.move_character(self.char1, 'melee', self.char2)
+        # changes are kept in memory until the next checkpoint
+        self.assertNotIn(self.char1.id, ch.db.state['characters'])
+        ch.checkpoint()
+        ch.add_action("dodge", self.char1, self.char1, 1)
+
+        # as after a server reload
+        for key in ('characters', 'bands', 'turn_actions', 'action_count',
+                    'turn_order', 'subturn', 'actor_idx'):
+            ch.nattributes.remove(key)
+        ch.restore()
+        self.assertEqual(ch.ndb.turn_actions[self.char1.id][0],
+                         ('advance', self.char1, self.char2, 1, ('reach',)))
+        self.assertEqual(len(ch.ndb.turn_actions[self.char1.id]), 1)
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 1)
+        self.assertEqual(ch.get_range(self.char1, self.char2), 'melee')
+        self.assertEqual(len(ch.ndb.characters), 5)
+
+    def test_restore_legacy(self):
+        """test combat state saved before checkpoints is restored"""
+        ch = self.script
+        ch.attributes.remove('state')
+        ch.db.characters = {self.char1.id: self.char1,
+                            self.char2.id: self.char2}
+        ch.db.distances = {
+            frozenset((self.char1.id, self.char2.id)): 'reach'}
+        ch.db.turn_actions = {
+            self.char1.id: deque([("advance/reach", self.char1, self.char2, 1),
+                                  ("kick", self.char1, self.char2, 2)]),
+            self.char2.id: deque()}
+        ch.db.action_count = {self.char1.id: 3, self.char2.id: 0}
+        ch.db.turn_order = [self.char1.id, self.char2.id]
+        ch.db.subturn = 1
+        ch.db.actor_idx = 0
+
+        ch.restore()
+        self.assertEqual(list(ch.ndb.turn_actions[self.char1.id]),
+                         [('advance', self.char1, self.char2, 1, ('reach',)),
+                          ('kick', self.char1, self.char2, 2, ())])
+        self.assertEqual(ch.get_range(self.char1, self.char2), 'reach')
+        self.assertEqual(ch.ndb.subturn, 1)
+        self.assertEqual(("kick", self.char2),
+                         ch.remove_last_action(self.char1))
+        self.assertEqual(ch.ndb.action_count[self.char1.id], 1)
+
+    def test_message_batching(self):
+        """test held combat messages are sent once per recipient"""
+        ch = self.script
+        self.char2.get_display_name = Mock(return_value='Char2')
+        ch.hold_messages()
+        ch.combat_msg("{actor} swings at {target}.",
+                      actor=self.char1, target=self.char2)
+        ch.combat_msg("{actor} misses {target}.",
+                      actor=self.char1, target=self.char2)
+        self.assertFalse(self.char1.msg.called)
+        # one lookup per viewer while the messages are held
+        self.assertEqual(self.char2.get_display_name.call_count, 5)
+
+        ch.flush_messages()
+        self.assertEqual(self.char1.msg.call_count, 1)
+        msg, prompt = self.parse_msg_mock(self.char1)
+        self.assertEqual(len(msg.splitlines()), 2)
+        self.assertTrue(msg.endswith("misses Char2."))
+        self.assertEqual(prompt.count("HP"), 1)
+        msg, _ = self.parse_msg_mock(self.obj1)
+        self.assertEqual(msg, ".. Char swings at Char2.\n"
+                              ".. Char misses Char2.")
+
+        # messages are sent right away when not held
+        ch.combat_msg("{actor} waits.", actor=self.char1)
+        self.assertEqual(self.char1.msg.call_count, 1)
+
+    def test_turn_rng(self):
+        """test turn random streams are reproducible from the seed"""
+        ch = self.script
+        self.assertIsNotNone(ch.db.rng_seed)
+        first = [ch.turn_rng(3).random() for _ in range(2)]
+        self.assertEqual(first[0], first[1])
+        self.assertNotEqual(ch.turn_rng(3).random(), ch.turn_rng(4).random())
+
+
+class RangeBandsTestCase(TestCase):
+    """Test case for the combat distance index."""
+    def test_bands(self):
+        """test ranges stay symmetric through adds, moves and removes"""
+        bands = RangeBands()
+        for cid in (1, 2, 3):
+            bands.add(cid)
+        self.assertEqual(bands.get(1, 3), 'ranged')
+        bands.set(1, 2, 'melee')
+        self.assertEqual(bands.get(2, 1), 'melee')
+        self.assertEqual(bands.band(1, 'melee'), set([2]))
+        self.assertEqual(bands.band(1, 'ranged'), set([3]))
+        self.assertEqual(bands.nearest(1), 'melee')
+        self.assertEqual(bands.nearest(3), 'ranged')
+
+        copy = RangeBands(bands.dump())
+        self.assertEqual(copy.dump(), bands.dump())
+
+        bands.remove(2)
+        self.assertNotIn(2, bands)
+        self.assertEqual(bands.nearest(1), 'ranged')
+        bands.remove(3)
+        self.assertIsNone(bands.nearest(1))
+        with self.assertRaises(KeyError):
+            bands.get(1, 2)
@@ -0,0 +1,241 @@
+"""
+Balance matrix.
+
+This module simulates combat between every pair of character builds
+and writes the outcomes as a matrix, to show which archetype, race and
+focus combinations are over- or underpowered. Run it from `evennia
+shell`, as for `utils.simulator`:
+
+    >>> from utils import balance
+    >>> balance.run_matrix('balance.csv', fights=20)
+
+A build is an archetype (single or dual), a race, one of the race's
+foci, and an allocation policy deciding how the archetype's remaining
+primary trait points are spent; see `ALLOCATION_POLICIES`. All builds
+fight with the same weapon, so only their traits differ.
+
+Results are streamed to the CSV file, one row per matchup, as each
+matchup finishes. The CSV file is also the job's checkpoint: running
+`run_matrix` again with the same path skips the matchups already
+recorded, so an interrupted run resumes where it stopped. When all
+matchups are done, a JSON file next to the CSV file receives the full
+win rate matrix.
+"""
+import csv
+import json
+import multiprocessing
+import os
+from collections import OrderedDict
+
+from evennia.utils import logger
+from world import archetypes, races
+from .simulator import run_simulation
+
+_FIELDS = ('a', 'b', 'fights', 'wins_a', 'wins_b', 'draws',
+           'turns', 'damage_a', 'damage_b')
+
+# matchups between progress messages
+_LOG_EVERY = 100
+
+
+def _allocate(primaries, points, choose):
+    """Spends `points` on primary traits one at a time.
+
+    Args:
+        primaries (dict): starting value of each primary trait
+        points (int): number of points to spend
+        choose (callable): called as `choose(values, open)` with the
+            current trait values and the traits still below 10; returns
+            the trait receiving the next point
+
+    Returns:
+        (dict): points added to each primary trait
+    """
+    values = dict(primaries)
+    allocation = dict.fromkeys(primaries, 0)
+    for _ in range(points):
+        available = [t for t in archetypes.PRIMARY_TRAITS if values[t] < 10]
+        if not available:
+            break
+        trait = choose(values, available)
+        values[trait] += 1
+        allocation[trait] += 1
+    return allocation
+
+
+def _even(values, available):
+    """Raises the lowest trait."""
+    return min(available, key=values.get)
+
+
+def _focused(values, available):
+    """Raises the highest trait."""
+    return max(available, key=values.get)
+
+
+def _martial(values, available):
+    """Raises the lowest of the traits used in combat."""
+    combat = [t for t in ('STR', 'DEX', 'VIT', 'PER') if t in available]
+    return min(combat or available, key=values.get)
+
+
+# ways of spending an archetype's remaining primary trait points
+ALLOCATION_POLICIES = OrderedDict((
+    ('even', _even),
+    ('focused', _focused),
+    ('martial', _martial),
+))
+
+
+def all_builds(policies=None, weapon='HAND_AXE'):
+    """Returns fighter descriptions for every build.
+
+    Args:
+        policies (list[str], optional): names of allocation policies to
+            include; all of `ALLOCATION_POLICIES` if None
+        weapon (str): weapon prototype every build fights with
+
+    Returns:
+        (OrderedDict): mapping of build keys, in the form
+            'archetype/race/focus/policy', to fighter descriptions
+            for `utils.simulator`
+    """
+    builds = OrderedDict()
+    for name in archetypes.VALID_ARCHETYPES:
+        traits = archetypes.load_archetype(name).traits
+        primaries = dict((t, traits[t]['base'] + traits[t]['mod'])
+                         for t in archetypes.PRIMARY_TRAITS)
+        points = archetypes.TOTAL_PRIMARY_POINTS - sum(primaries.values())
+        for policy in (policies or ALLOCATION_POLICIES.keys()):
+            allocation = _allocate(primaries, points,
+                                   ALLOCATION_POLICIES[policy])
+            for race in races.ALL_RACES:
+                for focus in races.load_race(race).foci:
+                    key = '/'.join((name, race, focus.name, policy))
+                    builds[key] = {'archetype': name,
+                                   'race': race,
+                                   'focus': focus.name,
+                                   'weapon': weapon,
+                                   'allocation': allocation}
+    return builds
+
+
+def _run_matchup(args):
+    """Pool worker that simulates one matchup and returns its CSV row."""
+    key_a, key_b, spec_a, spec_b, fights, seed, start_range, max_turns = args
+    report = run_simulation(spec_a, spec_b, fights, processes=1, seed=seed,
+                            start_range=start_range, max_turns=max_turns)
+    return {'a': key_a, 'b': key_b, 'fights': report['fights'],
+            'wins_a': int(round(report['win_rate']['a'] * fights)),
+            'wins_b': int(round(report['win_rate']['b'] * fights)),
+            'draws': int(round(report['win_rate']['draw'] * fights)),
+            'turns': report['turns']['mean'],
+            'damage_a': report['damage']['a']['total']['mean'],
+            'damage_b': report['damage']['b']['total']['mean']}
+
+
+def _load_checkpoint(path, fights):
+    """Returns the complete rows recorded in `path` for `fights` fights.
+
+    Rows that were cut short by an interruption, and rows recorded for
+    a different number of fights, are dropped. The file is rewritten
+    without them, so that rerun matchups replace their stale rows and
+    new rows can be appended.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, 'rb') as f:
+        rows = [row for row in csv.DictReader(f)
+                if None not in row.values() and row['damage_b'] and
+                int(row['fights']) == fights]
+    with open(path + '.tmp', 'wb') as f:
+        writer = csv.DictWriter(f, _FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+    os.rename(path + '.tmp', path)
+    return rows
+
+
+def _write_matrix(path, builds, rows):
+    """Writes the win rate matrix of all recorded matchups as JSON."""
+    matrix = OrderedDict((key, OrderedDict()) for key in builds)
+    for row in rows:
+        if row['a'] not in matrix or row['b'] not in matrix:
+            logger.log_warn("Balance matrix: skipping unknown build in "
+                            "{} vs {}.".format(row['a'], row['b']))
+            continue
+        fights = float(row['fights'])
+        matrix[row['a']][row['b']] = int(row['wins_a']) / fights
+        matrix[row['b']][row['a']] = int(row['wins_b']) / fights
+    overall = OrderedDict(
+        (key, sum(rates.values()) / len(rates) if rates else None)
+        for key, rates in matrix.items())
+    with open(path, 'wb') as f:
+        json.dump({'builds': builds, 'win_rate': matrix,
+                   'overall': overall}, f, indent=2)
+
+
+def run_matrix(path, builds=None, fights=20, processes=None, seed=0,
+               start_range='ranged', max_turns=50):
+    """Simulates every pair of different builds and writes the outcome matrix.
+
+    Args:
+        path (str): CSV file receiving one row per matchup; the JSON
+            matrix is written to the same path with a '.json' extension
+        builds (OrderedDict, optional): builds to match up, as returned
+            by `all_builds`; all builds if None
+        fights (int): fights simulated per matchup
+        processes (int, optional): worker processes to use; one per CPU
+            if None. With 1, matchups run in the calling process.
+        seed (int): base seed; matchup `i` uses seeds from
+            `seed + i * fights`, so resumed runs are reproducible
+        start_range (str): initial distance between fighters
+        max_turns (int): turns after which a fight is a draw
+
+    Returns:
+        (dict): numbers of matchups `run` now and `resumed` from the
+            checkpoint, and the `json` path of the matrix
+    """
+    builds = builds if builds is not None else all_builds()
+    keys = builds.keys()
+    done = _load_checkpoint(path, fights)
+    recorded = set((row['a'], row['b']) for row in done)
+
+    pending = []
+    for i, key_a in enumerate(keys):
+        for j, key_b in enumerate(keys[i + 1:], i + 1):
+            if (key_a, key_b) in recorded:
+                continue
+            index = i * len(keys) + j
+            pending.append((key_a, key_b, builds[key_a], builds[key_b],
+                            fights, seed + index * fights, start_range,
+                            max_turns))
+
+    if os.path.exists(path):
+        mode, header = 'ab', False
+    else:
+        mode, header = 'wb', True
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    try:
+        results = (pool.imap_unordered(_run_matchup, pending) if pool
+                   else (_run_matchup(args) for args in pending))
+        with open(path, mode) as f:
+            writer = csv.DictWriter(f, _FIELDS)
+            if header:
+                writer.writeheader()
+            for count, row in enumerate(results, 1):
+                writer.writerow(row)
+                f.flush()
+                done.append(row)
+                if count % _LOG_EVERY == 0:
+                    logger.log_info("Balance matrix: {}/{} matchups.".format(
+                        count, len(pending)))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    json_path = os.path.splitext(path)[0] + '.json'
+    _write_matrix(json_path, builds, done)
+    return {'run': len(pending), 'resumed': len(recorded), 'json': json_path}
@@ -0,0 +1,196 @@
+"""
+Microbenchmarks.
+
+These functions time hot paths of Ainneve's game systems in isolation.
+They import game modules, so run them from within `evennia shell`:
+
+    >>> from utils import benchmarks
+    >>> benchmarks.bench_trait_actual()
+
+Each function returns a dict of timings in seconds so that results can
+be compared between revisions.
+"""
+from timeit import timeit
+
+
+def _sample_traits():
+    """Returns a list of 30 loaded `Trait` objects.
+
+    Trait data is built from the base `Archetype` definitions plus
+    enough extra counters and gauges to reach 30 traits, matching a
+    typical player character.
+    """
+    from world.archetypes import Archetype
+    from world.traits import Trait
+
+    data = Archetype().traits
+    for i in range(30 - len(data)):
+        kind = ('counter', 'gauge')[i % 2]
+        data['X{}'.format(i)] = {'type': kind, 'name': 'Extra {}'.format(i),
+                                 'base': 10, 'mod': 0, 'min': 0}
+    for trait in data.values():
+        trait.setdefault('current', trait['base'])
+    return [Trait(trait) for trait in data.values()]
+
+
+def bench_trait_actual(passes=10000):
+    """Times reads of `Trait.actual` on a 30-trait character.
+
+    Compares reading the memoized `actual` property against calling
+    `_compute_actual()`, the computation that `actual` performed on
+    every access before it was cached.
+
+    Args:
+        passes (int): number of times all 30 traits are read
+
+    Returns:
+        (dict): total seconds for 'cached' and 'uncached' reads
+    """
+    traits = _sample_traits()
+
+    def cached():
+        for trait in traits:
+            trait.actual
+
+    def uncached():
+        for trait in traits:
+            trait._compute_actual()
+
+    return {'cached': timeit(cached, number=passes),
+            'uncached': timeit(uncached, number=passes)}
+
+
+def bench_trait_pickle(passes=1000):
+    """Times pickling a 30-trait character's data in both storage formats.
+
+    Compares the dict-per-trait format against the compact record
+    format used by `TraitHandler(obj, compact=True)`.
+
+    Args:
+        passes (int): number of dumps and loads of each format
+
+    Returns:
+        (dict): total seconds for 'dict' and 'compact' round trips, and
+            pickled 'dict_bytes' and 'compact_bytes' sizes
+    """
+    from cPickle import dumps, loads, HIGHEST_PROTOCOL
+    from world.traits import _compact
+
+    data = dict(('T{}'.format(i), trait._data)
+                for i, trait in enumerate(_sample_traits()))
+    compact = dict((key, _compact(key, trait)) for key, trait in data.items())
+
+    def round_trip(obj):
+        return lambda: loads(dumps(obj, HIGHEST_PROTOCOL))
+
+    return {'dict': timeit(round_trip(data), number=passes),
+            'compact': timeit(round_trip(compact), number=passes),
+            'dict_bytes': len(dumps(data, HIGHEST_PROTOCOL)),
+            'compact_bytes': len(dumps(compact, HIGHEST_PROTOCOL))}
+
+
+def bench_dice_telemetry(passes=20000):
+    """Times the roll functions with dice telemetry off and on.
+
+    Args:
+        passes (int): number of `std_roll`, `d_roll` and `skill_check`
+            calls timed in each mode
+
+    Returns:
+        (dict): total seconds for 'off', 'on' (default sampling) and
+            'on_all' (every roll counted)
+    """
+    from world import rulebook, telemetry
+
+    def rolls():
+        rulebook.std_roll()
+        rulebook.d_roll('2d6+1')
+        rulebook.skill_check(3)
+
+    saved = rulebook.TELEMETRY, telemetry.TELEMETRY
+    try:
+        telemetry.disable()
+        results = {'off': timeit(rolls, number=passes)}
+        telemetry.enable()
+        results['on'] = timeit(rolls, number=passes)
+        telemetry.enable(sample_every=1)
+        results['on_all'] = timeit(rolls, number=passes)
+    finally:
+        rulebook.TELEMETRY, telemetry.TELEMETRY = saved
+    return results
+
+
+def bench_combat_ranges(sizes=(2, 10, 100), passes=20):
+    """Times combat range lookups and moves at several fight sizes.
+
+    Each pass has every combatant look up its nearest opponents, advance
+    to melee with the next combatant and retreat to ranged again.
+    Compares the `RangeBands` index against the pair-keyed distance dict
+    it replaced, where every lookup scanned all pairs of the fight.
+
+    Args:
+        sizes (tuple[int]): numbers of combatants
+        passes (int): number of passes timed at each size
+
+    Returns:
+        (dict): for each size, total seconds for 'indexed' and 'pairs'
+    """
+    from operator import add
+    from typeclasses.combat_handler import (COMBAT_DISTANCES, CombatHandler,
+                                            RangeBands)
+
+    def proximity(distances, cid):
+        prox = dict((rng, []) for rng in COMBAT_DISTANCES)
+        for pair, rng in distances.items():
+            if cid in pair:
+                prox[rng].append(next(iter(pair - frozenset((cid,)))))
+        return prox
+
+    def pairs(n):
+        distances = dict((frozenset((a, b)), 'ranged')
+                         for a in range(n) for b in range(a + 1, n))
+
+        def run():
+            for cid in range(n):
+                target = (cid + 1) % n
+                prox = proximity(distances, cid)
+                [rng for rng in COMBAT_DISTANCES if prox[rng]]
+                targ_prox = proximity(distances, target)
+                distances[frozenset((cid, target))] = 'melee'
+                for rng in COMBAT_DISTANCES:
+                    for other in targ_prox[rng]:
+                        if other != cid:
+                            distances[frozenset((cid, other))] = rng
+                prox = proximity(distances, cid)
+                for other in reduce(add, [prox['melee'], prox['reach']]):
+                    distances[frozenset((cid, other))] = 'ranged'
+        return run
+
+    class Fight(object):
+        """Just enough of a `CombatHandler` for its range methods."""
+        get_min_range = CombatHandler.__dict__['get_min_range']
+        move_character = CombatHandler.__dict__['move_character']
+
+        def __init__(self, n):
+            self.bands = RangeBands()
+            for cid in range(n):
+                self.bands.add(cid)
+
+    class Combatant(object):
+        def __init__(self, cid):
+            self.id = cid
+
+    def indexed(n):
+        fight = Fight(n)
+        chars = [Combatant(cid) for cid in range(n)]
+
+        def run():
+            for char in chars:
+                fight.get_min_range(char)
+                fight.move_character(char, 'melee', chars[(char.id + 1) % n])
+                fight.move_character(char, 'ranged')
+        return run
+
+    return dict((n, {'indexed': timeit(indexed(n), number=passes),
+                     'pairs': timeit(pairs(n), number=passes)})
+                for n in sizes)
@@ -0,0 +1,519 @@
+"""
+Combat simulator.
+
+This module runs fights between sample characters with the real combat
+rules in `world.rulebook` and reports the outcomes, to answer balance
+questions such as "how often does a Warrior beat a Scout with a hand
+axe, starting at reach?":
+
+    >>> from utils import simulator
+    >>> report = simulator.run_simulation(
+    ...     {'archetype': 'warrior', 'race': 'human', 'weapon': 'HAND_AXE'},
+    ...     {'archetype': 'scout', 'race': 'elf', 'weapon': 'HAND_AXE'},
+    ...     fights=10000, start_range='reach')
+    >>> report['win_rate']   # fractions of fights won by 'a', 'b' and drawn
+
+No server, database objects or sessions are involved. Characters,
+weapons and the combat handler are replaced by lightweight in-memory
+stand-ins that borrow their game logic (trait and equip handlers, turn
+hooks, range tracking) from the real typeclasses, and `utils.delay` and
+the time of the `COMBAT_CLOCK` are replaced by a virtual clock while a
+fight runs, so a fight takes only as long as its rules take to compute. The rule modules still import
+Evennia, so run the simulator from `evennia shell` or any other process
+where Evennia has been initialized.
+
+Fighters are described by dicts with the keys:
+
+    archetype (str): archetype name, as for `archetypes.apply_archetype`
+    race (str): race name
+    focus (str, optional): focus name; the race's first focus if omitted
+    weapon (str, optional): name of a weapon prototype in
+        `world.content.prototypes_weapons`; fights unarmed if omitted
+    allocation (dict, optional): points added to each primary trait,
+        as for `utils.utils.sample_traits`
+
+Each turn, both fighters close to or open up to their weapon's range
+and then attack. Ranged weapons never run out of ammunition.
+
+Fights are spread over a pool of worker processes. Each fight is
+seeded with its own number, so a report depends only on its arguments
+and not on the number of processes. Each process builds a fighter's
+traits once and copies them for every later fight with the same
+description.
+"""
+from collections import Counter, deque
+from contextlib import contextmanager
+from heapq import heappush, heappop
+from itertools import count
+import multiprocessing
+
+from evennia.utils import utils
+from typeclasses.characters import Character
+from typeclasses.combat_handler import CombatHandler, RangeBands
+from world.combat_clock import COMBAT_CLOCK
+from world.content import prototypes_weapons
+from world.rulebook import ACTIONS, ACTIONS_PER_TURN, resolve_combat
+from world.traits import _plain_copy
+from .utils import sample_traits
+
+
+class SimulatorException(Exception):
+    """Base exception class for the combat simulator."""
+    def __init__(self, msg):
+        self.msg = msg
+
+
+class VirtualClock(object):
+    """Stand-in for `utils.delay` that runs callbacks in simulated time.
+
+    While `installed()`, delayed calls are queued instead of being
+    scheduled on the reactor. `run()` then calls them in order of
+    their due time, advancing `now` to each call's due time.
+    """
+    def __init__(self):
+        self.now = 0.0
+        self._queue = []
+        self._seq = count()
+
+    def delay(self, timedelay, callback, *args, **kwargs):
+        """Queues `callback(*args, **kwargs)` to run `timedelay` from now."""
+        heappush(self._queue, (self.now + timedelay, next(self._seq),
+                               callback, args, kwargs))
+
+    def run(self):
+        """Runs queued calls, including ones they queue, until none are left."""
+        while self._queue:
+            self.now, _, callback, args, kwargs = heappop(self._queue)
+            callback(*args, **kwargs)
+
+    def clear(self):
+        """Discards all queued calls."""
+        self._queue = []
+
+    def time(self):
+        """Returns the simulated time."""
+        return self.now
+
+    @contextmanager
+    def installed(self):
+        """Context manager that replaces `utils.delay` with this clock.
+
+        The `COMBAT_CLOCK` also keeps this clock's time meanwhile; combat
+        actions it still holds on exit are discarded.
+        """
+        original, utils.delay = utils.delay, self.delay
+        timer, COMBAT_CLOCK.timer = COMBAT_CLOCK.timer, self.time
+        try:
+            yield self
+        finally:
+            utils.delay = original
+            COMBAT_CLOCK.clear()
+            COMBAT_CLOCK.timer = timer
+
+
+class _Attributes(object):
+    """Dict-backed stand-in for an `AttributeHandler`.
+
+    Args:
+        persistent (bool): if True, stored collections are copied as
+            they would be by the database, so later changes to the
+            originals are not seen through the attribute
+    """
+    def __init__(self, persistent=True):
+        self._data = {}
+        self._persistent = persistent
+
+    def has(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def add(self, key, value):
+        self._data[key] = _plain_copy(value) if self._persistent else value
+
+    def remove(self, key):
+        self._data.pop(key, None)
+
+
+class _Holder(object):
+    """Attribute-style access to an `_Attributes`, like `obj.db`."""
+    def __init__(self, attributes):
+        object.__setattr__(self, '_attributes', attributes)
+
+    def __getattr__(self, key):
+        return self._attributes.get(key)
+
+    def __setattr__(self, key, value):
+        self._attributes.add(key, value)
+
+    def __delattr__(self, key):
+        self._attributes.remove(key)
+
+
+class _SimObject(object):
+    """Base stand-in for a game object."""
+    _ids = count(1)
+
+    def __init__(self, key):
+        self.id = next(self._ids)
+        self.key = key
+        self.attributes = _Attributes()
+        self.db = _Holder(self.attributes)
+        self.nattributes = _Attributes(persistent=False)
+        self.ndb = _Holder(self.nattributes)
+
+    def __str__(self):
+        return self.key
+
+    def get_display_name(self, looker, **kwargs):
+        return self.key
+
+    def is_typeclass(self, typeclass, exact=False):
+        return True
+
+    def msg(self, *args, **kwargs):
+        pass
+
+    def move_to(self, destination, **kwargs):
+        return True
+
+
+class SimRoom(_SimObject):
+    """Stand-in for the room a fight takes place in."""
+    def msg_contents(self, *args, **kwargs):
+        pass
+
+
+class SimWeapon(_SimObject):
+    """Stand-in for a weapon, built from a weapon prototype.
+
+    Args:
+        prototype (dict): a prototype from `world.content.prototypes_weapons`
+    """
+    def __init__(self, prototype):
+        super(SimWeapon, self).__init__(prototype['key'])
+        self.typeclass = utils.class_from_module(prototype['typeclass'])
+        self.db.slots = self.typeclass.slots
+        self.db.multi_slot = self.typeclass.multi_slot
+        self.db.range = prototype.get('range', self.typeclass.range)
+        self.db.damage = prototype.get('damage', self.typeclass.damage)
+        self.db.ammunition = prototype.get('ammunition')
+        # combat messages are discarded
+        self.db.messages = dict.fromkeys(
+            ('dmg_hp', 'dmg_sp', 'dodged', 'missed'), '')
+
+    def at_equip(self, character):
+        self.typeclass.at_equip.__func__(self, character)
+
+    def at_remove(self, character):
+        self.typeclass.at_remove.__func__(self, character)
+
+    def get_ammunition_to_fire(self):
+        """Returns a new unit of ammunition for every shot."""
+        return _SimObject(self.db.ammunition or 'ammunition')
+
+
+# attribute data and weapon of each fighter built in this process;
+# weapons hold no per-fight state, so copies share them
+_BUILDS = {}
+
+
+def _spec_key(spec):
+    """Returns a hashable key for a fighter description."""
+    return tuple(sorted(
+        (key, tuple(sorted(value.items())) if hasattr(value, 'items')
+         else value)
+        for key, value in spec.items()))
+
+
+class SimCharacter(_SimObject):
+    """Stand-in for a player character.
+
+    Trait, skill and equip handlers and turn hooks are those of
+    `Character`.
+
+    Args:
+        spec (dict): fighter description; see module docstring
+        location (SimRoom): room the fight takes place in
+    """
+    traits = Character.__dict__['traits']
+    skills = Character.__dict__['skills']
+    equip = Character.__dict__['equip']
+    at_turn_start = Character.__dict__['at_turn_start']
+    at_turn_end = Character.__dict__['at_turn_end']
+
+    has_player = True
+
+    def __init__(self, spec, location):
+        super(SimCharacter, self).__init__(
+            '{archetype} {race}'.format(**spec))
+        self.location = location
+        key = _spec_key(spec)
+        if key in _BUILDS:
+            data, self.weapon = _BUILDS[key]
+            self.attributes._data = _plain_copy(data)
+        else:
+            self._build(spec)
+            _BUILDS[key] = (_plain_copy(self.attributes._data), self.weapon)
+
+    def _build(self, spec):
+        """Loads traits, skills and equipment described by `spec`."""
+        self.db.position = 'STANDING'
+        sample_traits(self, spec['archetype'], spec['race'],
+                      spec.get('focus'), spec.get('allocation'))
+        self.weapon = None
+        if spec.get('weapon'):
+            prototype = getattr(prototypes_weapons, spec['weapon'], None)
+            if not isinstance(prototype, dict):
+                raise SimulatorException(
+                    "Weapon prototype not found: {}".format(spec['weapon']))
+            self.weapon = SimWeapon(prototype)
+            self.equip.add(self.weapon)
+            self.weapon.at_equip(self)
+
+    def at_death(self):
+        pass
+
+
+class SimCombat(object):
+    """Stand-in for a `CombatHandler`.
+
+    Range tracking and action queueing are those of `CombatHandler`.
+    Turns are driven by `simulate_fight` rather than by a timer.
+
+    Args:
+        characters (list[SimCharacter]): the combatants
+        seed (int): seed of the combat's random streams
+        start_range (str): initial distance between all combatants
+    """
+    add_action = CombatHandler.__dict__['add_action']
+    get_range = CombatHandler.__dict__['get_range']
+    get_min_range = CombatHandler.__dict__['get_min_range']
+    get_proximity = CombatHandler.__dict__['get_proximity']
+    move_character = CombatHandler.__dict__['move_character']
+    set_range = CombatHandler.__dict__['set_range']
+    turn_rng = CombatHandler.__dict__['turn_rng']
+    hold_traits = CombatHandler.__dict__['hold_traits']
+    flush_traits = CombatHandler.__dict__['flush_traits']
+
+    def __init__(self, characters, seed, start_range='ranged'):
+        self.attributes = _Attributes(persistent=False)
+        self.db = _Holder(self.attributes)
+        self.ndb = _Holder(_Attributes(persistent=False))
+        self.bands = RangeBands()
+        self.ndb.characters = {}
+        self.ndb.turn_actions = {}
+        self.ndb.action_count = {}
+        self.db.rng_seed = seed
+        self.db.turn = 0
+        self.stopped = False
+        for character in characters:
+            self.bands.add(character.id, start_range)
+            self.ndb.characters[character.id] = character
+            self.ndb.action_count[character.id] = 0
+            self.ndb.turn_actions[character.id] = deque()
+            character.ndb.combat_handler = self
+
+    def remove_character(self, character):
+        dbref = character.id
+        if dbref in self.ndb.characters:
+            self.flush_traits(character)
+            del self.ndb.characters[dbref]
+            del self.ndb.turn_actions[dbref]
+            del self.ndb.action_count[dbref]
+            self.bands.remove(dbref)
+            del character.ndb.combat_handler
+        if len(self.ndb.characters) <= 1:
+            self.stop()
+
+    def stop(self):
+        self.stopped = True
+        COMBAT_CLOCK.cancel(self)
+        self.flush_traits()
+
+    def msg_all(self, message, exclude=()):
+        pass
+
+    def combat_msg(self, message, actor, target=None, exclude=(), **kwargs):
+        pass
+
+    def hold_messages(self):
+        pass
+
+    def flush_messages(self, character=None):
+        pass
+
+    def begin_turn(self):
+        """Resets action counts and starts each combatant's turn."""
+        if len(self.ndb.characters) < 2:
+            self.stop()
+            return
+        for character in self.ndb.characters.values():
+            self.ndb.action_count[character.id] = \
+                sum([x[3] for x in self.ndb.turn_actions[character.id]])
+            character.at_turn_start()
+
+    def end_turn(self):
+        """Resolves the turn's actions with the turn's random stream."""
+        for character in self.ndb.characters.values():
+            character.at_turn_end()
+        self.db.turn += 1
+        resolve_combat(self, self.turn_rng())
+
+
+# ranges at which each kind of weapon can attack, preferred first
+_WEAPON_RANGES = {'melee': ('melee',),
+                  'reach': ('reach', 'melee'),
+                  'ranged': ('ranged', 'reach')}
+
+
+def _plan_turn(character, target, handler):
+    """Returns the actions `character` takes against `target` this turn.
+
+    Fighters with a weapon advance or retreat into its range and then
+    attack; unarmed fighters close to melee and strike.
+    """
+    weapon = character.weapon
+    ranges = (_WEAPON_RANGES[weapon.db.range] if weapon
+              else ACTIONS['strike'].ranges)
+    attack = 'attack' if weapon else 'strike'
+    distance = handler.get_range(character, target)
+
+    actions = []
+    for _ in range(ACTIONS_PER_TURN):
+        if distance in ranges:
+            actions.append(attack)
+        elif distance == 'melee':
+            actions.append('retreat')
+            distance = 'ranged'
+        else:
+            actions.append('advance/reach' if ranges[0] == 'reach'
+                           else 'advance')
+            distance = ranges[0]
+    return actions
+
+
+def simulate_fight(spec_a, spec_b, seed=0, start_range='ranged',
+                   max_turns=50):
+    """Runs a single fight between two fighters.
+
+    Args:
+        spec_a (dict): description of fighter 'a'; see module docstring
+        spec_b (dict): description of fighter 'b'
+        seed (int): seed of the fight's random streams
+        start_range (str): initial distance between the fighters
+        max_turns (int): turns after which the fight is a draw
+
+    Returns:
+        (dict): the `winner` ('a', 'b' or None for a draw), the number
+            of `turns` fought, the simulated `time` in seconds, and
+            `hits`, a dict of the HP damage dealt by each hit of 'a'
+            and 'b'
+    """
+    clock = VirtualClock()
+    hits = {'a': [], 'b': []}
+
+    with clock.installed():
+        room = SimRoom('arena')
+        fighters = {'a': SimCharacter(spec_a, room),
+                    'b': SimCharacter(spec_b, room)}
+        for side, attacker in (('a', 'b'), ('b', 'a')):
+            def on_hp(key, old, new, dealt=hits[attacker]):
+                if new.current < old.current:
+                    dealt.append(old.current - new.current)
+            fighters[side].traits.subscribe(on_hp, ('HP',))
+
+        handler = SimCombat(fighters.values(), seed, start_range)
+        handler.begin_turn()
+        while not handler.stopped and handler.db.turn < max_turns:
+            for side, other in (('a', 'b'), ('b', 'a')):
+                for action in _plan_turn(fighters[side], fighters[other],
+                                         handler):
+                    handler.add_action(action, fighters[side],
+                                       fighters[other], 1)
+            handler.end_turn()
+            clock.run()
+        clock.clear()
+
+    alive = [side for side, char in fighters.items()
+             if char.id in handler.ndb.characters]
+    return {'winner': alive[0] if len(alive) == 1 else None,
+            'turns': handler.db.turn,
+            'time': clock.now,
+            'hits': hits}
+
+
+def _run_fights(args):
+    """Pool worker that runs the fights for a chunk of seeds."""
+    spec_a, spec_b, seeds, start_range, max_turns = args
+    return [simulate_fight(spec_a, spec_b, seed, start_range, max_turns)
+            for seed in seeds]
+
+
+def _summarize(values):
+    """Returns summary statistics of a list of numbers."""
+    if not values:
+        return {'count': 0, 'mean': 0.0, 'min': None, 'max': None,
+                'histogram': {}}
+    return {'count': len(values),
+            'mean': sum(values) / float(len(values)),
+            'min': min(values),
+            'max': max(values),
+            'histogram': dict(Counter(values))}
+
+
+def run_simulation(spec_a, spec_b, fights=1000, processes=None, seed=0,
+                   start_range='ranged', max_turns=50):
+    """Runs many fights between two fighters and reports the outcomes.
+
+    Args:
+        spec_a (dict): description of fighter 'a'; see module docstring
+        spec_b (dict): description of fighter 'b'
+        fights (int): number of fights to run
+        processes (int, optional): worker processes to use; one per CPU
+            if None. With 1, fights run in the calling process.
+        seed (int): seed of the first fight; fight `i` uses `seed + i`
+        start_range (str): initial distance between the fighters
+        max_turns (int): turns after which a fight is a draw
+
+    Returns:
+        (dict): report with the number of `fights`, the `win_rate` of
+            'a', 'b' and 'draw', summary statistics of the `turns`
+            per fight, and for each of 'a' and 'b' under `damage`,
+            statistics of the damage of each `hit` and the `total`
+            damage dealt per fight. Statistics are dicts of `count`,
+            `mean`, `min`, `max` and a `histogram` of value counts.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    seeds = range(seed, seed + fights)
+    size = max(1, fights // (processes * 4))
+    chunks = [(spec_a, spec_b, seeds[i:i + size], start_range, max_turns)
+              for i in range(0, fights, size)]
+
+    if processes == 1:
+        results = map(_run_fights, chunks)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_run_fights, chunks)
+        finally:
+            pool.close()
+            pool.join()
+    results = [result for chunk in results for result in chunk]
+
+    wins = Counter(result['winner'] for result in results)
+    total = float(len(results) or 1)
+    return {
+        'fights': len(results),
+        'win_rate': {'a': wins['a'] / total,
+                     'b': wins['b'] / total,
+                     'draw': wins[None] / total},
+        'turns': _summarize([result['turns'] for result in results]),
+        'damage': dict(
+            (side, {'hit': _summarize([hit for result in results
+                                       for hit in result['hits'][side]]),
+                    'total': _summarize([sum(result['hits'][side])
+                                         for result in results])})
+            for side in ('a', 'b')),
+    }
@@ -0,0 +1,115 @@
+"""
+Unit tests for the utils package.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+from django.test import TestCase
+from evennia.utils import utils
+from world.archetypes import PRIMARY_TRAITS, TOTAL_PRIMARY_POINTS
+from . import balance, simulator
+
+
+class SimulatorTestCase(TestCase):
+    """Test case for the headless combat simulator."""
+    def setUp(self):
+        self.warrior = {'archetype': 'warrior', 'race': 'dwarf',
+                        'weapon': 'BATTLE_AXE'}
+        self.scout = {'archetype': 'scout', 'race': 'human',
+                      'weapon': 'LONG_BOW'}
+
+    def test_virtual_clock(self):
+        """test delayed calls run in order of simulated time"""
+        calls = []
+        clock = simulator.VirtualClock()
+        original = utils.delay
+        with clock.installed():
+            utils.delay(2, calls.append, 'b')
+            utils.delay(1, calls.append, 'a')
+            utils.delay(2, utils.delay, 0.5, calls.append, 'c')
+            clock.run()
+        self.assertIs(utils.delay, original)
+        self.assertEqual(calls, ['a', 'b', 'c'])
+        self.assertEqual(clock.now, 2.5)
+
+    def test_simulate_fight(self):
+        """test fights are decided by the rulebook and reproducible"""
+        result = simulator.simulate_fight(self.warrior, self.scout, seed=3)
+        self.assertIn(result['winner'], ('a', 'b'))
+        self.assertGreater(result['turns'], 0)
+        self.assertGreater(result['time'], 0)
+        self.assertTrue(result['hits'][result['winner']])
+        self.assertEqual(
+            result, simulator.simulate_fight(self.warrior, self.scout, seed=3))
+        with self.assertRaises(simulator.SimulatorException):
+            simulator.simulate_fight(dict(self.warrior, weapon='SPORK'),
+                                     self.scout)
+
+    def test_run_simulation(self):
+        """test reports summarize all fights"""
+        report = simulator.run_simulation(self.warrior, self.scout,
+                                          fights=20, processes=1)
+        self.assertEqual(report['fights'], 20)
+        self.assertAlmostEqual(sum(report['win_rate'].values()), 1.0)
+        self.assertEqual(sum(report['turns']['histogram'].values()), 20)
+        for side in ('a', 'b'):
+            damage = report['damage'][side]
+            self.assertEqual(damage['total']['count'], 20)
+            self.assertEqual(sum(damage['hit']['histogram'].values()),
+                             damage['hit']['count'])
+
+
+class BalanceMatrixTestCase(TestCase):
+    """Test case for the balance matrix job."""
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'matrix.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_builds(self):
+        """test builds spend all of their archetype's points"""
+        builds = balance.all_builds()
+        self.assertEqual(len(builds), 6 * 9 * 3)
+        build = builds['Warrior-Scout/Elf/Alertness/martial']
+        self.assertEqual(build['archetype'], 'Warrior-Scout')
+        # Warrior-Scout primaries sum to 20; 10 points remain
+        self.assertEqual(sum(build['allocation'].values()),
+                         TOTAL_PRIMARY_POINTS - 20)
+        self.assertEqual(set(build['allocation']), set(PRIMARY_TRAITS))
+
+    def test_resume(self):
+        """test interrupted runs resume from the CSV checkpoint"""
+        builds = balance.all_builds(['even'])
+        builds = OrderedDict((key, builds[key]) for key in builds.keys()[:3])
+        result = balance.run_matrix(self.path, builds, fights=2, processes=1)
+        # builds do not fight themselves
+        self.assertEqual(result, {'run': 3, 'resumed': 0,
+                                  'json': os.path.join(self.dir,
+                                                       'matrix.json')})
+        # cut the last row short, as if the job had been interrupted
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:-10])
+        result = balance.run_matrix(self.path, builds, fights=2, processes=1)
+        self.assertEqual((result['run'], result['resumed']), (1, 2))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+        # rows for another number of fights are replaced, not duplicated
+        result = balance.run_matrix(self.path, builds, fights=3, processes=1)
+        self.assertEqual((result['run'], result['resumed']), (3, 0))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(len(f.readlines()), 4)
+
+        # rows of builds no longer matched up are left out of the matrix
+        del builds[builds.keys()[-1]]
+        result = balance.run_matrix(self.path, builds, fights=3, processes=1)
+        self.assertEqual((result['run'], result['resumed']), (0, 3))
+        with open(result['json'], 'rb') as f:
+            self.assertEqual(sorted(json.load(f)['win_rate']), sorted(builds))
@@ -1,8 +1,8 @@
 """
 Utility objects.
 """
-from evennia import TICKER_HANDLER as tickerhandler
 from world import archetypes, races, skills
+from world.regen import REGEN
 
 
 def sample_char(char, archetype, race, focus=None):
@@ -15,19 +15,32 @@ def sample_char(char, archetype, race, focus=None):
         focus Optional(str): focus to apply. if None, default is race's
             first item in foci collection
         """
+    sample_traits(char, archetype, race, focus)
+    REGEN.add(char)
+
+
+# points added to each primary trait by `sample_traits`
+SAMPLE_ALLOCATION = {'STR': 1, 'PER': 1, 'INT': 1, 'DEX': 1, 'CHA': 1,
+                     'VIT': 2, 'MAG': 2}
+
+
+def sample_traits(char, archetype, race, focus=None, allocation=None):
+    """Loads sample traits and skills onto any object with trait handlers.
+
+    Like `sample_char`, but does not register the object with
+    `world.regen`, so that it can be used on stand-in objects.
+
+    Args:
+        allocation (dict, optional): points added to the base of each
+            primary trait; `SAMPLE_ALLOCATION` if None
+    """
     archetypes.apply_archetype(char, archetype, reset=True)
-    char.traits.STR.base += 1
-    char.traits.PER.base += 1
-    char.traits.INT.base += 1
-    char.traits.DEX.base += 1
-    char.traits.CHA.base += 1
-    char.traits.VIT.base += 2
-    char.traits.MAG.base += 2
+    for trait, points in (allocation or SAMPLE_ALLOCATION).items():
+        char.traits[trait].base += points
     focus = focus or races.load_race(race).foci[0]
     races.apply_race(char, race, focus)
     archetypes.calculate_secondary_traits(char.traits)
     archetypes.finalize_traits(char.traits)
-    tickerhandler.add(interval=6, callback=char.at_turn_start)
     skills.apply_skills(char)
     skills.finalize_skills(char.skills)
 
@@ -36,6 +36,11 @@ Module Functions:
         Called to set initial base values for secondary traits and save
         rolls.
 
+    - `register_derived_traits(traits)`
+
+        Declares the secondary traits that follow their primary traits
+        after chargen, so that later primary changes propagate.
+
     - `finalize_traits(traits)`
 
         Called at the end of chargen to apply modifiers to base values and
@@ -70,6 +75,21 @@ ALL_TRAITS = (PRIMARY_TRAITS + SECONDARY_TRAITS +
 
 TOTAL_PRIMARY_POINTS = 30
 
+# traits kept in step with their primaries after chargen:
+#   key: (field, formula, dependencies)
+# SP and save rolls fold archetype and focus modifiers into their base
+# in `finalize_traits`, so they are not derived.
+DERIVED_TRAITS = {
+    'HP': ('base', lambda tr: tr.VIT.actual, ('VIT',)),
+    'ATKM': ('base', lambda tr: tr.STR.actual, ('STR',)),
+    'ATKR': ('base', lambda tr: tr.PER.actual, ('PER',)),
+    'ATKU': ('base', lambda tr: tr.DEX.actual, ('DEX',)),
+    'DEF': ('base', lambda tr: tr.DEX.actual, ('DEX',)),
+    'ENC': ('max', lambda tr: (tr.STR.lift_factor * tr.STR.actual
+                               if 'lift_factor' in tr.STR.extra else None),
+            ('STR',)),
+}
+
 def apply_archetype(char, name, reset=False):
     """Set a character's archetype and initialize traits.
 
@@ -166,6 +186,16 @@ def calculate_secondary_traits(traits):
     traits.ENC.max = traits.STR.lift_factor * traits.STR.actual
 
 
+def register_derived_traits(traits):
+    """Declares `DERIVED_TRAITS` on a TraitHandler.
+
+    Args:
+        traits (TraitHandler): handler to receive the definitions
+    """
+    for key, (field, formula, depends) in DERIVED_TRAITS.items():
+        traits.derive(key, formula, depends, field=field)
+
+
 def finalize_traits(traits):
     """Applies all pending modifications to starting traits.
 
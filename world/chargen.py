@@ -5,11 +5,12 @@ The menu node functions defined in this module make up
 the Ainneve character creation process, which is based
 on a subset of Open Adventure rules.
 """
-from evennia import spawn, TICKER_HANDLER as tickerhandler
+from evennia import spawn
 from evennia.utils import fill, dedent
 from evennia.utils.evtable import EvTable
 
 from world import archetypes, races, skills
+from world.regen import REGEN
 from world.rulebook import d_roll
 from world.economy import format_coin as as_price
 from world.economy import transfer_funds, InsufficientFunds
@@ -273,7 +274,7 @@ def menunode_allocate_mana(caller, raw_string):
 
         archetypes.calculate_secondary_traits(char.traits)
         archetypes.finalize_traits(char.traits)
-        tickerhandler.add(interval=6, callback=char.at_turn_start)
+        REGEN.add(char)
         skills.apply_skills(char)
         return menunode_allocate_skills(caller, output)
 
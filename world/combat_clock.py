@@ -0,0 +1,193 @@
+"""
+Combat clock.
+
+Combat actions are not each scheduled on the reactor. Instead, the
+rulebook schedules them with the global `COMBAT_CLOCK`, which keeps
+the pending actions of every active `CombatHandler` on a hashed timer
+wheel:
+
+    ```python
+    >>> from world.combat_clock import COMBAT_CLOCK
+    >>> COMBAT_CLOCK.schedule(2, handler, process_next_action, handler)
+    >>> COMBAT_CLOCK.cancel(handler)   # when the handler stops
+    ```
+
+The wheel is divided into `WHEEL_SLOTS` slots of `TICK` seconds each;
+an action due at tick `t` is kept in slot `t % WHEEL_SLOTS`, so
+scheduling costs O(1). Only one reactor timer is armed at a time, for
+the next tick with a due action. When it fires, every action due by
+then is run in one batch, in the order it was scheduled, so many
+simultaneous fights share a single timer.
+
+Actions are never run early, and run at most one tick late; the lag of
+each batch behind its due time is recorded, and `COMBAT_CLOCK.stats`
+reports it together with the queue depth.
+"""
+from collections import deque
+from itertools import count
+from math import ceil
+from time import time
+from evennia.utils import logger, utils
+
+# seconds per tick of the wheel
+TICK = 0.1
+# slots of the wheel; one revolution takes TICK * WHEEL_SLOTS seconds
+WHEEL_SLOTS = 512
+
+
+class CombatClock(object):
+    """Hashed timer wheel running scheduled combat actions.
+
+    Args:
+        tick (float): seconds per tick
+        slots (int): number of slots of the wheel
+        timer (callable): returns the current time in seconds
+    """
+    def __init__(self, tick=TICK, slots=WHEEL_SLOTS, timer=time):
+        self.tick = tick
+        self.timer = timer
+        self.wheel = [[] for _ in range(slots)]
+        # handler: number of pending actions
+        self._handlers = {}
+        self._pending = 0
+        self._seq = count()
+        # next tick to process; None while the wheel is empty
+        self._cursor = None
+        self._timer = None
+        self._timer_tick = None
+        self._recent = deque(maxlen=100)
+        self._totals = {'batches': 0, 'actions': 0, 'max_batch': 0}
+
+    def __len__(self):
+        """Return number of pending actions."""
+        return self._pending
+
+    def __contains__(self, handler):
+        return handler in self._handlers
+
+    def schedule(self, delay, handler, callback, *args):
+        """Schedules `callback(*args)` to run `delay` seconds from now.
+
+        Args:
+            delay (float): seconds to wait, rounded up to whole ticks
+            handler (CombatHandler): the combat the action belongs to
+            callback (callable): the action
+        """
+        now = self.timer()
+        if self._cursor is None:
+            self._cursor = int(now / self.tick)
+        due = max(int(ceil((now + delay) / self.tick)), self._cursor)
+        self.wheel[due % len(self.wheel)].append(
+            (due, next(self._seq), handler, callback, args))
+        self._handlers[handler] = self._handlers.get(handler, 0) + 1
+        self._pending += 1
+        if self._timer_tick is None or due < self._timer_tick:
+            self._arm(due)
+
+    def cancel(self, handler):
+        """Discards all pending actions of a combat.
+
+        Returns:
+            (int): number of actions discarded
+        """
+        removed = self._handlers.pop(handler, 0)
+        if removed:
+            for index, slot in enumerate(self.wheel):
+                if slot:
+                    self.wheel[index] = [e for e in slot
+                                         if e[2] is not handler]
+            self._pending -= removed
+            if not self._pending:
+                self.clear()
+        return removed
+
+    def clear(self):
+        """Discards all pending actions and disarms the reactor timer."""
+        self._disarm()
+        self.wheel = [[] for _ in self.wheel]
+        self._handlers = {}
+        self._pending = 0
+        self._cursor = None
+
+    @property
+    def stats(self):
+        """Queue depth and lag statistics.
+
+        Returns:
+            (dict): number of `pending` actions and of `handlers` they
+                belong to, totals of `batches` and `actions` run and the
+                largest batch (`max_batch`), and the `lag` in seconds of
+                each of the last 100 batches behind its due time
+        """
+        return dict(self._totals, pending=self._pending,
+                    handlers=len(self._handlers), lag=list(self._recent))
+
+    def _disarm(self):
+        """Cancels the reactor timer, if it is armed."""
+        timer = self._timer
+        if timer is not None and hasattr(timer, 'active') and timer.active():
+            timer.cancel()
+        self._timer = self._timer_tick = None
+
+    def _arm(self, due):
+        """(Re)arms the reactor timer for tick `due`."""
+        self._disarm()
+        self._timer_tick = due
+        timer = utils.delay(max(0, due * self.tick - self.timer()),
+                            self._fire, due)
+        if self._timer_tick == due:
+            # not already fired by a delay that calls back immediately
+            self._timer = timer
+
+    def _next_due(self):
+        """Returns the earliest tick with a pending action."""
+        slots = len(self.wheel)
+        for due in range(self._cursor, self._cursor + slots):
+            if any(e[0] == due for e in self.wheel[due % slots]):
+                return due
+        # all pending actions are more than one revolution away
+        return min(e[0] for slot in self.wheel for e in slot)
+
+    def _fire(self, due):
+        """Timer callback; runs every action due by now, in one batch."""
+        if due != self._timer_tick:
+            # superseded by an earlier tick
+            return
+        self._timer = self._timer_tick = None
+        now = self.timer()
+        last = max(due, int(now / self.tick))
+        slots = len(self.wheel)
+
+        batch = []
+        for tick in range(self._cursor, min(last + 1, self._cursor + slots)):
+            slot = self.wheel[tick % slots]
+            if slot:
+                batch.extend(e for e in slot if e[0] <= last)
+                self.wheel[tick % slots] = [e for e in slot if e[0] > last]
+        batch.sort()
+        # actions scheduled by this batch are due from the next tick on
+        self._cursor = last + 1
+        for entry in batch:
+            handler = entry[2]
+            self._handlers[handler] -= 1
+            if not self._handlers[handler]:
+                del self._handlers[handler]
+        self._pending -= len(batch)
+
+        self._totals['batches'] += 1
+        self._totals['actions'] += len(batch)
+        self._totals['max_batch'] = max(self._totals['max_batch'], len(batch))
+        self._recent.append(now - due * self.tick)
+
+        if self._pending:
+            self._arm(self._next_due())
+        else:
+            self._cursor = None
+        for _, _, _, callback, args in batch:
+            try:
+                callback(*args)
+            except Exception:
+                logger.log_trace()
+
+
+COMBAT_CLOCK = CombatClock()
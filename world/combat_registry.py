@@ -0,0 +1,173 @@
+"""
+Combat registry.
+
+Every active `CombatHandler` is registered with the global `COMBATS`
+registry, which hands out combat ids and indexes fights by id, by room
+and by participant:
+
+    ```python
+    >>> from world.combat_registry import COMBATS
+    >>> COMBATS.get(12)                # the fight with combat id 12
+    >>> COMBATS.by_participant(char)   # the fight `char` is in, or None
+    >>> COMBATS.in_room(room)          # fights with a participant in `room`
+    >>> COMBATS.in_zone('harbor')      # fights in rooms of a zone
+    ```
+
+A zone is a tag in the `ZONE_CATEGORY` category on a room. A room's
+zones are read when the first fight in it is registered. Characters
+report moves with `COMBATS.moved(char)`, which keeps the room index
+current.
+
+Combat ids come from a counter saved in `ServerConfig`, so they are
+never reused. Handlers are tagged, so `COMBATS.start()` rebuilds the
+registry with a tag lookup when the server starts rather than by
+scanning the script table.
+"""
+from evennia.utils import make_iter
+
+COMBAT_TAG = ('combat', 'ainneve')
+ZONE_CATEGORY = 'zone'
+
+# ServerConfig key of the last combat id handed out
+_LAST_ID = 'combat_last_id'
+
+
+class CombatRegistry(object):
+    """Index of active combats."""
+    def __init__(self):
+        # combat id: CombatHandler
+        self._combats = {}
+        # combat id: set of participant ids
+        self._members = {}
+        # character id: (combat id, room id)
+        self._participants = {}
+        # room id: {combat id: number of participants in the room}
+        self._rooms = {}
+        # room id: zones of the room
+        self._zones = {}
+
+    def __len__(self):
+        return len(self._combats)
+
+    def __contains__(self, handler):
+        return handler.db.combat_id in self._combats
+
+    def start(self):
+        """Rebuilds the registry from tagged combat handlers."""
+        from evennia.utils.search import search_script_tag
+        for handler in search_script_tag(*COMBAT_TAG):
+            self.add(handler)
+
+    def next_id(self):
+        """Returns a new combat id."""
+        from evennia.server.models import ServerConfig
+        last = max([ServerConfig.objects.conf(_LAST_ID, default=0) or 0] +
+                   self._combats.keys())
+        ServerConfig.objects.conf(_LAST_ID, last + 1)
+        return last + 1
+
+    def add(self, handler):
+        """Registers a combat handler and its participants.
+
+        Participants are read from the handler's checkpoint if its live
+        state has not been restored yet.
+        """
+        cid = handler.db.combat_id
+        if cid is None:
+            # handler created before the registry
+            cid = handler.db.combat_id = self.next_id()
+        handler.tags.add(*COMBAT_TAG)
+        self._combats[cid] = handler
+        self._members.setdefault(cid, set())
+
+        characters = handler.ndb.characters
+        if characters is None:
+            characters = (handler.db.state or {}).get('characters') or {}
+        for character in characters.values():
+            self.join(handler, character)
+
+    def remove(self, handler):
+        """Unregisters a combat handler and its participants."""
+        cid = handler.db.combat_id
+        for dbref in list(self._members.pop(cid, ())):
+            self._leave(dbref)
+        self._combats.pop(cid, None)
+
+    def join(self, handler, character):
+        """Records `character` as a participant of `handler`'s combat."""
+        cid = handler.db.combat_id
+        if cid not in self._combats:
+            return
+        self._leave(character.id)
+        room = character.location
+        rid = room.id if room else None
+        self._participants[character.id] = (cid, rid)
+        self._members[cid].add(character.id)
+        counts = self._rooms.setdefault(rid, {})
+        counts[cid] = counts.get(cid, 0) + 1
+        if rid not in self._zones:
+            self._zones[rid] = frozenset(
+                zone for zone in make_iter(
+                    room.tags.get(category=ZONE_CATEGORY) if room else None)
+                if zone)
+
+    def moved(self, character):
+        """Updates the room of participant `character` after it moved."""
+        entry = self._participants.get(character.id)
+        if entry is None:
+            return
+        room = character.location
+        if (room.id if room else None) != entry[1]:
+            self.join(self._combats[entry[0]], character)
+
+    def leave(self, character):
+        """Removes `character` from the combat it participates in."""
+        self._leave(character.id)
+
+    def get(self, combat_id):
+        """Returns the combat handler with `combat_id`, or None."""
+        return self._combats.get(combat_id)
+
+    def all(self):
+        """Returns all registered combat handlers, oldest first."""
+        return [self._combats[cid] for cid in sorted(self._combats)]
+
+    def by_participant(self, character):
+        """Returns the combat handler `character` is in, or None."""
+        entry = self._participants.get(character.id)
+        return self._combats.get(entry[0]) if entry else None
+
+    def in_room(self, room):
+        """Returns the combat handlers with a participant in `room`."""
+        counts = self._rooms.get(room.id, ())
+        return [self._combats[cid] for cid in sorted(counts)]
+
+    def in_zone(self, zone):
+        """Returns the combat handlers with a participant in `zone`.
+
+        Args:
+            zone (str): a room tag in the `ZONE_CATEGORY` category
+        """
+        cids = set()
+        for rid, counts in self._rooms.items():
+            if zone in self._zones.get(rid, ()):
+                cids.update(counts)
+        return [self._combats[cid] for cid in sorted(cids)]
+
+    def _leave(self, dbref):
+        """Removes the participant with id `dbref` from the indexes."""
+        entry = self._participants.pop(dbref, None)
+        if entry is None:
+            return
+        cid, rid = entry
+        self._members.get(cid, set()).discard(dbref)
+        counts = self._rooms[rid]
+        counts[cid] -= 1
+        if not counts[cid]:
+            del counts[cid]
+        if not counts:
+            del self._rooms[rid]
+            self._zones.pop(rid, None)
+
+
+COMBATS = CombatRegistry()
@@ -5,7 +5,11 @@ from math import floor
 from evennia import CmdSet, Command
 from evennia.utils import delay
 from typeclasses.scripts import Script
-from world.rulebook import d_roll
+from world.rulebook import compile_roll
+
+# delays before an NPC's body is removed and before it revives
+_STORAGE_DELAY = compile_roll('1d6')
+_REVIVE_DELAY = compile_roll('1d12')
 
 
 # Scripts
@@ -115,7 +119,7 @@ class NPCDeathHandler(DeathHandler):
                                        exclude=self.obj)
 
         self.obj.db.pose = self.obj.db.pose_death
-        delay(10 * d_roll('1d6'),
+        delay(10 * _STORAGE_DELAY.roll(),
               getattr(self, self.db.death_sequence[self.db.death_step]))
 
     def storage(self):
@@ -126,7 +130,7 @@ class NPCDeathHandler(DeathHandler):
         limbo = self.obj.search('Limbo', global_search=True)
         self.obj.move_to(limbo, quiet=True, move_hooks=False)
         self.db.death_step += 1
-        delay(10 * d_roll('1d12') + 30,
+        delay(10 * _REVIVE_DELAY.roll() + 30,
               getattr(self, self.db.death_sequence[self.db.death_step]))
 
     def revive(self):
@@ -0,0 +1,112 @@
+"""
+Prompt cache.
+
+Combat messages carry a prompt showing the character's HP, WM, BM and
+SP, and leaving combat clears it with an idle prompt. Rather than
+formatting and sending the prompt with every message, messages are sent
+through the global `PROMPTS` cache:
+
+    ```python
+    >>> from world.prompts import PROMPTS
+    >>> PROMPTS.send(char, "Char2 swings at you.")   # with a combat prompt
+    >>> PROMPTS.send(char, idle=True)                # when leaving combat
+    ```
+
+The cache remembers the values last shown in the prompt of each session
+and only sends a prompt when they differ, so repeated messages in a
+crowded fight do not each resend an unchanged prompt. Sessions that
+reconnect start with an empty cache. Characters without sessions, such
+as NPCs, are sent no prompt at all.
+
+`PROMPTS.stats` reports how many prompts were sent and suppressed, and
+how many characters of prompt text the suppressed prompts would have
+taken.
+"""
+from weakref import WeakKeyDictionary
+
+COMBAT_PROMPT = ("|M[|n HP: |g{tr.HP.actual}|n "
+                 "|| WM: |w{tr.WM.actual}|n "
+                 "|| BM: |x{tr.BM.actual}|n "
+                 "|| SP: |y{tr.SP.actual}|n |M]|n")
+PROMPT_TRAITS = ('HP', 'WM', 'BM', 'SP')
+# prompt shown out of combat
+IDLE_PROMPT = ' '
+
+
+class PromptCache(object):
+    """Last prompt shown to each session.
+
+    Args:
+        template (str): combat prompt, formatted with a trait snapshot
+            as `tr`
+        keys (tuple[str]): traits shown in the combat prompt
+    """
+    def __init__(self, template=COMBAT_PROMPT, keys=PROMPT_TRAITS):
+        self.template = template
+        self.keys = keys
+        # session: (values, prompt) last sent
+        self._shown = WeakKeyDictionary()
+        self._totals = {'sent': 0, 'suppressed': 0, 'saved': 0}
+
+    def render(self, character, idle=False):
+        """Returns the prompt to send to `character`.
+
+        Args:
+            character (Character): the recipient
+            idle (bool): if True, the out of combat prompt is wanted
+
+        Returns:
+            (str): the prompt, or None if `character` has no sessions or
+                every session already shows it
+        """
+        sessions = list(character.sessions.all())
+        if not sessions:
+            return None
+        if idle:
+            snap, values = None, None
+        else:
+            snap = character.traits.snapshot(self.keys)
+            values = tuple(getattr(snap, key).actual for key in self.keys)
+
+        shown = [self._shown.get(session) for session in sessions]
+        if all(s is not None and s[0] == values for s in shown):
+            self._totals['suppressed'] += 1
+            self._totals['saved'] += len(shown[0][1]) * len(sessions)
+            return None
+
+        prompt = IDLE_PROMPT if idle else self.template.format(tr=snap)
+        for session in sessions:
+            self._shown[session] = (values, prompt)
+        self._totals['sent'] += 1
+        return prompt
+
+    def send(self, character, text=None, idle=False):
+        """Sends `text` to `character` with a prompt, if it changed.
+
+        Args:
+            character (Character): the recipient
+            text (str, optional): message sent with the prompt
+            idle (bool): if True, send the out of combat prompt
+        """
+        prompt = self.render(character, idle)
+        if prompt is not None:
+            if text is None:
+                character.msg(prompt=prompt)
+            else:
+                character.msg(text, prompt=prompt)
+        elif text is not None:
+            character.msg(text)
+
+    @property
+    def stats(self):
+        """Prompt statistics.
+
+        Returns:
+            (dict): numbers of prompts `sent` and `suppressed`, the
+                characters of prompt text not sent (`saved`), and the
+                number of `sessions` with a cached prompt
+        """
+        return dict(self._totals, sessions=len(self._shown))
+
+
+PROMPTS = PromptCache()
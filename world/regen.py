@@ -0,0 +1,161 @@
+"""
+Regeneration module.
+
+Out of combat, each character's per-turn traits are refilled once per
+`REGEN_INTERVAL` seconds, as if a combat turn had started. Rather than
+registering a ticker per character, characters are registered with the
+global `REGEN` service:
+
+    ```python
+    >>> from world.regen import REGEN
+    >>> REGEN.add(char)     # after chargen or when leaving combat
+    >>> REGEN.remove(char)  # when entering combat
+    ```
+
+The registry is divided into `REGEN_SLICES` slices that are processed
+one per tick of a single shared ticker, so the work is spread evenly
+across the interval instead of arriving all at once. Characters whose
+traits are already full are skipped, and each pass writes every
+touched character's traits at most once.
+
+Registration is recorded as a tag on the character so the registry
+can be rebuilt by `REGEN.start()` when the server starts.
+"""
+from collections import deque
+from evennia import TICKER_HANDLER as tickerhandler
+from evennia.utils import logger
+from world.traits import batch_traits
+
+# seconds between regeneration passes for any one character
+REGEN_INTERVAL = 6
+# number of slices the registry is spread over within an interval
+REGEN_SLICES = 6
+
+REGEN_TAG = ('regen', 'ainneve')
+
+# gauges refilled each pass; Power Points are reset each pass
+_GAUGES = ('MV', 'BM', 'WM')
+
+
+def _needs_regen(char):
+    """Returns True if regenerating would change `char`'s traits."""
+    tr = char.traits
+    traits = [tr.get(key) for key in _GAUGES + ('PP',)]
+    if None in traits:
+        # traits not yet loaded by chargen
+        return False
+    pp = traits.pop()
+    return (pp.current != pp.base or
+            any(t.current < t.max and t.max > 0 for t in traits))
+
+
+def _regen_tick():
+    """Ticker callback that runs the next `REGEN` pass."""
+    REGEN.tick()
+
+
+class RegenService(object):
+    """Registry of characters regenerating out of combat.
+
+    Args:
+        interval (int): seconds between passes for any one character
+        slices (int): number of passes the registry is spread over
+    """
+    def __init__(self, interval=REGEN_INTERVAL, slices=REGEN_SLICES):
+        self.interval = interval
+        self.slices = [set() for _ in range(slices)]
+        self._slice_of = {}
+        self._next = 0
+        self._started = False
+        self._recent = deque(maxlen=100)
+        self._totals = {'passes': 0, 'touched': 0, 'skipped': 0}
+
+    def __len__(self):
+        return len(self._slice_of)
+
+    def __contains__(self, char):
+        return char.id in self._slice_of
+
+    def start(self):
+        """Starts the shared ticker and rebuilds the registry from tags."""
+        from evennia.utils.search import search_tag
+        for char in search_tag(*REGEN_TAG):
+            self._register(char)
+        self._start_ticker()
+
+    def add(self, char):
+        """Registers a character for regeneration."""
+        char.tags.add(*REGEN_TAG)
+        self._register(char)
+        self._start_ticker()
+
+    def remove(self, char):
+        """Unregisters a character, e.g. when it enters combat."""
+        char.tags.remove(*REGEN_TAG)
+        index = self._slice_of.pop(char.id, None)
+        if index is not None:
+            self.slices[index] = set(
+                c for c in self.slices[index] if c.id != char.id)
+
+    def tick(self):
+        """Processes the next slice of the registry.
+
+        Returns:
+            (int): number of characters touched
+        """
+        index = self._next
+        self._next = (index + 1) % len(self.slices)
+
+        chars = []
+        for char in list(self.slices[index]):
+            if char.pk:
+                chars.append(char)
+            else:
+                # character was deleted
+                self.slices[index].discard(char)
+                self._slice_of.pop(char.id, None)
+        touched = [c for c in chars if _needs_regen(c)]
+        with batch_traits(*touched):
+            for char in touched:
+                try:
+                    char.at_turn_start()
+                except Exception:
+                    logger.log_trace()
+
+        self._totals['passes'] += 1
+        self._totals['touched'] += len(touched)
+        self._totals['skipped'] += len(chars) - len(touched)
+        self._recent.append(len(touched))
+        return len(touched)
+
+    @property
+    def stats(self):
+        """Pass statistics.
+
+        Returns:
+            (dict): totals of `passes` run and characters `touched` and
+                `skipped`, the number `registered`, and `recent`, the
+                number touched by each of the last 100 passes
+        """
+        return dict(self._totals, registered=len(self),
+                    recent=list(self._recent))
+
+    def _register(self, char):
+        """Adds a character to the least loaded slice."""
+        if char.id in self._slice_of:
+            return
+        index = min(range(len(self.slices)),
+                    key=lambda i: len(self.slices[i]))
+        self.slices[index].add(char)
+        self._slice_of[char.id] = index
+
+    def _start_ticker(self):
+        """Registers the shared ticker once per server process."""
+        if not self._started:
+            self._started = True
+            tickerhandler.add(
+                interval=max(1, self.interval // len(self.slices)),
+                callback=_regen_tick, idstring='regen', persistent=False)
+
+
+REGEN = RegenService()
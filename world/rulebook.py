@@ -7,16 +7,32 @@ enforcing various game rules. See individual docstrings for more info.
 
 Roll / Check Functions
 
+    - `compile_roll(expr)`
     - `roll_max(xdyz)`
     - `d_roll(xdyz)`
     - `std_roll()`
     - `skill_check(skill, target=5)`
+    - `d_roll_many(xdyz, n)`
+    - `std_roll_many(n)`
+    - `skill_check_many(skills, target=5)`
+
+Probability Functions
+
+    - `roll_distribution(xdyz)`
+    - `skill_check_probability(skill, target=5, disadvantage=False)`
+    - `hit_probability(attack, defense, disadvantage=False)`
+    - `expected_damage(attack, defense, disadvantage=False)`
+
+    `STD_ROLL_TABLE` and `STD_ROLL_MIN2_TABLE` hold the exact
+    distributions of a standard roll and of the worse of two.
 
 Rule System Functions
 
     - `resolve_combat`
     - `resolve_death`
     - `process_next_action`
+    - `combat_action`
+    - `parse_action`
     - `_do_*`
 
     This group of functions, along with the `CombatHandler` script class,
@@ -25,22 +41,36 @@ Rule System Functions
     to determine turn order, and makes the first call to `process_next_action`.
 
     Using the determined turn order, `process_next_action` selects the appropriate
-    `_do_*` function to carry out the next action, executes it, and sets a
-    delayed call back to itself to handle the next action. After all actions
+    `_do_*` function to carry out the next action, executes it, and schedules
+    a call back to itself on the shared `COMBAT_CLOCK` to handle the next
+    action. After all actions
     are processed for a turn, control is returned to the `CombatHandler` to
     get input for the next turn.
+
+    `_do_*` functions are registered in `ACTIONS` with the `combat_action`
+    decorator, which other modules can also use to add new actions.
 """
 
 import re
 import random
 from math import floor
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from evennia.utils import utils, make_iter
+from world.combat_clock import COMBAT_CLOCK
+from world.traits import batch_traits
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 COMBAT_DELAY = 2
 ACTIONS_PER_TURN = 2
 
+# `DiceTelemetry` recording roll results; set by `world.telemetry.enable`
+TELEMETRY = None
+
 COMBAT_DISTANCES = utils.variable_from_module('typeclasses.combat_handler', 'COMBAT_DISTANCES')
 WRESTLING_POSITIONS = utils.variable_from_module('typeclasses.combat_handler', 'WRESTLING_POSITIONS')
 
@@ -55,6 +85,310 @@ class DiceRollError(Exception):
         self.msg = msg
 
 
+class CombatActionError(Exception):
+    """Error class for unknown combat actions.
+
+    Args:
+        msg (str): a descriptive error message
+    """
+    def __init__(self, msg):
+        self.msg = msg
+
+
+# dice term within an expression: [+-](XdY[kN|khN|klN] | Z)
+_TERM_RE = re.compile(r'\s*([+-]?)\s*(?:(\d*)d(\d+)(?:(k[hl]?)(\d+))?|(\d+))\s*')
+# legacy drop-lowest suffix of XdY[+-Z]-DL expressions
+_DROP_RE = re.compile(r'^(.*\d)-(\d*)L$')
+
+_ROLL_CACHE = OrderedDict()
+_ROLL_CACHE_SIZE = 128
+# batches smaller than this are rolled without NumPy
+_NUMPY_MIN_BATCH = 64
+
+
+class DiceRoll(object):
+    """A compiled dice expression; see `compile_roll`.
+
+    Args:
+        expr (str): the source expression
+        dice (tuple): `(sign, num, die, keep, highest)` tuples, one per
+            dice term, where `keep` of the `num` dice are totalled,
+            taking the highest dice if `highest` is True
+        bonus (int): total of the constant terms
+    """
+    __slots__ = ('expr', 'dice', 'bonus', '_distribution')
+
+    def __init__(self, expr, dice, bonus):
+        self.expr = expr
+        self.dice = dice
+        self.bonus = bonus
+        self._distribution = None
+
+    def __repr__(self):
+        return "DiceRoll({!r})".format(self.expr)
+
+    def roll(self, total=True, rng=None):
+        """Rolls the expression.
+
+        Args:
+            total (bool): if True, return a single value; if False,
+                return a list of the individual die values kept
+            rng (random.Random, optional): random stream to roll with;
+                the global `random` module if None
+
+        Returns:
+            (int or list[int]): total or list of die values
+        """
+        if not total and self.bonus > 0:
+            raise DiceRollError(
+                'Invalid arguments. `+-Z` not allowed when total is False.')
+        randint = (rng or random).randint
+        result = self.bonus
+        kept = []
+        for sign, num, die, keep, highest in self.dice:
+            rolls = [randint(1, die) for _ in range(num)]
+            if keep < num:
+                rolls = sorted(rolls, reverse=highest)[:keep]
+            if total:
+                result += sign * sum(rolls)
+            else:
+                kept.extend(rolls)
+        return result if total else kept
+
+    def roll_many(self, n, rng=None):
+        """Rolls the expression `n` times.
+
+        Dice for all `n` rolls are drawn in bulk, using NumPy if it is
+        installed and no `rng` is given; see `_roll_faces`.
+
+        Returns:
+            (list[int]): `n` totals
+        """
+        totals = [self.bonus] * n
+        for sign, num, die, keep, highest in self.dice:
+            faces = _roll_faces(die, n * num, rng)
+            if numpy is not None and isinstance(faces, numpy.ndarray):
+                faces = faces.reshape(n, num)
+                if keep < num:
+                    faces = numpy.sort(faces, axis=1)
+                    faces = faces[:, num - keep:] if highest else faces[:, :keep]
+                totals = numpy.add(totals, sign * faces.sum(axis=1))
+                continue
+            for i in range(n):
+                rolls = faces[i * num:(i + 1) * num]
+                if keep < num:
+                    rolls = sorted(rolls, reverse=highest)[:keep]
+                totals[i] += sign * sum(rolls)
+        return totals.tolist() if hasattr(totals, 'tolist') else totals
+
+    def max(self):
+        """Returns the maximum possible total."""
+        return self.bonus + sum(keep * die if sign > 0 else -keep
+                                for sign, _, die, keep, _ in self.dice)
+
+    def min(self):
+        """Returns the minimum possible total."""
+        return self.bonus + sum(keep if sign > 0 else -keep * die
+                                for sign, _, die, keep, _ in self.dice)
+
+    def mean(self):
+        """Returns the expected total as a float."""
+        return self.bonus + sum(sign * _mean_kept(num, die, keep, highest)
+                                for sign, num, die, keep, highest
+                                in self.dice)
+
+    def distribution(self):
+        """Returns the exact probability of each possible total.
+
+        The table is calculated once per compiled expression.
+
+        Returns:
+            (dict): total to probability mapping
+        """
+        if self._distribution is None:
+            dist = {self.bonus: 1.0}
+            for sign, num, die, keep, highest in self.dice:
+                term = _kept_distribution(num, die, keep, highest)
+                combined = defaultdict(float)
+                for total, p in dist.iteritems():
+                    for value, q in term.iteritems():
+                        combined[total + sign * value] += p * q
+                dist = combined
+            self._distribution = dict(dist)
+        return self._distribution
+
+
+def _roll_faces(die, count, rng=None):
+    """Rolls `count` dice with `die` faces.
+
+    Returns a NumPy array for large batches when NumPy is available
+    and no `rng` stream is given.
+    Otherwise the faces are cut from 64-bit chunks of
+    `random.getrandbits`, using the fewest bits that can hold a face
+    and rejecting out of range values, which avoids the per-die call
+    overhead of `random.randint`.
+
+    Returns:
+        (list[int] or numpy.ndarray): the rolled faces
+    """
+    if rng is None and numpy is not None and count >= _NUMPY_MIN_BATCH:
+        return numpy.random.randint(1, die + 1, size=count)
+    if die == 1:
+        return [1] * count
+    getrandbits = (rng or random).getrandbits
+    bits = (die - 1).bit_length()
+    mask = (1 << bits) - 1
+    per_chunk = 64 // bits
+    faces = []
+    append = faces.append
+    while len(faces) < count:
+        chunk = getrandbits(64)
+        for _ in range(per_chunk):
+            face = chunk & mask
+            chunk >>= bits
+            if face < die:
+                append(int(face) + 1)
+    del faces[count:]
+    return faces
+
+
+def d_roll_many(xdyz, n, rng=None):
+    """Rolls a dice expression `n` times in one call.
+
+    Args:
+        xdyz (str): dice expression; see `compile_roll`
+        n (int): number of rolls
+        rng (random.Random, optional): random stream to roll with
+
+    Returns:
+        (list[int]): `n` totals
+    """
+    return compile_roll(xdyz).roll_many(n, rng)
+
+
+def _kept_distribution(num, die, keep, highest):
+    """Probability of each total of the highest or lowest `keep` dice.
+
+    Faces are visited from the best down, counting the ways of placing
+    dice on each face, so the first `keep` dice placed are the ones
+    kept. This is polynomial in the number of dice and faces.
+    """
+    faces = range(die, 0, -1) if highest else range(1, die + 1)
+    # (dice placed, kept total) -> number of ways
+    ways = {(0, 0): 1}
+    for face in faces:
+        placed_ways = defaultdict(int)
+        for (placed, total), count in ways.iteritems():
+            for n in range(num - placed + 1):
+                kept = min(n, max(0, keep - placed))
+                placed_ways[(placed + n, total + kept * face)] += \
+                    count * _binomial(num - placed, n)
+        ways = placed_ways
+    outcomes = float(die ** num)
+    return dict((total, count / outcomes)
+                for (placed, total), count in ways.iteritems()
+                if placed == num)
+
+
+def _mean_kept(num, die, keep, highest):
+    """Expected total of the highest or lowest `keep` of `num` dice."""
+    if not highest:
+        # the lowest dice are whatever the highest dice leave
+        return (num * (die + 1) / 2.0 -
+                _mean_kept(num, die, num - keep, True))
+    mean = 0.0
+    for face in range(1, die + 1):
+        # the i-th highest die is >= face if at least i dice are
+        p = (die - face + 1) / float(die)
+        for at_least in range(1, keep + 1):
+            mean += sum(_binomial(num, j) * p ** j * (1 - p) ** (num - j)
+                        for j in range(at_least, num + 1))
+    return mean
+
+
+def _binomial(n, k):
+    """Number of ways of choosing `k` of `n` items."""
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - i + 1) // i
+    return result
+
+
+def compile_roll(expr):
+    """Compiles a dice expression into a reusable `DiceRoll`.
+
+    Compiled rolls are cached, so calling `compile_roll` repeatedly
+    with the same expression is cheap.
+
+    Args:
+        expr (str): one or more terms joined by + or -, where each
+            term is a number or XdY dice with an optional keep suffix:
+
+            - _XdY_ - roll _X_ dice with _Y_ faces; _X_ defaults to 1
+            - _XdYkN_ or _XdYkhN_ - keep the highest _N_ dice
+            - _XdYklN_ - keep the lowest _N_ dice
+
+            The legacy XdY[+-Z]-DL form, which drops the lowest _D_
+            dice (default 1), is also accepted.
+
+    Returns:
+        (DiceRoll): the compiled expression
+
+    Example:
+        ```python
+        >>> stats = compile_roll('4d6k3')
+        >>> stats.roll()
+        14
+        >>> stats.max(), stats.min(), round(stats.mean(), 2)
+        (18, 3, 12.24)
+        ```
+    """
+    compiled = _ROLL_CACHE.pop(expr, None)
+    if compiled is None:
+        compiled = _compile(expr)
+        if len(_ROLL_CACHE) >= _ROLL_CACHE_SIZE:
+            _ROLL_CACHE.popitem(last=False)
+    _ROLL_CACHE[expr] = compiled
+    return compiled
+
+
+def _compile(expr):
+    """Parses `expr` into a new `DiceRoll`; see `compile_roll`."""
+    source, drop = expr, 0
+    legacy = _DROP_RE.match(expr)
+    if legacy:
+        source, drop = legacy.group(1), int(legacy.group(2) or 1)
+
+    dice, bonus, pos = [], 0, 0
+    while pos < len(source):
+        term = _TERM_RE.match(source, pos)
+        if not term or term.end() == pos or (pos and not term.group(1)):
+            raise DiceRollError('Invalid die roll expression. Must be '
+                                'format `XdY[kN][+-XdY|+-Z...]`.')
+        pos = term.end()
+        sign = -1 if term.group(1) == '-' else 1
+        num, die, mode, keep, const = term.groups()[1:]
+        if const is not None:
+            bonus += sign * int(const)
+            continue
+        num, die = int(num or 1), int(die)
+        keep = int(keep) if mode else num
+        if not 0 < keep <= num or die < 1:
+            raise DiceRollError(
+                'Dice to keep must be between 1 and the number of dice.')
+        dice.append((sign, num, die, keep, mode != 'kl'))
+
+    if not dice:
+        raise DiceRollError('Dice expression contains no dice.')
+    if drop:
+        sign, num, die, keep, highest = dice[0]
+        if drop >= num or len(dice) > 1 or keep < num:
+            raise DiceRollError(
+                'Rolls to drop must be less than number of rolls.')
+        dice[0] = (sign, num, die, num - drop, True)
+    return DiceRoll(expr, tuple(dice), bonus)
+
+
 def _parse_roll(xdyz):
     """Parser for XdY+Z dice roll notation.
 
@@ -68,65 +402,70 @@ def _parse_roll(xdyz):
                 and drop the lowest _D_ rolls before returning the total.
                 _D_ can be omitted and will default to 1.
 
+    Returns:
+        (tuple): (num, die, bonus, drop) of the expression
     """
-    xdyz_re = re.compile(r'(\d+)d(\d+)([+-]\d+(?!L))?(?:-(\d*L))?')
-    args = re.match(xdyz_re, xdyz)
-    if not args:
+    compiled = compile_roll(xdyz)
+    if len(compiled.dice) != 1 or compiled.dice[0][0] < 0 or \
+            not compiled.dice[0][4]:
         raise DiceRollError('Invalid die roll expression. Must be format `XdY[+-Z|-DL]`.')
-
-    num, die, bonus, drop = args.groups()
-    num, die = int(num), int(die)
-    bonus = int(bonus or 0)
-    drop = int(drop[:-1] or 1) if drop else 0
-
-    if drop >= num:
-        raise DiceRollError('Rolls to drop must be less than number of rolls.')
-
-    return num, die, bonus, drop
+    _, num, die, keep, _ = compiled.dice[0]
+    return num, die, compiled.bonus, num - keep
 
 
 def roll_max(xdyz):
-    """Determines the maximum possible roll given an XdY+Z expression."""
-    num, die, bonus, drop = _parse_roll(xdyz)
-    return (num - drop) * die + bonus
+    """Determines the maximum possible roll given a dice expression."""
+    return compile_roll(xdyz).max()
 
 
-def d_roll(xdyz, total=True):
+def d_roll(xdyz, total=True, rng=None):
     """Implementation of XdY+Z dice roll.
 
     Args:
-        xdyz (str): dice roll expression in the form of XdY[+Z] or XdY[-Z]
+        xdyz (str): dice expression; see `compile_roll`
         total (bool): if True, return a single value; if False, return a list
             of individual die values
+        rng (random.Random, optional): random stream to roll with
     """
-    num, die, bonus, drop = _parse_roll(xdyz)
-    if bonus > 0 and not total:
-        raise DiceRollError('Invalid arguments. `+-Z` not allowed when total is False.')
+    compiled = compile_roll(xdyz)
+    result = compiled.roll(total, rng)
+    if TELEMETRY is not None and total and next(TELEMETRY.sampled):
+        TELEMETRY.record(compiled.expr, result, compiled.distribution)
+    return result
 
-    rolls = [random.randint(1, die) for _ in range(num)]
 
-    if drop:
-        rolls = sorted(rolls, reverse=True)
-        [rolls.pop() for _ in range(drop)]
-    if total:
-        return sum(rolls) + bonus
-    else:
-        return rolls
+_STD_DICE = compile_roll('2d6')
 
 
-def std_roll():
+def std_roll(rng=None):
     """An Open Adventure "Standard Roll" as described in the OA rulebook.
 
     Returns a number between -5 and +5, with 0 the most common result.
+
+    Args:
+        rng (random.Random, optional): random stream to roll with
     """
-    white, black = d_roll('2d6', total=False)
-    if white >= black:
-        return white - black
-    else:
-        return -(black - white)
+    white, black = _STD_DICE.roll(total=False, rng=rng)
+    result = white - black
+    if TELEMETRY is not None and next(TELEMETRY.sampled):
+        TELEMETRY.record('std_roll', result, STD_ROLL_TABLE)
+    return result
+
+
+def std_roll_many(n, rng=None):
+    """Makes `n` Standard Rolls in one call; see `std_roll`.
+
+    Returns:
+        (list[int]): `n` results between -5 and +5
+    """
+    faces = _roll_faces(6, 2 * n, rng)
+    if numpy is not None and isinstance(faces, numpy.ndarray):
+        return (faces[::2] - faces[1::2]).tolist()
+    return [white - black for white, black
+            in zip(faces[::2], faces[1::2])]
 
 
-def skill_check(skill, target=5):
+def skill_check(skill, target=5, rng=None):
     """A basic Open Adventure Skill check.
 
     This is used for skill checks, trait checks, save rolls, etc.
@@ -134,11 +473,91 @@ def skill_check(skill, target=5):
     Args:
         skill (int): the value of the skill to check
         target (int): the target number for the check to succeed
+        rng (random.Random, optional): random stream to roll with
 
     Returns:
         (bool): indicates whether the check passed or failed
     """
-    return skill + std_roll() >= target
+    return skill + std_roll(rng) >= target
+
+
+def skill_check_many(skills, target=5, rng=None):
+    """Makes a skill check for each of several skill values at once.
+
+    Args:
+        skills (iterable[int]): the skill values to check
+        target (int): the target number for the checks to succeed
+        rng (random.Random, optional): random stream to roll with
+
+    Returns:
+        (list[bool]): whether each check passed, in order of `skills`
+    """
+    skills = list(skills)
+    return [skill + roll >= target for skill, roll
+            in zip(skills, std_roll_many(len(skills), rng))]
+
+
+# exact distributions of a standard roll and of the worse of two
+STD_ROLL_TABLE = compile_roll('1d6-1d6').distribution()
+STD_ROLL_MIN2_TABLE = dict(
+    (k, sum(STD_ROLL_TABLE[a] * STD_ROLL_TABLE[b]
+            for a in STD_ROLL_TABLE for b in STD_ROLL_TABLE if min(a, b) == k))
+    for k in STD_ROLL_TABLE)
+# probability of a standard roll of at least k, without and with
+# disadvantage, for k from -5 to 5
+_STD_AT_LEAST = dict(
+    (k, (sum(p for r, p in STD_ROLL_TABLE.items() if r >= k),
+         sum(p for r, p in STD_ROLL_MIN2_TABLE.items() if r >= k)))
+    for k in STD_ROLL_TABLE)
+
+
+def roll_distribution(xdyz):
+    """Returns the exact total to probability table of a dice expression."""
+    return compile_roll(xdyz).distribution()
+
+
+def skill_check_probability(skill, target=5, disadvantage=False):
+    """Returns the probability that a `skill_check` succeeds.
+
+    Args:
+        skill (int): the value of the skill to check
+        target (int): the target number for the check to succeed
+        disadvantage (bool): if True, the worse of two standard rolls
+            is used, as when attacking a dodging target
+
+    Returns:
+        (float): probability between 0 and 1
+    """
+    need = target - skill
+    if need <= -5:
+        return 1.0
+    if need > 5:
+        return 0.0
+    return _STD_AT_LEAST[need][1 if disadvantage else 0]
+
+
+def expected_damage(attack, defense, disadvantage=False):
+    """Returns the expected damage of an attack.
+
+    An attack deals `std_roll() + attack - defense` damage when that
+    is positive, as in `_do_attack`, `_do_kick` and `_do_strike`.
+
+    Args:
+        attack (int): the attacker's attack trait value
+        defense (int): the target's DEF trait value
+        disadvantage (bool): if True, the target is dodging
+
+    Returns:
+        (float): mean damage per attack, counting misses as 0
+    """
+    table = STD_ROLL_MIN2_TABLE if disadvantage else STD_ROLL_TABLE
+    return sum(p * (roll + attack - defense) for roll, p in table.iteritems()
+               if roll + attack - defense > 0)
+
+
+def hit_probability(attack, defense, disadvantage=False):
+    """Returns the probability that an attack deals damage."""
+    return skill_check_probability(attack, defense + 1, disadvantage)
 
 
 def resolve_death(killer, victim, combat_handler):
@@ -149,6 +568,9 @@ def resolve_death(killer, victim, combat_handler):
         victim (Character): the character being killed
         combat_handler (CombatHandler): combat in which the killing is happening
     """
+    # the killing blow is reported before the death
+    held = combat_handler.ndb.messages is not None
+    combat_handler.flush_messages()
     killer.location.msg_contents(
         "{killer} has vanquished {victim}.",
         mapping={'killer': killer, 'victim': victim},
@@ -156,7 +578,7 @@ def resolve_death(killer, victim, combat_handler):
 
     victim.at_death()
     combat_handler.remove_character(victim)
-    combat_handler.db.turn_order.remove(victim.id)
+    combat_handler.ndb.turn_order.remove(victim.id)
 
     # award XP
     if victim.is_typeclass('typeclasses.characters.Character'):
@@ -170,9 +592,104 @@ def resolve_death(killer, victim, combat_handler):
     killer.msg("{actor} gains {xp} XP".format(
         actor=killer.get_display_name(killer),
         xp=xp_gained))
+    if held:
+        combat_handler.hold_messages()
+
+
+# registered combat actions; see `combat_action`
+ACTIONS = {}
+
+
+class CombatAction(object):
+    """A registered combat action; see `combat_action`."""
+    __slots__ = ('name', 'func', 'switches', 'duration', 'ranges', 'delay')
+
+    def __init__(self, name, func, switches, duration, ranges, delay):
+        self.name = name
+        self.func = func
+        self.switches = switches
+        self.duration = duration
+        self.ranges = ranges
+        self.delay = delay
+
+    def parse_switches(self, switches):
+        """Returns the registered switches matching `switches`.
+
+        Switches may be abbreviated to any prefix of a registered switch;
+        switches the action does not accept are ignored.
+        """
+        parsed = []
+        for switch in switches:
+            for name in self.switches:
+                if switch and name.startswith(switch) and name not in parsed:
+                    parsed.append(name)
+                    break
+        return tuple(parsed)
+
+    def in_range(self, combat_handler, character, target):
+        """Returns True if the action has an effect on `target` at its
+        current range from `character`.
+
+        Targets that have left combat are left to the action's handler.
+        """
+        if self.ranges is None \
+                or target.id not in combat_handler.ndb.characters:
+            return True
+        return combat_handler.get_range(character, target) in self.ranges
 
 
-def _do_nothing(st_remaining, character, _, args):
+def combat_action(name, switches=(), duration=1, ranges=None, delay=1):
+    """Decorator registering a function as the handler of a combat action.
+
+    Handlers are called by `process_next_action` with the signature
+    `func(subturns_remaining, character, target, args, rng)` and return
+    the delay in seconds before the next action is processed.
+
+    Args:
+        name (str): the action name queued with `CombatHandler.add_action`
+        switches (tuple[str]): switches the action accepts, as in
+            'advance/reach'; they are passed to the handler as `args`
+        duration (int): default number of subturns the action takes
+        ranges (tuple[str], optional): ranges from its target at which
+            the action has an effect, checked on the subturn the action
+            resolves; any range if None
+        delay (float): multiple of `COMBAT_DELAY` to wait after the
+            action if its handler returns None
+
+    Returns:
+        (callable): decorator returning the function unchanged
+    """
+    def register(func):
+        ACTIONS[name] = CombatAction(name, func, tuple(switches), duration,
+                                     ranges and tuple(ranges), delay)
+        return func
+    return register
+
+
+def parse_action(action):
+    """Splits an action string into a registered action and its switches.
+
+    Args:
+        action (str): action name and switches, as in 'advance/reach'
+
+    Returns:
+        (tuple): `(name, args)`, where `args` is a tuple of the action's
+            registered switches
+
+    Raises:
+        CombatActionError: if no action is registered under that name
+    """
+    parts = action.split('/')
+    registered = ACTIONS.get(parts[0])
+    if registered is None:
+        raise CombatActionError(
+            "Unknown combat action '{}'.".format(parts[0]))
+    return parts[0], registered.parse_switches(parts[1:])
+
+
+
+@combat_action('nothing')
+def _do_nothing(st_remaining, character, _, args, rng=None):
     """Default combat action if no action has been entered."""
     if st_remaining <= 0:  # only message on the last repeat
         ch = character.ndb.combat_handler
@@ -185,7 +702,8 @@ def _do_nothing(st_remaining, character, _, args):
         return 0.2 * COMBAT_DELAY
 
 
-def _do_drop(st_remaining, character, target, _):
+@combat_action('drop', duration=0)
+def _do_drop(st_remaining, character, target, _, rng=None):
     """Implement the 'drop item' combat action."""
     ch = character.ndb.combat_handler
     # drop the item and run hook
@@ -216,7 +734,8 @@ def _do_drop(st_remaining, character, target, _):
         return 0.2 * COMBAT_DELAY
 
 
-def _do_get(st_remaining, character, target, _):
+@combat_action('get')
+def _do_get(st_remaining, character, target, _, rng=None):
     """Implement the 'get item' combat action."""
     ch = character.ndb.combat_handler
     if target in character.location.contents:
@@ -242,7 +761,8 @@ def _do_get(st_remaining, character, target, _):
         return 0.5 * COMBAT_DELAY
 
 
-def _do_equip(st_remaining, character, target, _):
+@combat_action('equip')
+def _do_equip(st_remaining, character, target, _, rng=None):
     """Implement the 'equip' combat action, replacing any
     currently equipped item.
     """
@@ -287,7 +807,8 @@ def _do_equip(st_remaining, character, target, _):
     return 1 * COMBAT_DELAY
 
 
-def _do_remove(st_remaining, character, target, _):
+@combat_action('remove')
+def _do_remove(st_remaining, character, target, _, rng=None):
     """Implement the 'remove' combat action, removing a
     currently equipped item.
     """
@@ -321,12 +842,14 @@ def _do_remove(st_remaining, character, target, _):
     return 1 * COMBAT_DELAY
 
 
-def _do_attack(st_remaining, character, target, args):
+@combat_action('attack', switches=('subdue',),
+               ranges=('melee', 'reach', 'ranged'))
+def _do_attack(st_remaining, character, target, args, rng=None):
     """Implement melee and ranged 'attack' ch actions."""
     ch = character.ndb.combat_handler
 
     # confirm the target is still in combat
-    if not target.id in ch.db.characters:
+    if not target.id in ch.ndb.characters:
         ch.combat_msg(
             "{actor} is unable to attack {defender}.",
             actor=character,
@@ -367,9 +890,9 @@ def _do_attack(st_remaining, character, target, args):
 
     if dodging:
         # attacker must take the worse of two standard rolls
-        atk_roll = min((std_roll(), std_roll()))
+        atk_roll = min((std_roll(rng), std_roll(rng)))
     else:
-        atk_roll = std_roll()
+        atk_roll = std_roll(rng)
 
     ammunition = None
     if weapon.db.range in ('melee', 'reach'):
@@ -456,7 +979,8 @@ def _do_attack(st_remaining, character, target, args):
     return 1 * COMBAT_DELAY
 
 
-def _do_kick(st_remaining, character, target, args):
+@combat_action('kick', switches=('subdue',), duration=2, ranges=('melee',))
+def _do_kick(st_remaining, character, target, args, rng=None):
     """Implements the 'kick' combat command."""
     ch = character.ndb.combat_handler
 
@@ -477,9 +1001,8 @@ def _do_kick(st_remaining, character, target, args):
         # second subturn: checks and resolution
 
         # confirm the target is still in combat and is within range
-        attack_range = ch.get_range(character, target)
-        if target.id not in ch.db.characters \
-                or attack_range != 'melee':
+        if target.id not in ch.ndb.characters \
+                or not ACTIONS['kick'].in_range(ch, character, target):
             ch.combat_msg(
                 "{actor} is unable to kick {target}.",
                 actor=character,
@@ -492,9 +1015,9 @@ def _do_kick(st_remaining, character, target, args):
 
         if dodging:
             # attacker must take the worse of two standard rolls
-            atk_roll = min((std_roll(), std_roll()))
+            atk_roll = min((std_roll(rng), std_roll(rng)))
         else:
-            atk_roll = std_roll()
+            atk_roll = std_roll(rng)
 
         damage = (atk_roll + character.traits.ATKU + 2) - target.traits.DEF
         if damage > 0:
@@ -557,7 +1080,8 @@ def _do_kick(st_remaining, character, target, args):
     return 1 * COMBAT_DELAY
 
 
-def _do_strike(st_remaining, character, target, args):
+@combat_action('strike', switches=('subdue',), ranges=('melee',))
+def _do_strike(st_remaining, character, target, args, rng=None):
     """Implements the 'strike' combat command."""
     ch = character.ndb.combat_handler
 
@@ -567,14 +1091,13 @@ def _do_strike(st_remaining, character, target, args):
         return _do_wrestle(character, target, ['break'])
 
     # confirm the target is still in combat,
-    if target.id not in ch.db.characters:
+    if target.id not in ch.ndb.characters:
         character.msg("{defender} has left combat.".format(
             defender=target.get_display_name(character)))
         return 0.2 * COMBAT_DELAY
 
     # is within range,
-    attack_range = ch.get_range(character, target)
-    if attack_range != 'melee':
+    if not ACTIONS['strike'].in_range(ch, character, target):
         ch.combat_msg(
             "{actor} is too far away from {target} to strike them.",
             actor=character,
@@ -597,9 +1120,9 @@ def _do_strike(st_remaining, character, target, args):
 
     if dodging:
         # attacker must take the worse of two standard rolls
-        atk_roll = min((std_roll(), std_roll()))
+        atk_roll = min((std_roll(rng), std_roll(rng)))
     else:
-        atk_roll = std_roll()
+        atk_roll = std_roll(rng)
 
     damage = (atk_roll + character.traits.ATKU) - target.traits.DEF
     if damage > 0:
@@ -660,12 +1183,24 @@ def _do_strike(st_remaining, character, target, args):
         if strikes > 1:
             # we have two free hands; do a second strike
             args.append('end')
-            utils.delay(0.5 * COMBAT_DELAY, _do_strike, 0, character, target, args)
+            COMBAT_CLOCK.schedule(0.5 * COMBAT_DELAY, ch, _second_strike,
+                                  character, target, args, rng)
 
         return 1 * COMBAT_DELAY
 
 
-def _do_advance(st_remaining, character, target, args):
+def _second_strike(character, target, args, rng=None):
+    """Clock callback for the second strike of a two-handed 'strike'.
+
+    It runs outside `process_next_action`, so its trait changes are
+    batched here.
+    """
+    with batch_traits(character, target):
+        return _do_strike(0, character, target, args, rng)
+
+
+@combat_action('advance', switches=('reach',))
+def _do_advance(st_remaining, character, target, args, rng=None):
     """Implements the 'advance' combat command."""
     ch = character.ndb.combat_handler
     start_range = ch.get_range(character, target)
@@ -700,7 +1235,8 @@ def _do_advance(st_remaining, character, target, args):
     return 1 * COMBAT_DELAY
 
 
-def _do_retreat(st_remaining, character, _, args):
+@combat_action('retreat', switches=('reach',))
+def _do_retreat(st_remaining, character, _, args, rng=None):
     """Implements the 'retreat' combat command."""
     ch = character.ndb.combat_handler
     end_range = 'reach' if any(arg.startswith('r') for arg in args) \
@@ -716,7 +1252,7 @@ def _do_retreat(st_remaining, character, _, args):
         return 0.2 * COMBAT_DELAY
 
     elif start_range == 'melee':
-        ok = skill_check(character.skills.balance.actual, 4)
+        ok = skill_check(character.skills.balance.actual, 4, rng)
 
     else:
         ok = True
@@ -735,13 +1271,15 @@ def _do_retreat(st_remaining, character, _, args):
     return 1 * COMBAT_DELAY
 
 
+@combat_action('dodge')
 def _do_dodge(*args):
     """Dodging is handled in attack actions.
        This is just a placeholder."""
     return 0
 
 
-def _do_flee(st_remaining, character, _, args):
+@combat_action('flee', duration=2)
+def _do_flee(st_remaining, character, _, args, rng=None):
     """Implements the 'flee' combat command."""
     ch = character.ndb.combat_handler
     # fleeing takes two subturns
@@ -764,7 +1302,7 @@ def _do_flee(st_remaining, character, _, args):
             # easiest
             target_num = 4
 
-        ok = skill_check(character.skills.escape.actual, target_num)
+        ok = skill_check(character.skills.escape.actual, target_num, rng)
         if ok:
             # successfully escaped
             ch.combat_msg(
@@ -777,7 +1315,7 @@ def _do_flee(st_remaining, character, _, args):
 
             # prevent re-attack for a time
             character.ndb.no_attack = True
-            safe_time = 2 * (character.skills.escape + d_roll('1d6'))
+            safe_time = 2 * (character.skills.escape + d_roll('1d6', rng=rng))
 
             def enable_attack():
                 del character.ndb.no_attack
@@ -794,51 +1332,59 @@ def _do_flee(st_remaining, character, _, args):
     return 1 * COMBAT_DELAY
 
 
-def _do_wrestle(st_remaining, character, target, args):
+@combat_action('wrestle', switches=('break',), duration=2,
+               ranges=('melee',))
+def _do_wrestle(st_remaining, character, target, args, rng=None):
     """Implements the 'wrestle' combat command."""
     return 0 * COMBAT_DELAY
 
 
-def process_next_action(combat_handler):
+def process_next_action(combat_handler, rng=None):
     """
     Callback that handles processing combat actions
 
     Args:
         combat_handler: instance of a combat handler
+        rng (random.Random, optional): the turn's random stream
 
     Returns:
         None
 
     Based on the combat handler's data, this callback
-    selects an appropriate `_do_*` function to execute
-    the combat action. These handlers are all called
-    with the signature:
+    selects the `_do_*` function registered in `ACTIONS`
+    to execute the combat action. These handlers are all
+    called with the signature:
 
-        `_do_action(subturns_remaining, character, target, args)`
+        `_do_action(subturns_remaining, character, target, args, rng)`
+
+    where `rng` is the random stream all of the action's rolls use.
 
     Each `_do_*` function should return a time delay
     in seconds before the next call to `process_next_action`
     should be run.
     """
-    turn_actions = combat_handler.db.turn_actions
-    turn_order = combat_handler.db.turn_order
-    actor_idx = combat_handler.db.actor_idx
+    turn_actions = combat_handler.ndb.turn_actions
+    turn_order = combat_handler.ndb.turn_order
+    actor_idx = combat_handler.ndb.actor_idx
     delay = 0
 
     if actor_idx >= len(turn_order):
-        # finished a subturn
+        # finished a subturn; write its trait changes once per combatant
+        # and send its messages in one batch per recipient
+        combat_handler.flush_traits()
+        combat_handler.flush_messages()
         # reset counters and see who is dodging during the next action
         combat_handler.ndb.actions_taken = defaultdict(int)
-        combat_handler.db.actor_idx = actor_idx = 0
-        for dbref, char in combat_handler.db.characters.items():
+        combat_handler.ndb.actor_idx = actor_idx = 0
+        for dbref, char in combat_handler.ndb.characters.items():
             if char.nattributes.has('dodging'):
                 del char.ndb.dodging
             action_count = 0
 
             # set the dodging nattribute on any characters
             # with 'dodge' as their action
-            for action, _, _, duration in combat_handler.db.turn_actions[dbref]:
-                if action == 'dodge':
+            for name, _, _, duration, _ in combat_handler.ndb.turn_actions[dbref]:
+                if name == 'dodge':
                     char.ndb.dodging = True
                     break
                 action_count += duration
@@ -846,48 +1392,65 @@ def process_next_action(combat_handler):
                     break
 
         # and increment the subturn
-        combat_handler.db.subturn += 1
+        combat_handler.ndb.subturn += 1
+        combat_handler.hold_traits()
+        combat_handler.hold_messages()
 
-    if combat_handler.db.subturn > ACTIONS_PER_TURN:
+    if combat_handler.ndb.subturn > ACTIONS_PER_TURN:
         # turn is over; notify the handler to start the next
+        combat_handler.flush_traits()
+        combat_handler.flush_messages()
         combat_handler.begin_turn()
         return
 
     current_charid = turn_order[actor_idx]
     if combat_handler.ndb.actions_taken[current_charid] < 1:
-        action, character, target, duration = \
+        name, character, target, duration, args = \
             turn_actions[current_charid].popleft()
 
         combat_handler.ndb.actions_taken[current_charid] += duration
 
-        args = action.split('/')[1:]
-
         # we decrement the duration for this turn
         duration -= 1
         if duration > 0:
             # action takes more than one subturn; return it to the queue
             turn_actions[current_charid].append(
-                (action,
+                (name,
                  character,
                  target,
-                 duration)
+                 duration,
+                 args)
             )
-            combat_handler.db.actor_idx += 1
+            combat_handler.ndb.actor_idx += 1
 
-        action_func = '_do_{}'.format(action.split('/')[0])
+        action = ACTIONS[name]
 
-        # action_func receives the number of subturns remaining in the action
-        delay = globals()[action_func](duration, character, target, args)
+        if duration == 0 \
+                and not action.in_range(combat_handler, character, target):
+            # the action resolves this subturn; its registered ranges apply
+            combat_handler.combat_msg(
+                "{actor} is out of range to {action} {target}.",
+                actor=character,
+                target=target,
+                action=name)
+            delay = 0.2 * COMBAT_DELAY
+        else:
+            # the handler receives the number of subturns remaining in the
+            # action; trait changes are held until the end of the subturn
+            delay = action.func(duration, character, target, list(args), rng)
+            if delay is None:
+                delay = action.delay * COMBAT_DELAY
     else:
-        combat_handler.db.actor_idx += 1
+        combat_handler.ndb.actor_idx += 1
 
-    if len(combat_handler.db.characters) < 2:
+    if len(combat_handler.ndb.characters) < 2:
         combat_handler.stop()
     else:
-        utils.delay(delay, process_next_action, combat_handler)
+        COMBAT_CLOCK.schedule(delay, combat_handler, process_next_action,
+                              combat_handler, rng)
 
 
-def resolve_combat(combat_handler):
+def resolve_combat(combat_handler, rng=None):
     """Called by the combat handler to resolve combat.
 
     Each turn, an initiative roll is done behind the scenes
@@ -902,66 +1465,44 @@ def resolve_combat(combat_handler):
     Args:
         combat_handler: an instance of the combat handler
                 invoking this function
+        rng (random.Random, optional): random stream for all of the
+                turn's rolls; see `CombatHandler.turn_rng`. Replaying
+                a turn with the same stream and starting state
+                reproduces it exactly.
     """
-    combatants = combat_handler.db.characters
+    combatants = combat_handler.ndb.characters
 
     # fill any dawdlers with the 'nothing' action
-    for dbref in combat_handler.db.action_count.keys():
-        if combat_handler.db.action_count[dbref] < ACTIONS_PER_TURN:
+    for dbref in combat_handler.ndb.action_count.keys():
+        if combat_handler.ndb.action_count[dbref] < ACTIONS_PER_TURN:
             combat_handler.add_action(
                 'nothing',
-                combat_handler.db.characters[dbref],
+                combat_handler.ndb.characters[dbref],
                 None,
-                ACTIONS_PER_TURN - combat_handler.db.action_count[dbref])
-
-    # tiebreaker resolution helper function. super non-deterministic
-    def _initiative_cmp(x, y):
-        # first tiebreaker: result of the std_roll
-        if x[2] != y[2]:
-            return y[2] - x[2]
-        else:
-            # second tiebreaker: PCs before NPCs
-            x_plyr, y_plyr = combatants[x[0]].has_player, \
-                             combatants[y[0]].has_player
-            if x_plyr and not y_plyr:
-                return 1
-            elif y_plyr and not x_plyr:
-                return -1
-            else:
-                # third tiebreaker: reroll
-                while True:  # repeat until we get a result
-                    roll_x = std_roll() + combatants[x[0]].traits.PER.actual
-                    roll_y = std_roll() + combatants[y[0]].traits.PER.actual
-                    if roll_x != roll_y:
-                        return roll_x - roll_y
-
-    # Do the Initiative roll to determine turn order
-    turn_order = []
-    intv_rolls = {}
-
-    for cid, combatant in combatants.items():
-        roll = std_roll()
-        initiative = roll + combatant.traits.PER.actual
-        if initiative in intv_rolls:
-            intv_rolls[initiative].append((cid, initiative, roll))
-        else:
-            intv_rolls[initiative] = [(cid, initiative, roll)]
-
-    # resolve ties and build the turn order
-    for intv in sorted(intv_rolls.keys(), reverse=True):
-        if len(intv_rolls[intv]) == 1:
-            turn_order += [intv_rolls[intv][0][0]]
-        else:  # more than one rolled same Initiative
-            turn_order += [x[0] for x in
-                           sorted(intv_rolls[intv], cmp=_initiative_cmp)]
-
-    combat_handler.db.turn_order = turn_order
-    combat_handler.db.subturn = 0
+                ACTIONS_PER_TURN - combat_handler.ndb.action_count[dbref])
+
+    # Do the Initiative roll to determine turn order. Ties go to the
+    # higher roll, then to NPCs over PCs, then to the lower of a second
+    # initiative roll, then to a random draw; all are made up front so
+    # that ordering is a single sort on a precomputed key
+    draw = (rng or random).random
+    initiatives = []
+    for cid, combatant in sorted(combatants.items()):
+        per = combatant.traits.PER.actual
+        roll = std_roll(rng)
+        key = (-(roll + per), -roll, bool(combatant.has_player),
+               std_roll(rng) + per, draw())
+        initiatives.append((key, cid))
+
+    turn_order = [cid for _, cid in sorted(initiatives)]
+
+    combat_handler.ndb.turn_order = turn_order
+    combat_handler.ndb.subturn = 0
 
     # here, actor_idx is initialized to trigger the "end"
     # of subturn 0 within the process_next_action call
-    combat_handler.db.actor_idx = len(turn_order)
+    combat_handler.ndb.actor_idx = len(turn_order)
 
     # begin processing actions for characters in order
-    process_next_action(combat_handler)
+    process_next_action(combat_handler, rng)
 
@@ -21,6 +21,11 @@ Module Functions:
         traits. In OA, all skills start matching their base trait before
         the player allocates a number of +1 and -1 counters.
 
+    - `skill_template(traits)`
+
+        Returns the initial skill trait data for a set of trait data,
+        for registering a shared template for NPC skills.
+
     - `load_skill(skill)`
 
         Loads an instance of the Skill class by name for display of
@@ -182,6 +187,24 @@ def apply_skills(char):
         )
 
 
+def skill_template(traits):
+    """Returns initial skill trait data matching the given traits.
+
+    Args:
+        traits (dict): trait key to trait data mapping
+
+    Returns:
+        (dict): skill key to trait data, as set up by `apply_skills`
+    """
+    return dict((skill, dict(type='static',
+                             base=(traits[data['base']]['base'] +
+                                   traits[data['base']]['mod']),
+                             mod=0,
+                             name=data['name'],
+                             extra=dict(plus=0, minus=0)))
+                for skill, data in _SKILL_DATA.iteritems())
+
+
 def load_skill(skill):
     """Retrieves an instance of a `Skill` class.
 
@@ -0,0 +1,300 @@
+"""
+Dice telemetry.
+
+When enabled, a sample of `d_roll`, `std_roll` and `skill_check`
+results, one in `SAMPLE_EVERY` by default, is counted in a histogram
+for its dice expression and another for the expression at the line of
+code that rolled it. Skill checks are counted as the standard rolls
+they make, at the line that made the check. Histograms have one counter
+per possible result, so memory does not grow with the number of rolls;
+at most `MAX_KEYS` expressions and `MAX_SITES` call sites are tracked.
+
+Each histogram can be checked against the exact distribution of its
+expression with a chi-square test, over all rolls and over the last
+complete window of `WINDOW_SIZE` rolls, so that both long-standing
+bias and recent drift are visible:
+
+    >>> from world import telemetry
+    >>> telemetry.enable()
+    >>> # ... later
+    >>> telemetry.TELEMETRY.check('std_roll')    # see RollHistogram.check
+
+A p value close to 0 means the results are unlikely to come from fair
+dice. Telemetry is off by default, is kept in memory only and is
+controlled in game with the `@dice` command.
+"""
+import random
+import sys
+from itertools import cycle
+from math import exp, log, lgamma
+from world import rulebook
+
+# rolls per drift window
+WINDOW_SIZE = 10000
+# one roll in this many is counted, keeping the cost to the roll
+# functions to a few percent; sampling does not depend on results, so
+# the tests remain valid
+SAMPLE_EVERY = 32
+# length of the repeating random pattern of sampled rolls; a prime, so
+# that rolls made in a fixed order are sampled evenly
+_PATTERN_SIZE = 4093
+# most expressions and call sites tracked
+MAX_KEYS = 256
+MAX_SITES = 1024
+
+# p value below which a histogram is reported as suspicious
+ALERT_P = 0.001
+
+TELEMETRY = None
+
+# code of the functions whose callers are recorded as call sites
+_ROLL_CODES = frozenset(f.__code__ for f in (
+    rulebook.d_roll, rulebook.std_roll, rulebook.skill_check))
+
+
+def enable(window_size=WINDOW_SIZE, sample_every=SAMPLE_EVERY):
+    """Starts collecting dice telemetry, discarding any collected before.
+
+    Args:
+        window_size (int): counted rolls per drift window
+        sample_every (int): count one roll in this many; 1 counts all
+    """
+    global TELEMETRY
+    TELEMETRY = DiceTelemetry(window_size, sample_every)
+    rulebook.TELEMETRY = TELEMETRY
+
+
+def disable():
+    """Stops collecting dice telemetry.
+
+    Collected histograms remain available in `TELEMETRY`.
+    """
+    rulebook.TELEMETRY = None
+
+
+def enabled():
+    """Returns True if dice telemetry is being collected."""
+    return rulebook.TELEMETRY is not None
+
+
+def chi2_sf(x, df):
+    """Returns the probability of a chi-square statistic of at least `x`.
+
+    Args:
+        x (float): chi-square statistic
+        df (int): degrees of freedom
+
+    Returns:
+        (float): the upper tail probability, or p value
+    """
+    if x <= 0 or df < 1:
+        return 1.0
+    a, x = df / 2.0, x / 2.0
+    scale = exp(-x + a * log(x) - lgamma(a))
+    if x < a + 1:
+        # series expansion of the lower incomplete gamma function
+        term = total = 1.0 / a
+        n = a
+        while abs(term) > abs(total) * 1e-12:
+            n += 1
+            term *= x / n
+            total += term
+        return max(0.0, 1.0 - total * scale)
+    # continued fraction of the upper incomplete gamma function
+    tiny = 1e-300
+    b = x + 1 - a
+    c, d = 1 / tiny, 1 / b
+    h = d
+    for i in range(1, 200):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = b + an / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        if abs(d * c - 1) < 1e-12:
+            break
+    return min(1.0, h * scale)
+
+
+def chi_square(counts, probs):
+    """Tests observed counts against expected probabilities.
+
+    Adjacent results are pooled until each pool expects at least five
+    counts, as the test requires.
+
+    Args:
+        counts (list[int]): observed count of each result
+        probs (list[float]): expected probability of each result
+
+    Returns:
+        (tuple): `(statistic, df, p)`, or None if there are too few
+            counts for a test
+    """
+    n = sum(counts)
+    pools = []
+    observed = expected = 0
+    for count, p in zip(counts, probs):
+        observed += count
+        expected += p * n
+        if expected >= 5:
+            pools.append([observed, expected])
+            observed = expected = 0
+    if expected and pools:
+        pools[-1][0] += observed
+        pools[-1][1] += expected
+    if len(pools) < 2:
+        return None
+    statistic = sum((o - e) ** 2 / e for o, e in pools)
+    df = len(pools) - 1
+    return statistic, df, chi2_sf(statistic, df)
+
+
+class RollHistogram(object):
+    """Counts of each possible result of a dice expression.
+
+    Args:
+        distribution (dict): exact result to probability mapping
+        window_size (int): rolls per drift window
+    """
+    __slots__ = ('distribution', 'low', 'probs', 'counts', 'window',
+                 'previous', 'outliers', 'window_size', '_left')
+
+    def __init__(self, distribution, window_size=WINDOW_SIZE):
+        self.distribution = distribution
+        self.low = min(distribution)
+        self.probs = [distribution.get(v, 0.0)
+                      for v in range(self.low, max(distribution) + 1)]
+        self.counts = [0] * len(self.probs)
+        self.window = [0] * len(self.probs)
+        self.previous = None
+        self.outliers = 0
+        self.window_size = window_size
+        self._left = window_size
+
+    def add(self, value):
+        """Counts one result."""
+        i = value - self.low
+        if i < 0 or i >= len(self.counts):
+            # a result the dice cannot produce
+            self.outliers += 1
+            return
+        self.counts[i] += 1
+        self.window[i] += 1
+        self._left -= 1
+        if not self._left:
+            self.previous, self.window = self.window, [0] * len(self.counts)
+            self._left = self.window_size
+
+    @property
+    def rolls(self):
+        """Number of results counted."""
+        return sum(self.counts) + self.outliers
+
+    def check(self):
+        """Tests the counted results against the expected distribution.
+
+        Returns:
+            (dict): number of `rolls`, observed and `expected` `mean`,
+                p values over all rolls (`p`) and over the last complete
+                window (`window_p`), which are None until there are
+                enough rolls to test, and number of impossible results
+                (`outliers`). Any outlier makes both p values 0.
+        """
+        values = range(self.low, self.low + len(self.counts))
+        n = sum(self.counts)
+        result = {
+            'rolls': self.rolls,
+            'mean': (sum(v * c for v, c in zip(values, self.counts)) /
+                     float(n) if n else None),
+            'expected': sum(v * p for v, p in zip(values, self.probs)),
+            'outliers': self.outliers,
+        }
+        for key, counts in (('p', self.counts), ('window_p', self.previous)):
+            test = chi_square(counts, self.probs) if counts else None
+            result[key] = test and test[2]
+            if self.outliers:
+                result[key] = 0.0
+        return result
+
+
+class DiceTelemetry(object):
+    """Histograms of dice results by expression and by call site.
+
+    Args:
+        window_size (int): counted rolls per drift window
+        sample_every (int): count one roll in this many
+    """
+    def __init__(self, window_size=WINDOW_SIZE, sample_every=1):
+        self.window_size = window_size
+        self.sample_every = sample_every
+        # roll functions call `record` when this yields True
+        pattern = [False] * _PATTERN_SIZE
+        for i in random.sample(xrange(_PATTERN_SIZE),
+                               _PATTERN_SIZE // sample_every):
+            pattern[i] = True
+        self.sampled = cycle(pattern)
+        # expression: RollHistogram
+        self.rolls = {}
+        # (expression, filename, function, line): RollHistogram
+        self.sites = {}
+        # results not counted because too many keys were tracked
+        self.untracked = 0
+
+    def record(self, key, value, distribution):
+        """Counts a result of the roll function that called this method.
+
+        Roll functions call this only when `sampled` yields True.
+
+        Args:
+            key (str): the dice expression rolled
+            value (int): the result
+            distribution (dict or callable): exact distribution of the
+                expression, or a function returning it; used when the
+                expression is first seen
+        """
+        hist = self.rolls.get(key)
+        if hist is None:
+            if len(self.rolls) >= MAX_KEYS:
+                self.untracked += 1
+                return
+            if callable(distribution):
+                distribution = distribution()
+            hist = self.rolls[key] = RollHistogram(distribution,
+                                                   self.window_size)
+        hist.add(value)
+
+        # the first frame outside the roll functions
+        frame = sys._getframe(2)
+        while frame.f_code in _ROLL_CODES:
+            frame = frame.f_back
+        site = (key, frame.f_code.co_filename, frame.f_code.co_name,
+                frame.f_lineno)
+        hist = self.sites.get(site)
+        if hist is None:
+            if len(self.sites) >= MAX_SITES:
+                return
+            hist = self.sites[site] = RollHistogram(
+                self.rolls[key].distribution, self.window_size)
+        hist.add(value)
+
+    def check(self, key):
+        """Returns `RollHistogram.check()` for an expression, or None."""
+        hist = self.rolls.get(key)
+        return hist.check() if hist else None
+
+    def report(self, sites=False):
+        """Checks every tracked histogram.
+
+        Args:
+            sites (bool): if True, report call sites instead of
+                expressions
+
+        Returns:
+            (list[tuple]): `(key, check)` pairs sorted by key, where key
+                is an expression or an `(expression, filename, function,
+                line)` tuple
+        """
+        hists = self.sites if sites else self.rolls
+        return [(key, hists[key].check()) for key in sorted(hists)]
@@ -29,9 +29,9 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
         super(AinneveCombatRangeTestCase, self).setUp()
         ch = self.script
         # set starting ranges
-        ch.db.distances[frozenset((self.char2.id, self.obj1.id))] = 'reach'
-        ch.db.distances[frozenset((self.char2.id, self.obj2.id))] = 'reach'
-        ch.db.distances[frozenset((self.obj1.id, self.obj2.id))] = 'melee'
+        ch.set_range(self.char2, self.obj1, 'reach')
+        ch.set_range(self.char2, self.obj2, 'reach')
+        ch.set_range(self.obj1, self.obj2, 'melee')
 
     def test_approach(self):
         """test approach combat action"""
@@ -128,9 +128,9 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
 
         #####
         # invalid approach from melee to melee
-        ch.db.distances[frozenset((self.char1.id, self.obj1.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.obj2.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.char2.id))] = 'reach'
+        ch.set_range(self.char1, self.obj1, 'melee')
+        ch.set_range(self.char1, self.obj2, 'melee')
+        ch.set_range(self.char1, self.char2, 'reach')
         self.assertEqual(ch.get_range(self.char1, self.char2), 'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj1),  'melee')
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'melee')
@@ -167,7 +167,7 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'melee')
         self.assertEqual(ch.get_range(self.char1, self.obj3),  'ranged')
 
-    @patch('world.rulebook.std_roll', new=lambda: -10)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: -10)
     def test_retreat_fail(self):
         """test invalid retreat and failure messaging"""
         ch = self.script
@@ -194,9 +194,9 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
 
         #####
         # test failure messaging for retreat from melee
-        ch.db.distances[frozenset((self.char1.id, self.obj1.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.obj2.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.char2.id))] = 'reach'
+        ch.set_range(self.char1, self.obj1, 'melee')
+        ch.set_range(self.char1, self.obj2, 'melee')
+        ch.set_range(self.char1, self.char2, 'reach')
         self.assertEqual(ch.get_range(self.char1, self.char2), 'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj1),  'melee')
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'melee')
@@ -221,7 +221,7 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
 
         #####
         # test invalid retreat from reach to reach
-        ch.db.distances[frozenset((self.char1.id, self.obj1.id))] = 'reach'
+        ch.set_range(self.char1, self.obj1, 'reach')
         self.assertEqual(ch.get_range(self.char1, self.char2), 'ranged')
         self.assertEqual(ch.get_range(self.char1, self.obj1),  'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'ranged')
@@ -241,12 +241,12 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'ranged')
         self.assertEqual(ch.get_range(self.char1, self.obj3),  'ranged')
 
-    @patch('world.rulebook.std_roll', new=lambda: 10)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 10)
     def test_retreat_succ(self):
         """test retreat from reach"""
         ch = self.script
         # confirm starting ranges
-        ch.db.distances[frozenset((self.char1.id, self.obj1.id))] = 'reach'
+        ch.set_range(self.char1, self.obj1, 'reach')
         self.assertEqual(ch.get_range(self.char1, self.char2), 'ranged')
         self.assertEqual(ch.get_range(self.char1, self.obj1),  'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'ranged')
@@ -268,9 +268,9 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
 
         #####
         # test success messaging for retreat from melee
-        ch.db.distances[frozenset((self.char1.id, self.obj1.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.obj2.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.char2.id))] = 'reach'
+        ch.set_range(self.char1, self.obj1, 'melee')
+        ch.set_range(self.char1, self.obj2, 'melee')
+        ch.set_range(self.char1, self.char2, 'reach')
         self.assertEqual(ch.get_range(self.char1, self.char2), 'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj1),  'melee')
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'melee')
@@ -292,9 +292,9 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
 
         #####
         # test success messaging for retreat melee to reach
-        ch.db.distances[frozenset((self.char1.id, self.obj1.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.obj2.id))] = 'melee'
-        ch.db.distances[frozenset((self.char1.id, self.char2.id))] = 'reach'
+        ch.set_range(self.char1, self.obj1, 'melee')
+        ch.set_range(self.char1, self.obj2, 'melee')
+        ch.set_range(self.char1, self.char2, 'reach')
         self.assertEqual(ch.get_range(self.char1, self.char2), 'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj1),  'melee')
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'melee')
@@ -314,7 +314,7 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
         self.assertEqual(ch.get_range(self.char1, self.obj2),  'reach')
         self.assertEqual(ch.get_range(self.char1, self.obj3),  'ranged')
 
-    @patch('world.rulebook.std_roll', new=lambda: -10)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: -10)
     def test_flee_fail(self):
         """test flee messaging when fleeing fails"""
         rulebook._do_flee(0, self.char1, self.char1, [])
@@ -324,7 +324,7 @@ class AinneveCombatRangeTestCase(AinneveCombatTest):
         msg, prompt = self.parse_msg_mock(self.char2)
         self.assertEqual(msg, ".. Char tries to escape, but is boxed in.")
 
-    @patch('world.rulebook.std_roll', new=lambda: 10)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 10)
     def test_flee_succ(self):
         """test flee messaging when fleeing succeeds"""
         # two-subturn action; run first subturn
@@ -495,7 +495,7 @@ class AinneveCombatItemTestCase(AinneveCombatTest):
 class AinneveCombatAttackTestCase(AinneveCombatTest):
     """Tests for attack combat actions in Ainneve."""
 
-    @patch('world.rulebook.std_roll', new=lambda: -3)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: -3)
     def test_kick_fail(self):
         """test failing unarmed 'kick' attacks"""
         ch = self.script
@@ -579,7 +579,7 @@ class AinneveCombatAttackTestCase(AinneveCombatTest):
         self.assertEqual(self.char2.traits.HP.actual, 10)
         self.assertEqual(self.char2.traits.SP.actual, 8)
 
-    @patch('world.rulebook.std_roll', new=lambda: 0)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 0)
     def test_kick_succ(self):
         """test successful 'kick' attacks"""
         ch = self.script
@@ -638,7 +638,7 @@ class AinneveCombatAttackTestCase(AinneveCombatTest):
         self.assertEqual(self.char2.traits.HP.actual, 8)
         self.assertEqual(self.char2.traits.SP.actual, 6)
 
-    @patch('world.rulebook.std_roll', new=lambda: 0)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 0)
     def test_strike_fail(self):
         """test failing 'strike' attacks"""
         ch = self.script
@@ -725,7 +725,7 @@ class AinneveCombatAttackTestCase(AinneveCombatTest):
         self.assertEqual(self.char2.traits.HP.actual, 10)
         self.assertEqual(self.char2.traits.SP.actual, 8)
 
-    @patch('world.rulebook.std_roll', new=lambda: 2)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 2)
     def test_strike_succ(self):
         """test successful 'strike' attacks"""
         ch = self.script
@@ -801,7 +801,7 @@ class AinneveCombatAttackTestCase(AinneveCombatTest):
         self.assertEqual(self.char2.traits.HP.actual, 4)
         self.assertEqual(self.char2.traits.SP.actual, 4)
 
-    @patch('world.rulebook.std_roll', new=lambda: -2)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: -2)
     def test_attack_fail(self):
         """test unsuccessful attacks with weapons"""
         ch = self.script
@@ -937,7 +937,7 @@ class AinneveCombatAttackTestCase(AinneveCombatTest):
         self.assertEqual(len(self.char1.equip), 0)
 
     @patch('world.rulebook.resolve_death')
-    @patch('world.rulebook.std_roll', new=lambda: 0)
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 0)
     def test_attack_succ(self, resolve_death_mock):
         """test successful attacks with weapons"""
         ch = self.script
@@ -0,0 +1,79 @@
+"""
+Unit tests for world.combat_clock module.
+"""
+from django.test import TestCase
+from mock import patch
+from world.combat_clock import CombatClock
+
+
+class CombatClockTestCase(TestCase):
+    """Test case for the combat timer wheel."""
+    def setUp(self):
+        self.now = 100.0
+        self.timers = []
+        self.clock = CombatClock(tick=0.1, slots=8, timer=lambda: self.now)
+        patcher = patch('world.combat_clock.utils.delay',
+                        new=lambda *args: self.timers.append(args))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def advance(self):
+        """Fires the last armed timer at its due time."""
+        wait, callback, due = self.timers[-1]
+        self.now = due * self.clock.tick
+        callback(due)
+
+    def test_schedule(self):
+        """test actions run in due order, batched per tick"""
+        calls = []
+        self.clock.schedule(2, 'a', calls.append, 'a2')
+        self.clock.schedule(0.5, 'b', calls.append, 'b1')
+        self.clock.schedule(0.45, 'a', calls.append, 'a1')
+        # a single timer, re-armed for the earliest action
+        self.assertEqual(len(self.clock), 3)
+        self.assertEqual(self.timers[-1][2], 1005)
+        self.advance()
+        self.assertEqual(calls, ['b1', 'a1'])
+        self.assertEqual(self.clock.stats['max_batch'], 2)
+        # 'a2' is more than one revolution ahead
+        self.clock.schedule(0.8, 'b', calls.append, 'b2')
+        self.advance()
+        self.assertEqual(calls, ['b1', 'a1', 'b2'])
+        self.advance()
+        self.assertEqual(calls, ['b1', 'a1', 'b2', 'a2'])
+
+        stats = self.clock.stats
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['handlers'], 0)
+        self.assertEqual((stats['batches'], stats['actions']), (3, 4))
+        self.assertEqual(len(stats['lag']), 3)
+
+    def test_late_timer(self):
+        """test a late timer runs every action due by then"""
+        calls = []
+        self.clock.schedule(0.1, 'a', calls.append, 1)
+        self.clock.schedule(0.3, 'a', calls.append, 2)
+        self.clock.schedule(5, 'a', calls.append, 3)
+        wait, callback, due = self.timers[-1]
+        self.now += 1
+        callback(due)
+        self.assertEqual(calls, [1, 2])
+        self.assertAlmostEqual(self.clock.stats['lag'][-1], 0.9)
+        # actions scheduled while late are not run early
+        self.clock.schedule(0, 'b', calls.append, 4)
+        self.advance()
+        self.assertEqual(calls, [1, 2, 4])
+
+    def test_cancel(self):
+        """test a stopped combat's actions are discarded"""
+        calls = []
+        self.clock.schedule(1, 'a', calls.append, 'a')
+        self.clock.schedule(1, 'b', calls.append, 'b')
+        self.assertIn('a', self.clock)
+        self.assertEqual(self.clock.cancel('a'), 1)
+        self.assertNotIn('a', self.clock)
+        self.advance()
+        self.assertEqual(calls, ['b'])
+        self.clock.schedule(1, 'a', calls.append, 'a')
+        self.clock.cancel('a')
+        self.assertEqual(len(self.clock), 0)
@@ -0,0 +1,86 @@
+"""
+Unit tests for world.combat_registry module.
+"""
+from django.test import TestCase
+from mock import Mock
+from world.combat_registry import CombatRegistry, COMBAT_TAG
+
+
+class CombatRegistryTestCase(TestCase):
+    """Test case for the combat registry."""
+    def setUp(self):
+        self.registry = CombatRegistry()
+        self.harbor = self._room(1, 'harbor')
+        self.docks = self._room(2, 'harbor')
+        self.keep = self._room(3, None)
+        self.a, self.b = self._char(10, self.harbor), self._char(11, self.harbor)
+        self.c, self.d = self._char(12, self.docks), self._char(13, self.keep)
+
+    @staticmethod
+    def _room(dbref, zone):
+        room = Mock(id=dbref)
+        room.tags.get.return_value = zone
+        return room
+
+    @staticmethod
+    def _char(dbref, location):
+        return Mock(id=dbref, location=location)
+
+    @staticmethod
+    def _handler(combat_id, *characters):
+        handler = Mock()
+        handler.db.combat_id = combat_id
+        handler.ndb.characters = dict((c.id, c) for c in characters)
+        return handler
+
+    def test_indexes(self):
+        """test fights are found by id, participant, room and zone"""
+        first = self._handler(1, self.a, self.b)
+        second = self._handler(2, self.c, self.d)
+        self.registry.add(first)
+        self.registry.add(second)
+        first.tags.add.assert_called_once_with(*COMBAT_TAG)
+
+        self.assertEqual(len(self.registry), 2)
+        self.assertIs(self.registry.get(2), second)
+        self.assertIs(self.registry.by_participant(self.c), second)
+        self.assertEqual(self.registry.in_room(self.harbor), [first])
+        self.assertEqual(self.registry.in_zone('harbor'), [first, second])
+        self.assertEqual(self.registry.in_zone('keep'), [])
+
+        # moving between fights
+        self.registry.join(first, self.c)
+        self.assertIs(self.registry.by_participant(self.c), first)
+        self.assertEqual(self.registry.in_room(self.docks), [first])
+
+        self.registry.leave(self.c)
+        self.assertIsNone(self.registry.by_participant(self.c))
+        self.assertEqual(self.registry.in_room(self.docks), [])
+
+        # moving between rooms during a fight
+        self.b.location = self.keep
+        self.registry.moved(self.b)
+        self.assertEqual(self.registry.in_room(self.keep), [first, second])
+        self.assertEqual(self.registry.in_room(self.harbor), [first])
+        self.a.location = self.keep
+        self.registry.moved(self.a)
+        self.assertEqual(self.registry.in_room(self.harbor), [])
+        self.assertEqual(self.registry.in_zone('harbor'), [])
+        self.registry.moved(self.d)
+        self.assertEqual(self.registry.in_room(self.keep), [first, second])
+
+        self.registry.remove(first)
+        self.assertNotIn(first, self.registry)
+        self.assertIsNone(self.registry.by_participant(self.a))
+        self.assertEqual(self.registry.in_zone('harbor'), [])
+        self.assertEqual(self.registry.all(), [second])
+
+    def test_restored(self):
+        """test participants are read from the checkpoint before restore"""
+        handler = self._handler(3)
+        handler.ndb.characters = None
+        handler.db.state = {'characters': {self.a.id: self.a,
+                                           self.d.id: self.d}}
+        self.registry.add(handler)
+        self.assertIs(self.registry.by_participant(self.d), handler)
+        self.assertEqual(self.registry.in_room(self.keep), [handler])
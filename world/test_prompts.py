@@ -0,0 +1,73 @@
+"""
+Unit tests for world.prompts module.
+"""
+from unittest import TestCase
+from mock import Mock
+from world.prompts import PromptCache
+
+
+class Session(object):
+    """Stand-in for a server session."""
+
+
+class PromptCacheTestCase(TestCase):
+    """Test case for the prompt cache."""
+    def setUp(self):
+        self.prompts = PromptCache()
+        self.session = Session()
+        self.char = self._character([self.session])
+
+    @staticmethod
+    def _character(sessions):
+        char = Mock()
+        char.sessions.all.return_value = sessions
+        snap = char.traits.snapshot.return_value
+        snap.HP.actual, snap.WM.actual, snap.BM.actual, snap.SP.actual = \
+            10, 0, 0, 8
+        return char
+
+    def test_suppressed(self):
+        """test unchanged prompts are sent only once per session"""
+        self.prompts.send(self.char, "one")
+        self.prompts.send(self.char, "two")
+        self.prompts.send(self.char)
+        calls = self.char.msg.call_args_list
+        self.assertEqual(len(calls), 2)
+        self.assertIn("HP: |g10|n", calls[0][1]['prompt'])
+        self.assertEqual(calls[1][0], ("two",))
+        self.assertNotIn('prompt', calls[1][1])
+
+        # a changed value is sent
+        self.char.traits.snapshot.return_value.HP.actual = 8
+        self.prompts.send(self.char, "three")
+        self.assertIn("HP: |g8|n", self.char.msg.call_args[1]['prompt'])
+
+        stats = self.prompts.stats
+        self.assertEqual((stats['sent'], stats['suppressed']), (2, 2))
+        self.assertEqual(stats['saved'], 2 * len(calls[0][1]['prompt']))
+        self.assertEqual(stats['sessions'], 1)
+
+    def test_idle(self):
+        """test the idle prompt replaces the combat prompt"""
+        self.prompts.send(self.char, "hit")
+        self.prompts.send(self.char, idle=True)
+        self.assertEqual(self.char.msg.call_args[1], {'prompt': ' '})
+        self.prompts.send(self.char, idle=True)
+        self.assertEqual(self.char.msg.call_count, 2)
+        self.prompts.send(self.char)
+        self.assertIn("HP:", self.char.msg.call_args[1]['prompt'])
+
+    def test_sessions(self):
+        """test new sessions get prompts and sessionless characters do not"""
+        self.prompts.send(self.char, "one")
+        self.char.sessions.all.return_value = [self.session, Session()]
+        self.prompts.send(self.char, "two")
+        self.assertIn('prompt', self.char.msg.call_args[1])
+
+        npc = self._character([])
+        self.prompts.send(npc, "one")
+        self.prompts.send(npc, idle=True)
+        npc.msg.assert_called_once_with("one")
+        self.assertFalse(npc.traits.snapshot.called)
+        self.assertEqual(self.prompts.stats['sent'], 2)
+        self.assertEqual(self.prompts.stats['suppressed'], 0)
@@ -0,0 +1,61 @@
+"""
+Unit tests for world.regen module.
+"""
+from mock import patch
+from evennia.utils.test_resources import EvenniaTest
+from typeclasses.characters import Character
+from utils.utils import sample_char
+from world.regen import RegenService
+
+
+class RegenServiceTestCase(EvenniaTest):
+    """Test case for the out-of-combat regen service."""
+    character_typeclass = Character
+
+    def setUp(self):
+        super(RegenServiceTestCase, self).setUp()
+        sample_char(self.char1, 'warrior', 'human', 'cunning')
+        sample_char(self.char2, 'warrior', 'human', 'cunning')
+        self.regen = RegenService(interval=6, slices=2)
+
+    @patch('world.regen.tickerhandler')
+    def test_registry(self, tickerhandler):
+        """test characters are spread over slices and tagged"""
+        self.regen.add(self.char1)
+        self.regen.add(self.char2)
+        self.regen.add(self.char1)
+        self.assertEqual(len(self.regen), 2)
+        self.assertEqual([len(s) for s in self.regen.slices], [1, 1])
+        self.assertTrue(self.char1.tags.get('regen', category='ainneve'))
+        # a single shared ticker
+        self.assertEqual(tickerhandler.add.call_count, 1)
+        self.assertEqual(tickerhandler.add.call_args[1]['interval'], 3)
+
+        self.regen.remove(self.char1)
+        self.assertNotIn(self.char1, self.regen)
+        self.assertFalse(self.char1.tags.get('regen', category='ainneve'))
+
+    @patch('world.regen.tickerhandler')
+    def test_tick(self, tickerhandler):
+        """test passes refill traits and skip full characters"""
+        self.regen.add(self.char1)
+        self.regen.add(self.char2)
+        for char in (self.char1, self.char2):
+            # mana gauges refill up to their max of 10
+            char.traits.BM.current = char.traits.BM.max
+            char.traits.WM.current = char.traits.WM.max
+        # a drained gauge alone makes a character need regenerating
+        self.char1.traits.MV.current = 0
+
+        self.assertEqual(self.regen.tick(), 1)
+        self.assertEqual(self.char1.traits.MV.current,
+                         self.char1.traits.MV.max)
+
+        self.regen.tick()
+        self.regen.tick()
+        stats = self.regen.stats
+        self.assertEqual(stats['passes'], 3)
+        self.assertEqual(stats['touched'], 1)
+        self.assertEqual(stats['skipped'], 2)
+        self.assertEqual(stats['registered'], 2)
+        self.assertEqual(sum(stats['recent']), 1)
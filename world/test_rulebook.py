@@ -2,7 +2,10 @@
 Unit tests for world.archetypes module.
 """
 
+import random
+from collections import deque
 from django.test import TestCase
+from mock import MagicMock, patch
 from world import rulebook
 
 
@@ -31,3 +34,226 @@ class DiceExpressionTestCase(TestCase):
         for roll in rolls:
             self.assertEqual(rulebook.roll_max(roll), rolls[roll])
 
+
+    def test_compile_roll(self):
+        """test compiled multi-term and keep-highest/lowest expressions"""
+        rolls = {'4d6k3': (18, 3, 12.24),
+                 '3d6kl2': (12, 2, 5.54),
+                 '2d20kh1': (20, 1, 13.825),
+                 '1d8+1d4-2': (10, 0, 5.0),
+                 '2d6-1d4+1': (12, -1, 5.5),
+                 '4d8+2-L': (26, 5, 17.86)}
+        for roll, (high, low, mean) in rolls.items():
+            compiled = rulebook.compile_roll(roll)
+            self.assertEqual(compiled.max(), high)
+            self.assertEqual(compiled.min(), low)
+            self.assertAlmostEqual(compiled.mean(), mean, places=2)
+            for _ in range(20):
+                self.assertTrue(low <= compiled.roll() <= high)
+        # compiled rolls are cached
+        self.assertIs(rulebook.compile_roll('4d6k3'),
+                      rulebook.compile_roll('4d6k3'))
+        self.assertEqual(len(rulebook.compile_roll('4d6k3').roll(total=False)), 3)
+        for roll in ('2d6 3', '4d6k5', '2d6-6L', '3'):
+            with self.assertRaises(rulebook.DiceRollError):
+                rulebook.compile_roll(roll)
+
+    def test_roll_many(self):
+        """test batched rolls with and without NumPy"""
+        for backend in (rulebook.numpy, None):
+            with patch('world.rulebook.numpy', backend):
+                rolls = rulebook.d_roll_many('4d6k3+1', 500)
+                self.assertEqual(len(rolls), 500)
+                self.assertTrue(all(4 <= roll <= 19 for roll in rolls))
+                self.assertEqual(rulebook.d_roll_many('1d1-2d1', 3), [-1, -1, -1])
+                rolls = rulebook.std_roll_many(500)
+                self.assertEqual(set(rolls), set(range(-5, 6)))
+                self.assertIsInstance(rolls[0], int)
+                self.assertEqual(rulebook.skill_check_many([11, -6], 5),
+                                 [True, False])
+
+    def test_seeded_rolls(self):
+        """test rolls drawn from a seeded stream are reproducible"""
+        def rolls(rng):
+            return ([rulebook.std_roll(rng) for _ in range(20)],
+                    rulebook.d_roll('3d6kl2+1', rng=rng),
+                    rulebook.d_roll_many('1d20', 100, rng=rng),
+                    rulebook.skill_check_many(range(10), rng=rng))
+        self.assertEqual(rolls(random.Random(42)), rolls(random.Random(42)))
+        self.assertNotEqual(rolls(random.Random(42)), rolls(random.Random(43)))
+
+    def test_probabilities(self):
+        """test exact roll distributions and check probabilities"""
+        self.assertAlmostEqual(sum(rulebook.STD_ROLL_TABLE.values()), 1.0)
+        self.assertAlmostEqual(rulebook.STD_ROLL_TABLE[0], 6 / 36.0)
+        self.assertAlmostEqual(rulebook.STD_ROLL_MIN2_TABLE[5], 1 / 36.0 ** 2)
+        dist = rulebook.roll_distribution('4d6k3')
+        self.assertEqual((min(dist), max(dist)), (3, 18))
+        self.assertAlmostEqual(dist[18], 21 / 1296.0)
+        self.assertAlmostEqual(sum(k * p for k, p in dist.items()),
+                               rulebook.compile_roll('4d6k3').mean())
+
+        check = rulebook.skill_check_probability
+        self.assertEqual(check(10, 5), 1.0)
+        self.assertEqual(check(-1, 5), 0.0)
+        self.assertAlmostEqual(check(5, 5), 21 / 36.0)
+        self.assertLess(check(5, 5, disadvantage=True), check(5, 5))
+        self.assertAlmostEqual(rulebook.hit_probability(5, 5), 15 / 36.0)
+        self.assertAlmostEqual(rulebook.expected_damage(5, 5), 35 / 36.0)
+        self.assertEqual(rulebook.expected_damage(0, 10), 0)
+
+
+class InitiativeTestCase(TestCase):
+    """Test case for initiative ordering in `resolve_combat`."""
+    def _handler(self, per, players):
+        handler = MagicMock()
+        handler.ndb.characters = {}
+        handler.ndb.action_count = {}
+        for cid, (value, has_player) in enumerate(zip(per, players), 1):
+            char = MagicMock()
+            char.traits.PER.actual = value
+            char.has_player = has_player
+            handler.ndb.characters[cid] = char
+            handler.ndb.action_count[cid] = 2
+        return handler
+
+    @patch('world.rulebook.process_next_action')
+    def test_turn_order(self, process_next_action):
+        """test initiative ties are broken deterministically"""
+        handler = self._handler([3] * 50, [True, False] * 25)
+        with patch('world.rulebook.std_roll', new=lambda rng=None: 0):
+            rulebook.resolve_combat(handler, random.Random(1))
+            order = handler.ndb.turn_order
+            # with equal rolls, NPCs act before PCs
+            self.assertEqual(sorted(order), range(1, 51))
+            self.assertTrue(all(cid % 2 == 0 for cid in order[:25]))
+            rulebook.resolve_combat(handler, random.Random(1))
+            self.assertEqual(handler.ndb.turn_order, order)
+
+        # higher initiative goes first
+        handler = self._handler([1, 9, 5], [True] * 3)
+        with patch('world.rulebook.std_roll', new=lambda rng=None: 0):
+            rulebook.resolve_combat(handler)
+        self.assertEqual(handler.ndb.turn_order, [2, 3, 1])
+        self.assertEqual(process_next_action.call_count, 3)
+
+        # remaining ties go to the lower initiative reroll
+        handler = self._handler([3, 3], [False] * 2)
+        rolls = iter([0, 5, 0, 1])
+        with patch('world.rulebook.std_roll',
+                   new=lambda rng=None: next(rolls)):
+            rulebook.resolve_combat(handler)
+        self.assertEqual(handler.ndb.turn_order, [2, 1])
+
+
+class ActionRegistryTestCase(TestCase):
+    """Test case for the combat action registry."""
+    def tearDown(self):
+        rulebook.ACTIONS.pop('taunt', None)
+
+    def test_parse_action(self):
+        """test action strings are parsed into registered switches"""
+        self.assertEqual(rulebook.parse_action('advance'), ('advance', ()))
+        self.assertEqual(rulebook.parse_action('advance/r'),
+                         ('advance', ('reach',)))
+        self.assertEqual(rulebook.parse_action('attack/s/bogus'),
+                         ('attack', ('subdue',)))
+        with self.assertRaises(rulebook.CombatActionError):
+            rulebook.parse_action('tackle')
+
+    def test_registered_actions(self):
+        """test all combat actions are registered with their defaults"""
+        for name in ('nothing', 'drop', 'get', 'equip', 'remove', 'attack',
+                     'kick', 'strike', 'advance', 'retreat', 'dodge', 'flee',
+                     'wrestle'):
+            self.assertIs(rulebook.ACTIONS[name].func,
+                          getattr(rulebook, '_do_' + name))
+        self.assertEqual(rulebook.ACTIONS['drop'].duration, 0)
+        self.assertEqual(rulebook.ACTIONS['kick'].ranges, ('melee',))
+        self.assertIsNone(rulebook.ACTIONS['advance'].ranges)
+
+    @patch('world.rulebook.COMBAT_CLOCK')
+    def test_plugin_action(self, clock):
+        """test actions registered elsewhere are dispatched"""
+        calls = []
+
+        @rulebook.combat_action('taunt', switches=('loud',), delay=0.5)
+        def taunt(st_remaining, character, target, args, rng=None):
+            calls.append((st_remaining, character, target, args))
+
+        char, target = MagicMock(), MagicMock()
+        handler = MagicMock()
+        handler.ndb.characters = {1: char, 2: target}
+        handler.ndb.turn_order = [1]
+        handler.ndb.actor_idx = 0
+        handler.ndb.subturn = 1
+        handler.ndb.actions_taken = {1: 0}
+        name, args = rulebook.parse_action('taunt/l')
+        handler.ndb.turn_actions = {1: deque([(name, char, target, 1, args)])}
+
+        rulebook.process_next_action(handler)
+        self.assertEqual(calls, [(0, char, target, ['loud'])])
+        clock.schedule.assert_called_once_with(
+            0.5 * rulebook.COMBAT_DELAY, handler,
+            rulebook.process_next_action, handler, None)
+
+    @patch('world.rulebook.COMBAT_CLOCK')
+    def test_action_ranges(self, clock):
+        """test an action's registered ranges are enforced as it resolves"""
+        calls = []
+
+        @rulebook.combat_action('grapple', duration=2, ranges=('melee',))
+        def grapple(st_remaining, character, target, args, rng=None):
+            calls.append(st_remaining)
+
+        char, target = MagicMock(id=1), MagicMock(id=2)
+        handler = MagicMock()
+        handler.ndb.characters = {1: char, 2: target}
+        handler.ndb.turn_order = [1]
+        handler.ndb.subturn = 1
+        handler.ndb.turn_actions = {1: deque([('grapple', char, target, 2, ())])}
+        handler.get_range.return_value = 'ranged'
+
+        # the first subturn runs at any range
+        handler.ndb.actor_idx = 0
+        handler.ndb.actions_taken = {1: 0}
+        rulebook.process_next_action(handler)
+        self.assertEqual(calls, [1])
+
+        # the resolving subturn is skipped out of range
+        handler.ndb.actor_idx = 0
+        handler.ndb.actions_taken = {1: 0}
+        rulebook.process_next_action(handler)
+        self.assertEqual(calls, [1])
+        handler.combat_msg.assert_called_once_with(
+            "{actor} is out of range to {action} {target}.",
+            actor=char, target=target, action='grapple')
+        del rulebook.ACTIONS['grapple']
+
+    @patch('world.rulebook.COMBAT_CLOCK')
+    @patch('world.rulebook.std_roll', new=lambda rng=None: 0)
+    def test_second_strike(self, clock):
+        """test a second strike rolls from the turn's random stream"""
+        char, target, rng = MagicMock(), MagicMock(), random.Random(1)
+        char.db.position = 'STANDING'
+        char.db.slots = ['wield1', 'wield2']
+        char.equip.get.return_value = None
+        char.traits.ATKU = 0
+        target.nattributes.has.return_value = False
+        target.traits.DEF = 1
+        target.traits.HP.actual = 10
+        handler = char.ndb.combat_handler
+        handler.ndb.characters = {target.id: target}
+        handler.get_range.return_value = 'melee'
+
+        rulebook._do_strike(1, char, target, [], rng)
+        clock.schedule.assert_called_once_with(
+            0.5 * rulebook.COMBAT_DELAY, handler, rulebook._second_strike,
+            char, target, ['end'], rng)
+
+        # the scheduled strike batches its trait writes
+        with patch('world.rulebook.batch_traits') as batch, \
+                patch('world.rulebook._do_strike') as strike:
+            rulebook._second_strike(char, target, ['end'], rng)
+        batch.assert_called_once_with(char, target)
+        strike.assert_called_once_with(0, char, target, ['end'], rng)
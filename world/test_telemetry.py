@@ -0,0 +1,73 @@
+"""
+Unit tests for the dice telemetry module.
+"""
+
+import random
+from django.test import TestCase
+from world import rulebook, telemetry
+
+
+class TelemetryTestCase(TestCase):
+    """Test case for dice telemetry."""
+    def tearDown(self):
+        telemetry.disable()
+
+    def test_chi_square(self):
+        """test chi-square p values"""
+        self.assertAlmostEqual(telemetry.chi2_sf(3.841, 1), 0.05, places=4)
+        self.assertAlmostEqual(telemetry.chi2_sf(18.307, 10), 0.05, places=4)
+        self.assertEqual(telemetry.chi2_sf(0, 3), 1.0)
+        # fair and loaded coins
+        self.assertGreater(
+            telemetry.chi_square([50, 50], [0.5, 0.5])[2], 0.99)
+        self.assertLess(
+            telemetry.chi_square([90, 10], [0.5, 0.5])[2], 0.001)
+        # too few counts to test
+        self.assertIsNone(telemetry.chi_square([2, 1], [0.5, 0.5]))
+
+    def test_histogram(self):
+        """test histograms count results and rotate windows"""
+        hist = telemetry.RollHistogram(rulebook.STD_ROLL_TABLE, 100)
+        rng = random.Random(1)
+        for _ in range(250):
+            hist.add(rulebook.std_roll(rng))
+        self.assertEqual(hist.rolls, 250)
+        self.assertEqual(sum(hist.previous), 100)
+        self.assertEqual(sum(hist.window), 50)
+        check = hist.check()
+        self.assertGreater(check['p'], telemetry.ALERT_P)
+        self.assertAlmostEqual(check['expected'], 0.0)
+        # impossible results fail the test outright
+        hist.add(6)
+        self.assertEqual(hist.check()['outliers'], 1)
+        self.assertEqual(hist.check()['p'], 0.0)
+
+    def test_record(self):
+        """test rolls are recorded by expression and call site"""
+        telemetry.enable(sample_every=1)
+        rng = random.Random(1)
+        for _ in range(10):
+            rulebook.d_roll('1d6+2', rng=rng)
+            rulebook.skill_check(3, rng=rng)
+        rulebook.d_roll('2d6', total=False, rng=rng)
+        stats = telemetry.TELEMETRY
+        self.assertEqual(sorted(stats.rolls), ['1d6+2', 'std_roll'])
+        self.assertEqual(stats.rolls['1d6+2'].rolls, 10)
+        # skill checks are attributed to the line making the check
+        sites = [site for site in stats.sites if site[0] == 'std_roll']
+        self.assertEqual(sites[0][2], 'test_record')
+
+        telemetry.disable()
+        rulebook.std_roll()
+        self.assertEqual(stats.rolls['std_roll'].rolls, 10)
+
+    def test_sampling(self):
+        """test sampling counts a share of rolls made in any order"""
+        telemetry.enable(sample_every=4)
+        for _ in range(4000):
+            rulebook.d_roll('1d4')
+            rulebook.std_roll()
+        stats = telemetry.TELEMETRY
+        for key in ('1d4', 'std_roll'):
+            self.assertGreater(stats.rolls[key].rolls, 800)
+            self.assertLess(stats.rolls[key].rolls, 1200)
@@ -3,6 +3,7 @@ Unit test module for Trait classes.
 """
 
 from django.test import TestCase
+from mock import patch
 from evennia.utils.test_resources import EvenniaTest
 from .traits import *
 
@@ -393,6 +394,22 @@ class GaugeTraitTestCase(TestCase):
         self.check_trait(50, 0, 75, 75, 0, None)
         self.assertEqual(self.trait.percent(), '150.0%')
 
+    def test_actual_cache(self):
+        """cached `actual` is invalidated by property setters"""
+        self.assertEqual(self.trait.actual, 10)
+        self.assertEqual(self.trait._actual, 10)
+        self.trait.current -= 4
+        self.assertIsNone(self.trait._actual)
+        self.check_trait(10, 0, 6, 6, 0, 10)
+        self.trait.max = 20
+        self.trait.current = 15
+        self.check_trait(10, 0, 15, 15, 0, 20)
+        self.trait.mod = 3
+        self.check_trait(10, 3, 18, 18, 0, 20)
+        self.trait.min = 5
+        self.trait.current = 0
+        self.check_trait(10, 3, 5, 5, 5, 20)
+
 
 class TraitFactoryTestCase(EvenniaTest):
     """Test case for the TraitHandler class."""
@@ -496,3 +513,298 @@ class TraitFactoryTestCase(EvenniaTest):
         self.assertEqual(hp.min, 0)
         self.assertEqual(hp.max, 0)
         self.assertEqual(hp.extra, [])
+
+    def test_trait_classes(self):
+        """check that each trait type loads as its specialized class"""
+        self.traits.add(
+            key='str', name='Strength', type='static')
+        self.traits.add(
+            key='bonus', name='Bonus', type='counter')
+        self.traits.add(
+            key='hp', name='HP', type='gauge')
+
+        self.assertIsInstance(self.traits.str, StaticTrait)
+        self.assertIsInstance(self.traits.bonus, CounterTrait)
+        self.assertIsInstance(self.traits.hp, GaugeTrait)
+        # direct instantiation dispatches on type as well
+        self.assertIsInstance(Trait({'name': 'HP', 'type': 'gauge'}),
+                              GaugeTrait)
+        # slotted classes keep extra data out of the instance
+        self.assertFalse(hasattr(self.traits.hp, '__dict__'))
+        self.traits.hp.note = 'extra'
+        self.assertEqual(self.traits.hp.extra, ['note'])
+
+    def test_batch(self):
+        """trait changes in a batch scope are written once on exit"""
+        self.traits.add(
+            key='hp', name='HP', type='gauge', base=10)
+        hp = self.traits.hp
+
+        # scopes that only read traits copy nothing
+        with self.traits.batch():
+            hp.current
+            self.assertIsNone(self.traits._batch_saved)
+
+        with self.traits.batch():
+            self.assertTrue(self.traits.batching)
+            hp.current -= 3
+            with self.traits.batch():
+                hp.current -= 2
+            # nested scopes do not write
+            self.assertTrue(self.traits.batching)
+            self.assertNotIn('current',
+                             self.char1.attributes.get('traits')['hp'])
+            self.assertEqual(hp.current, 5)
+
+        self.assertFalse(self.traits.batching)
+        self.assertEqual(
+            self.char1.attributes.get('traits')['hp']['current'], 5)
+        self.assertEqual(self.traits.hp.current, 5)
+        self.assertIs(self.traits.hp, hp)
+
+    def test_snapshot(self):
+        """test immutable trait value snapshots and version counter"""
+        self.traits.add(
+            key='str', name='Strength', type='static', base=5)
+        self.traits.add(
+            key='hp', name='HP', type='gauge', base=10)
+
+        snap = self.traits.snapshot()
+        self.assertEqual(len(snap), 2)
+        self.assertEqual(snap['str'].actual, 5)
+        self.assertIs(snap.str.max, None)
+        self.assertEqual(snap.hp, (10, 10, 10, 0, 10))
+        self.assertEqual("{tr.hp.actual}/{tr.hp.max}".format(tr=snap), '10/10')
+        with self.assertRaises(TypeError):
+            snap.hp = 5
+        # unchanged handler returns the cached snapshot
+        self.assertIs(self.traits.snapshot(), snap)
+
+        version = self.traits.version
+        self.traits.hp.current -= 4
+        self.assertGreater(self.traits.version, version)
+        new_snap = self.traits.snapshot()
+        self.assertIsNot(new_snap, snap)
+        self.assertEqual(new_snap.hp.actual, 6)
+        self.assertEqual(snap.hp.actual, 10)
+        # subsets of keys
+        self.assertEqual(list(self.traits.snapshot(['hp'])), ['hp'])
+
+    def test_modifiers(self):
+        """test named, stackable and timed modifiers"""
+        self.traits.add(
+            key='def', name='Defense', type='static', base=5)
+
+        # the modifier attribute is created with the first modifier
+        self.assertEqual(self.traits.get_mods(), [])
+        self.assertEqual(self.traits.remove_mod('def', 'shield'), 0)
+        self.assertFalse(self.char1.attributes.has('traits_mods'))
+        self.traits.add_mod('def', 'shield', 2)
+        self.assertTrue(self.char1.attributes.has('traits_mods'))
+        self.assertEqual(self.traits['def'].actual, 7)
+        # re-applying a non-stacking modifier refreshes it
+        self.traits.add_mod('def', 'shield', 3)
+        self.assertEqual(self.traits['def'].actual, 8)
+        self.assertEqual(len(self.traits.get_mods('def')), 1)
+        # stacking modifiers
+        self.traits.add_mod('def', 'bless', 1, stacks=2)
+        self.traits.add_mod('def', 'bless', 1, stacks=2)
+        self.traits.add_mod('def', 'bless', 1, stacks=2)
+        self.assertEqual(self.traits['def'].actual, 10)
+        self.assertEqual(self.traits.remove_mod('def', 'bless'), 2)
+        self.assertEqual(self.traits['def'].actual, 8)
+        self.assertEqual(self.traits.remove_mod('def', 'shield'), 1)
+        self.assertEqual(self.traits['def'].actual, 5)
+        self.assertEqual(self.traits.get_mods(), [])
+
+    def test_timed_modifiers(self):
+        """test expiry of timed modifiers through the scheduler"""
+        self.traits.add(
+            key='def', name='Defense', type='static', base=5)
+        scheduler = ModifierScheduler()
+        with patch('world.traits.MODIFIER_SCHEDULER', scheduler), \
+                patch('world.traits.utils.delay') as delay:
+            short = self.traits.add_mod('def', 'haste', 1, duration=5)
+            self.traits.add_mod('def', 'shield', 2, duration=50)
+            self.assertEqual(self.traits['def'].actual, 8)
+            self.assertEqual(len(scheduler), 2)
+            # timer is armed for the earliest expiry
+            wait, callback, at = delay.call_args[0]
+            self.assertLessEqual(wait, 5)
+            # removing early leaves a stale heap entry that is skipped
+            self.traits.remove_mod('def', 'haste')
+            callback(at)
+            self.assertEqual(len(scheduler), 1)
+            self.assertEqual(self.traits['def'].actual, 7)
+            # fire the remaining deadline
+            wait, callback, at = delay.call_args[0]
+            callback(at)
+            self.assertEqual(len(scheduler), 0)
+            self.assertEqual(self.traits['def'].actual, 5)
+
+    def test_scheduler_start(self):
+        """test timed modifiers are rescheduled when the server starts"""
+        self.traits.add(
+            key='def', name='Defense', type='static', base=5)
+        with patch('world.traits.utils.delay'):
+            self.traits.add_mod('def', 'haste', 1, duration=5)
+        self.assertTrue(self.char1.tags.get('timed_mods', category='ainneve'))
+
+        scheduler = ModifierScheduler()
+        with patch('world.traits.MODIFIER_SCHEDULER', scheduler), \
+                patch('world.traits.utils.delay'), \
+                patch('evennia.utils.search.search_tag',
+                      return_value=[self.char1]), \
+                patch('world.traits.get_trait_handlers',
+                      new=lambda obj: [TraitHandler(obj)]):
+            scheduler.start()
+            self.assertEqual(len(scheduler), 1)
+            # objects whose timed modifiers are all gone are untagged
+            self.traits.remove_mod('def', 'haste')
+            scheduler.start()
+        self.assertFalse(self.char1.tags.get('timed_mods', category='ainneve'))
+
+    def test_derived(self):
+        """test derived traits are recalculated only when stale"""
+        self.traits.add(
+            key='vit', name='Vitality', type='static', base=5)
+        self.traits.add(
+            key='hp', name='HP', type='gauge', base=5)
+        self.traits.add(
+            key='regen', name='Regeneration', type='static')
+        self.traits.add(
+            key='str', name='Strength', type='static', base=3)
+        calls = []
+
+        def hp_formula(tr):
+            calls.append('hp')
+            return tr.vit.actual * 2
+
+        self.traits.derive('hp', hp_formula, ['vit'])
+        self.traits.derive('regen', lambda tr: tr.hp.base // 5, ['hp'],
+                           eager=True)
+        # definitions alone do not recalculate
+        self.assertEqual(self.traits.hp.base, 5)
+        # unrelated changes do not recalculate
+        self.traits.str.base += 1
+        self.assertEqual(self.traits.hp.base, 5)
+        self.assertEqual(calls, [])
+        # eager dependents recalculate on write, through the chain
+        self.traits.vit.base += 1
+        self.assertEqual(calls, ['hp'])
+        self.assertEqual(self.traits.regen.base, 2)
+        self.assertEqual(self.traits.hp.base, 12)
+        self.assertEqual(calls, ['hp'])
+        # cycles are rejected
+        with self.assertRaises(TraitException):
+            self.traits.derive('vit', lambda tr: tr.regen.actual, ['regen'])
+        self.traits.underive('hp')
+        self.traits.vit.base += 1
+        self.assertEqual(self.traits.hp.base, 12)
+
+    def test_observers(self):
+        """test change callbacks are coalesced per tick"""
+        self.traits.add(
+            key='hp', name='HP', type='gauge', base=10)
+        self.traits.add(
+            key='str', name='Strength', type='static', base=5)
+        hp_calls, all_calls = [], []
+        self.traits.hp.subscribe(
+            lambda key, old, new: hp_calls.append((key, old, new)))
+        self.traits.subscribe(
+            lambda key, old, new: all_calls.append(key))
+
+        with patch('world.traits.utils.delay') as delay:
+            self.traits.hp.current -= 3
+            self.traits.hp.current -= 2
+            self.traits.str.mod += 1
+            self.traits.str.mod -= 1
+            # one notification is scheduled for the tick
+            self.assertEqual(delay.call_count, 1)
+            self.assertEqual(hp_calls, [])
+            delay.call_args[0][1]()
+
+        self.assertEqual(len(hp_calls), 1)
+        key, old, new = hp_calls[0]
+        self.assertEqual((key, old.current, new.current), ('hp', 10, 5))
+        # restored values are not reported
+        self.assertEqual(all_calls, ['hp'])
+
+    def test_template(self):
+        """test template-backed handlers store only changed values"""
+        register_template('test', {
+            'str': {'name': 'Strength', 'type': 'static', 'base': 5},
+            'hp': {'name': 'HP', 'type': 'gauge', 'base': 10},
+        })
+        traits = TraitHandler(self.char2, template='test')
+        store = self.char2.attributes.get('traits')
+        self.assertEqual(set(traits.all), set(['str', 'hp']))
+        self.assertEqual(traits.str.actual, 5)
+        self.assertEqual(len(store), 0)
+
+        traits.hp.current -= 4
+        traits.str.note = 'strong'
+        self.assertEqual(traits.hp.actual, 6)
+        self.assertEqual(dict(store['hp']), {'current': 6})
+        self.assertEqual(TRAIT_TEMPLATES['test']['str']['extra'], {})
+        # other handlers still read the template values
+        other = TraitHandler(self.char1, template='test')
+        self.assertEqual(other.hp.actual, 10)
+        self.assertNotIn('note', other.str.extra)
+
+        with traits.batch():
+            traits.hp.current += 1
+        self.assertEqual(traits.hp.actual, 7)
+        self.assertEqual(self.char2.attributes.get('traits')['hp']['current'], 7)
+
+        traits.remove('str')
+        self.assertEqual(traits.all, ['hp'])
+        traits.add('str', 'Strength', base=8)
+        self.assertEqual(traits.str.actual, 8)
+        with self.assertRaises(TraitException):
+            TraitHandler(self.char1, db_attribute='skills', template='none')
+
+    def test_npc_rows(self):
+        """test a template NPC stores only its trait deltas"""
+        from evennia.utils import create
+        from typeclasses.characters import NPC
+        npc = create.create_object(NPC, key='Mob', location=self.room1)
+        self.assertEqual(npc.traits.HP.actual, npc.traits.HP.base)
+        self.assertEqual(npc.skills.escape.actual, npc.skills.escape.base)
+        npc.traits.HP.base += 5
+
+        self.assertEqual(list(npc.attributes.get('traits')), ['HP'])
+        self.assertEqual(len(npc.attributes.get('skills')), 0)
+        self.assertFalse(npc.attributes.has('traits_mods'))
+        self.assertFalse(npc.attributes.has('skills_mods'))
+
+    def test_compact(self):
+        """test compact trait records and migration of dict data"""
+        register_names({'str': 'Strength'})
+        self.traits.add(
+            key='str', name='Strength', type='static', base=5)
+        self.traits.add(
+            key='hp', name='Health', type='gauge', base=10)
+        self.traits.hp.current -= 2
+
+        traits = TraitHandler(self.char1, compact=True)
+        store = self.char1.attributes.get('traits')
+        self.assertEqual(list(store['str']), [0, None, 5, 0, None, None, None, None])
+        self.assertEqual(list(store['hp']), [2, 'Health', 10, 0, 0, 'base', 8, None])
+        self.assertEqual(traits.str.name, 'Strength')
+        self.assertEqual(traits.hp.actual, 8)
+
+        traits.hp.mod += 2
+        traits.hp.current += 1
+        traits.str.note = 'strong'
+        self.assertEqual(traits.hp.actual, 11)
+        self.assertEqual(store['hp'][3], 2)
+        self.assertEqual(dict(store['str'][-1]), {'note': 'strong'})
+        traits.add('pp', 'Power Points', type='counter', min=0)
+        self.assertEqual(traits.pp.actual, 0)
+        with traits.batch():
+            traits.pp.current += 2
+        self.assertEqual(traits.pp.actual, 2)
+        self.assertEqual(self.char1.attributes.get('traits')['pp'][6], 2)
+        # already compact data is loaded as-is
+        self.assertEqual(TraitHandler(self.char1, compact=True).hp.actual, 11)
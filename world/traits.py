@@ -38,8 +38,10 @@ Example:
 
     * Gauge - Modified counter type modeling a refillable "gauge".
 
-    All traits have a read-only `actual` property that will report the trait's
-    actual value.
+    Each type is implemented by its own `Trait` subclass (`StaticTrait`,
+    `CounterTrait` and `GaugeTrait`), selected from the persisted 'type'
+    key when the trait is loaded. All traits have a read-only `actual`
+    property that will report the trait's actual value.
 
     Example:
 
@@ -49,6 +51,14 @@ Example:
         100
         ```
 
+    Named modifiers may also be applied through the `TraitHandler` with
+    `add_mod()`, optionally with a duration after which they are removed
+    again; see `TraitHandler.add_mod` for details.
+
+    Callbacks registered with `subscribe()` on a `Trait` or on the
+    `TraitHandler` are notified after trait values change, at most once
+    per trait per reactor tick; see `TraitHandler.subscribe`.
+
     They also support storing arbitrary data via either dictionary key or
     attribute syntax. Storage of arbitrary data in this way has the same
     constraints as any nested collection type stored in a persistent Evennia
@@ -214,12 +224,29 @@ Example:
             ```
 """
 
+from collections import Mapping, MutableMapping, namedtuple
+from contextlib import contextmanager
+from heapq import heappush, heappop
+from itertools import count
+from time import time
 from evennia.utils.dbserialize import _SaverDict
-from evennia.utils import logger, lazy_property
+from evennia.utils import logger, lazy_property, utils
 from functools import total_ordering
 
 TRAIT_TYPES = ('static', 'counter', 'gauge')
 RANGE_TRAITS = ('counter', 'gauge')
+# names of the `TraitHandler` properties that hold trait data
+TRAIT_HANDLERS = ('traits', 'skills')
+# tag of objects saved with timed modifiers; see `ModifierScheduler.start`
+TIMED_MODS_TAG = ('timed_mods', 'ainneve')
+# shared trait data for template-backed handlers; see `register_template`
+TRAIT_TEMPLATES = {}
+# shared trait names for compact handlers; see `register_names`
+TRAIT_NAMES = {}
+# field order of compact trait records
+_COMPACT_FIELDS = ('type', 'name', 'base', 'mod', 'min', 'max',
+                   'current', 'extra')
+_COMPACT_INDEX = dict((f, i) for i, f in enumerate(_COMPACT_FIELDS))
 
 
 class TraitException(Exception):
@@ -232,19 +259,413 @@ class TraitException(Exception):
         self.msg = msg
 
 
+class _BatchDict(dict):
+    """In-memory trait data used while a `TraitHandler` is batching."""
+    pass
+
+
+# types returned as-is by `_plain_copy` without further checks
+_SCALAR_TYPES = frozenset((int, long, float, bool, str, unicode, type(None)))
+
+
+def _plain_copy(data):
+    """Recursively copies persistent collections into plain Python types."""
+    if type(data) in _SCALAR_TYPES:
+        return data
+    elif hasattr(data, 'items'):
+        return dict((k, _plain_copy(v)) for k, v in data.items())
+    elif isinstance(data, tuple):
+        return tuple(_plain_copy(v) for v in data)
+    elif hasattr(data, 'isdisjoint'):
+        return set(_plain_copy(v) for v in data)
+    elif hasattr(data, '__iter__') and not isinstance(data, basestring):
+        return [_plain_copy(v) for v in data]
+    return data
+
+
+def register_template(name, traits):
+    """Registers shared trait data for template-backed `TraitHandler`s.
+
+    Handlers created with `template=name` read unchanged values from
+    the template and persist only the values changed on each object.
+    Templates are held in memory and must not be modified once any
+    handler uses them.
+
+    Args:
+        name (str): template name
+        traits (dict): trait key to trait data mapping, as passed to
+            `TraitHandler.add`
+    """
+    template = {}
+    for key, data in traits.items():
+        data = _plain_copy(data)
+        _TRAIT_CLASSES.get(data.get('type'), StaticTrait)._normalize(data)
+        template[key] = data
+    TRAIT_TEMPLATES[name] = template
+
+
+class _TemplateTraits(MutableMapping):
+    """Trait data mapping of a template-backed `TraitHandler`.
+
+    The persisted `store` holds, per trait key, either a full trait
+    dict (traits added after creation), a dict of values changed from
+    the template, or None for template traits that were removed.
+    """
+    def __init__(self, store, template):
+        self.store = store
+        self.template = template
+
+    def __contains__(self, key):
+        if key in self.store:
+            return self.store[key] is not None
+        return key in self.template
+
+    def __getitem__(self, key):
+        data = self.store.get(key)
+        if data is not None and 'type' in data:
+            return data
+        if key not in self or key not in self.template:
+            raise KeyError(key)
+        return _TemplateData(self.store, key, self.template[key])
+
+    def __setitem__(self, key, value):
+        self.store[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        if key in self.template:
+            self.store[key] = None
+        else:
+            del self.store[key]
+
+    def __iter__(self):
+        for key in self.template:
+            if key in self:
+                yield key
+        for key in self.store:
+            if key not in self.template and key in self:
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class _TemplateData(MutableMapping):
+    """Data of one template trait; writes are stored as deltas."""
+    def __init__(self, store, key, template):
+        self.store = store
+        self.key = key
+        self.template = template
+
+    def __getitem__(self, field):
+        delta = self.store.get(self.key)
+        if delta and field in delta:
+            return delta[field]
+        return self.template[field]
+
+    def __setitem__(self, field, value):
+        if self.store.get(self.key) is None:
+            self.store[self.key] = {}
+        self.store[self.key][field] = value
+
+    def __delitem__(self, field):
+        delta = self.store.get(self.key)
+        if delta and field in delta:
+            del delta[field]
+        else:
+            raise KeyError(field)
+
+    def __iter__(self):
+        delta = self.store.get(self.key) or {}
+        return iter(set(self.template) | set(delta))
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+def register_names(names):
+    """Registers shared trait names for compact `TraitHandler`s.
+
+    Compact records of traits whose name matches the registered name
+    for their key store None in its place.
+
+    Args:
+        names (dict): trait key to trait name mapping
+    """
+    TRAIT_NAMES.update(names)
+
+
+def _compact(key, data):
+    """Encodes trait data as a compact record list."""
+    data = _plain_copy(data)
+    _TRAIT_CLASSES.get(data.get('type'), StaticTrait)._normalize(data)
+    record = [data.get(f) for f in _COMPACT_FIELDS]
+    record[0] = TRAIT_TYPES.index(data['type'])
+    if TRAIT_NAMES.get(key) == data['name']:
+        record[1] = None
+    if not data['extra']:
+        record[-1] = None
+    return record
+
+
+class _CompactTraits(MutableMapping):
+    """Trait data mapping of a compact `TraitHandler`.
+
+    The persisted `store` holds a record list per trait key, laid out
+    as `_COMPACT_FIELDS`, with the type as its index in `TRAIT_TYPES`.
+    A None name, current or extra means the registered name, no
+    current value or no extra data.
+    """
+    def __init__(self, store):
+        self.store = store
+
+    def __contains__(self, key):
+        return key in self.store
+
+    def __getitem__(self, key):
+        return _CompactData(key, self.store[key])
+
+    def __setitem__(self, key, value):
+        self.store[key] = _compact(key, value)
+
+    def __delitem__(self, key):
+        del self.store[key]
+
+    def __iter__(self):
+        return iter(self.store)
+
+    def __len__(self):
+        return len(self.store)
+
+
+class _CompactData(MutableMapping):
+    """Dict interface to one compact trait record."""
+    def __init__(self, key, record):
+        self.key = key
+        self.record = record
+
+    def __getitem__(self, field):
+        value = self.record[_COMPACT_INDEX[field]]
+        if field == 'type':
+            return TRAIT_TYPES[value]
+        if value is None:
+            if field == 'name':
+                return TRAIT_NAMES[self.key]
+            elif field == 'current':
+                raise KeyError(field)
+            elif field == 'extra':
+                return {}
+        return value
+
+    def __setitem__(self, field, value):
+        if field not in _COMPACT_INDEX:
+            raise TraitException(
+                "Compact trait data has no field {!r}.".format(field))
+        if field == 'type':
+            value = TRAIT_TYPES.index(value)
+        elif field == 'name' and TRAIT_NAMES.get(self.key) == value:
+            value = None
+        self.record[_COMPACT_INDEX[field]] = value
+
+    def __delitem__(self, field):
+        if field != 'current' or self.record[-2] is None:
+            raise KeyError(field)
+        self.record[-2] = None
+
+    def __iter__(self):
+        return (f for f in _COMPACT_FIELDS
+                if f != 'current' or self.record[-2] is not None)
+
+    def __len__(self):
+        return len(list(iter(self)))
+
+
+def get_trait_handlers(obj):
+    """Returns the `TraitHandler` properties present on an object.
+
+    Args:
+        obj (Object): any typeclassed object
+
+    Returns:
+        (list[TraitHandler]): handlers found under the `TRAIT_HANDLERS` names
+    """
+    handlers = []
+    for name in TRAIT_HANDLERS:
+        handler = getattr(obj, name, None)
+        if isinstance(handler, TraitHandler):
+            handlers.append(handler)
+    return handlers
+
+
+@contextmanager
+def batch_traits(*objs):
+    """Batches trait writes for several objects in one scope.
+
+    All `TraitHandler`s on the given objects keep their changes in
+    memory until the scope exits, then write once each.
+
+    Example:
+        ```python
+        with batch_traits(attacker, defender):
+            defender.traits.HP.current -= damage
+            attacker.traits.PP.current += roll
+        ```
+    """
+    handlers = [h for obj in objs for h in get_trait_handlers(obj)]
+    for handler in handlers:
+        handler.start_batch()
+    try:
+        yield
+    finally:
+        for handler in handlers:
+            handler.end_batch()
+
+
+class ModifierScheduler(object):
+    """Global scheduler for the expiry of timed trait modifiers.
+
+    Pending expiries from every `TraitHandler` are kept in a single
+    min-heap, and only one reactor timer is armed at a time, for the
+    earliest deadline. Adding or expiring a modifier costs O(log n)
+    in the number of active timed modifiers.
+
+    Entries are never removed from the heap early; a modifier removed
+    before its expiry is skipped when its entry comes due.
+
+    Objects with timed modifiers are tagged, so `start()` reschedules
+    them when the server starts, whether or not their traits are used.
+    """
+    def __init__(self):
+        self._heap = []
+        self._seq = count()
+        self._timer = None
+        self._timer_at = None
+
+    def __len__(self):
+        """Return number of pending expiries."""
+        return len(self._heap)
+
+    def start(self):
+        """Reschedules the timed modifiers of every tagged object."""
+        from evennia.utils.search import search_tag
+        for obj in search_tag(*TIMED_MODS_TAG):
+            # handlers schedule their timed modifiers when created
+            handlers = get_trait_handlers(obj)
+            if not any(mod['expires'] is not None
+                       for handler in handlers
+                       for mod in handler._mods['active'].values()):
+                obj.tags.remove(*TIMED_MODS_TAG)
+
+    def schedule(self, expires, handler, mod_id):
+        """Schedules a modifier to expire.
+
+        Args:
+            expires (float): unix timestamp of the expiry
+            handler (TraitHandler): handler holding the modifier
+            mod_id (int): id of the modifier in `handler`
+        """
+        heappush(self._heap, (expires, next(self._seq), handler, mod_id))
+        if self._timer_at is None or expires < self._timer_at:
+            self._arm()
+
+    def _arm(self):
+        """(Re)arms the reactor timer for the earliest pending expiry."""
+        timer = self._timer
+        if timer is not None and hasattr(timer, 'active') and timer.active():
+            timer.cancel()
+        self._timer = self._timer_at = None
+        if self._heap:
+            at = self._timer_at = self._heap[0][0]
+            self._timer = utils.delay(max(0, at - time()), self._fire, at)
+
+    def _fire(self, at):
+        """Timer callback; expires every modifier due at time `at`."""
+        if at != self._timer_at:
+            # superseded by an earlier deadline
+            return
+        self._timer = self._timer_at = None
+        now = max(time(), at)
+        while self._heap and self._heap[0][0] <= now:
+            _, _, handler, mod_id = heappop(self._heap)
+            try:
+                handler._expire_mod(mod_id)
+            except Exception:
+                logger.log_trace()
+        self._arm()
+
+
+MODIFIER_SCHEDULER = ModifierScheduler()
+
+
 class TraitHandler(object):
     """Factory class that instantiates Trait objects.
 
     Args:
         obj (Object): parent Object typeclass for this TraitHandler
         db_attribute (str): name of the DB attribute for trait data storage
+        template (str, optional): name of a template registered with
+            `register_template`. Template traits are present on the
+            object without being stored; only values changed from the
+            template are saved in `db_attribute`.
+        compact (bool): store each trait as a positional record list
+            rather than a dict; see `register_names`. Dict data already
+            stored is converted when the handler is created.
+
+    Note:
+        By default every change to a trait is saved to the database
+        immediately. Within a batch scope (see `batch()`), changes
+        are kept in memory and the attribute is written at most once,
+        when the outermost scope exits. Unless it is held (see
+        `start_batch`), a scope may not outlive the reactor tick it
+        was opened in; an abandoned scope is closed and flushed
+        automatically.
     """
-    def __init__(self, obj, db_attribute='traits'):
+    def __init__(self, obj, db_attribute='traits', template=None,
+                 compact=False):
         if not obj.attributes.has(db_attribute):
             obj.attributes.add(db_attribute, {})
 
-        self.attr_dict = obj.attributes.get(db_attribute)
+        self.obj = obj
+        self.db_attribute = db_attribute
         self.cache = {}
+        if template is not None:
+            if template not in TRAIT_TEMPLATES:
+                raise TraitException(
+                    "Trait template not found: {}".format(template))
+            if compact:
+                raise TraitException(
+                    "Template-backed traits cannot be compact.")
+            template = TRAIT_TEMPLATES[template]
+            self._view = lambda store: _TemplateTraits(store, template)
+        elif compact:
+            self._view = _CompactTraits
+            self._migrate_compact()
+        else:
+            self._view = None
+        self._bind(obj.attributes.get(db_attribute))
+        self._batch_depth = 0
+        self._batch_saved = None
+        self._batch_held = False
+        self._version = 0
+        self._snapshots = {}
+        # derived trait definitions and dependency graph
+        self._derived = {}
+        self._dependents = {}
+        self._stale = set()
+        # change observers; see `subscribe()`
+        self._observers = {}
+        self._observed = {}
+        self._pending = set()
+
+        # timed and named modifiers are kept in their own attribute, which
+        # is only created by the first `add_mod`
+        self._mods_attribute = '{}_mods'.format(db_attribute)
+        self._mods = obj.attributes.get(self._mods_attribute,
+                                        default={'seq': 0, 'active': {}})
+        for mod_id, mod in self._mods['active'].items():
+            if mod['expires'] is not None:
+                MODIFIER_SCHEDULER.schedule(mod['expires'], self, mod_id)
 
     def __len__(self):
         """Return number of Traits in 'attr_dict'."""
@@ -252,7 +673,7 @@ class TraitHandler(object):
 
     def __setattr__(self, key, value):
         """Returns error message if trait objects are assigned directly."""
-        if key in ('attr_dict', 'cache'):
+        if key in _HANDLER_ATTRS:
             super(TraitHandler, self).__setattr__(key, value)
         else:
             raise TraitException(
@@ -287,7 +708,12 @@ class TraitHandler(object):
             if trait not in self.attr_dict:
                 return None
             data = self.attr_dict[trait]
-            self.cache[trait] = Trait(data)
+            trait_class = _TRAIT_CLASSES.get(data.get('type'), StaticTrait)
+            self.cache[trait] = trait_class(data)
+            self.cache[trait]._handler = self
+            self.cache[trait]._key = trait
+        if trait in self._stale:
+            self._refresh(trait)
         return self.cache[trait]
 
     def add(self, key, name, type='static',
@@ -306,8 +732,12 @@ class TraitHandler(object):
                 trait.update(dict(min=min))
             if max:
                 trait.update(dict(max=max))
+            self._before_write()
+            if self._batch_saved is not None:
+                trait = _BatchDict(trait)
 
             self.attr_dict[key] = trait
+            self._version += 1
         else:
             raise TraitException("Invalid trait type specified.")
 
@@ -316,9 +746,17 @@ class TraitHandler(object):
         if trait not in self.attr_dict:
             raise TraitException("Trait not found: {}".format(trait))
 
+        self._before_write()
         if trait in self.cache:
             del self.cache[trait]
         del self.attr_dict[trait]
+        self._version += 1
+
+        for mod_id in [i for i, mod in self._mods['active'].items()
+                       if mod['trait'] == trait]:
+            del self._mods['active'][mod_id]
+        self._observed.pop(trait, None)
+        self._pending.discard(trait)
 
     def clear(self):
         """Remove all Traits from the handler's parent object."""
@@ -330,14 +768,463 @@ class TraitHandler(object):
         """Return a list of all trait keys in this TraitHandler."""
         return self.attr_dict.keys()
 
+    @property
+    def version(self):
+        """Counter incremented whenever a trait value in the handler changes."""
+        return self._version
+
+    def snapshot(self, keys=None):
+        """Returns an immutable view of trait values.
+
+        Values of every requested trait are read in a single pass. The
+        snapshot is cached, and the same object is returned by later
+        calls until a trait in the handler changes, so callers may
+        compare `version` (or identity) to skip re-rendering.
+
+        Args:
+            keys (iterable[str], optional): trait keys to include; all
+                traits if None
+
+        Returns:
+            (TraitSnapshot): mapping of trait key to `TraitValues`
+
+        Example:
+            ```python
+            >>> tr = char.traits.snapshot(('HP', 'SP'))
+            >>> "HP: {tr.HP.actual} / {tr.HP.max}".format(tr=tr)
+            'HP: 8 / 10'
+            ```
+        """
+        keys = tuple(self.attr_dict.keys() if keys is None else keys)
+        snap = self._snapshots.get(keys)
+        if snap is not None and snap.version == self._version:
+            return snap
+
+        values = {}
+        for key in keys:
+            if key in self.attr_dict:
+                values[key] = self._values(key)
+        if len(self._snapshots) > 8:
+            self._snapshots.clear()
+        snap = self._snapshots[keys] = TraitSnapshot(values, self._version)
+        return snap
+
+    # Derived traits
+
+    def derive(self, key, formula, depends, field='base', eager=False):
+        """Declares a trait whose value is calculated from other traits.
+
+        Whenever one of the `depends` traits changes, the derived trait
+        is marked stale, along with anything derived from it in turn.
+        Stale traits are recalculated the next time they are read, or
+        immediately if `eager` is True; traits unaffected by a change
+        are never recalculated. Definitions are held in memory only
+        and are typically registered when the handler is created.
+
+        Args:
+            key (str): key of the derived trait
+            formula (callable): called with this handler as its only
+                argument; returns the new value, or None to leave the
+                trait unchanged
+            depends (iterable[str]): keys of the traits `formula` reads
+            field (str): trait property the result is assigned to
+            eager (bool): recalculate on write instead of on read
+
+        Example:
+            ```python
+            >>> char.traits.derive('HP', lambda tr: tr.VIT.actual, ('VIT',))
+            >>> char.traits.VIT.base += 1
+            >>> char.traits.HP.base
+            7
+            ```
+        """
+        depends = tuple(depends)
+        # reject definitions that would introduce a cycle
+        pending, seen = [key], set()
+        while pending:
+            current = pending.pop()
+            if current in depends:
+                raise TraitException(
+                    "Derived trait '{}' would depend on itself.".format(key))
+            seen.add(current)
+            pending.extend(d for d in self._dependents.get(current, ())
+                           if d not in seen)
+
+        self.underive(key)
+        self._derived[key] = (formula, depends, field, eager)
+        for dep in depends:
+            self._dependents.setdefault(dep, set()).add(key)
+
+    def underive(self, key):
+        """Removes a derived trait definition; the trait itself is kept."""
+        if key in self._derived:
+            for dep in self._derived.pop(key)[1]:
+                self._dependents[dep].discard(key)
+            self._stale.discard(key)
+
+    # Change observers
+
+    def subscribe(self, callback, keys=None):
+        """Registers a callback for changes to trait values.
+
+        Changes are coalesced: callbacks run once per reactor tick for
+        each trait whose values differ from those last reported, so
+        a value that is changed and restored within one tick is never
+        reported. Subscriptions are held in memory only.
+
+        Args:
+            callback (callable): called as `callback(key, old, new)`,
+                where `old` and `new` are `TraitValues` tuples; `old`
+                is None for traits added after subscribing
+            keys (iterable[str], optional): trait keys to observe; all
+                traits if None
+
+        Example:
+            ```python
+            >>> def on_hp(key, old, new):
+            ...     char.msg(prompt="HP: {}".format(new.actual))
+            >>> char.traits.subscribe(on_hp, ('HP',))
+            ```
+        """
+        keys = (None,) if keys is None else tuple(keys)
+        for key in keys:
+            callbacks = self._observers.setdefault(key, [])
+            if callback not in callbacks:
+                callbacks.append(callback)
+        for key in (self.all if keys == (None,) else keys):
+            if key not in self._observed and key in self.attr_dict:
+                self._observed[key] = self._values(key)
+
+    def unsubscribe(self, callback, keys=None):
+        """Removes a callback registered with `subscribe()`."""
+        for key in ((None,) if keys is None else keys):
+            callbacks = self._observers.get(key, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+            if not callbacks:
+                self._observers.pop(key, None)
+
+    def _values(self, key):
+        """Returns the current `TraitValues` of a trait."""
+        trait = self.get(key)
+        return TraitValues(
+            trait.actual, trait.current, trait.base, trait.mod,
+            trait.max if trait._type in RANGE_TRAITS else None)
+
+    def _notify(self):
+        """Reactor callback that reports coalesced changes to observers."""
+        pending, self._pending = self._pending, set()
+        wildcard = self._observers.get(None, ())
+        for key in sorted(pending):
+            if key not in self.attr_dict:
+                continue
+            old, new = self._observed.get(key), self._values(key)
+            if old == new:
+                continue
+            self._observed[key] = new
+            for callback in self._observers.get(key, []) + list(wildcard):
+                try:
+                    callback(key, old, new)
+                except Exception:
+                    logger.log_trace()
+
+    def _on_change(self, key):
+        """Called by a loaded `Trait` after one of its values changes."""
+        self._version += 1
+        if self._observers and (key in self._observers
+                                or None in self._observers):
+            if not self._pending:
+                utils.delay(0, self._notify)
+            self._pending.add(key)
+        if key not in self._dependents:
+            return
+        pending = [key]
+        while pending:
+            for dependent in self._dependents.get(pending.pop(), ()):
+                if dependent not in self._stale:
+                    self._stale.add(dependent)
+                    pending.append(dependent)
+        for dependent in [k for k in self._stale if self._derived[k][3]]:
+            if dependent in self._stale:
+                self._refresh(dependent)
+
+    def _refresh(self, key):
+        """Recalculates a stale derived trait."""
+        self._stale.discard(key)
+        formula, depends, field, _ = self._derived[key]
+        trait = self.get(key)
+        if trait is None or any(self.get(d) is None for d in depends):
+            return
+        value = formula(self)
+        if value is not None and getattr(trait, field) != value:
+            setattr(trait, field, value)
+
+    # Modifiers
+
+    def add_mod(self, trait, name, value, duration=None, stacks=1):
+        """Applies a named modifier to a trait's `mod` value.
+
+        Args:
+            trait (str): key of the trait to modify
+            name (str): name of the modifier, e.g. 'armor' or 'haste'
+            value (int, float): amount added to the trait's `mod`
+            duration (float, optional): seconds until the modifier
+                expires; if None, it lasts until removed
+            stacks (int): maximum number of instances of `name` that
+                may be active on the trait at once. When the limit is
+                reached, the oldest instance is replaced, so the default
+                of 1 refreshes an existing modifier.
+
+        Returns:
+            (int): id of the new modifier
+
+        Example:
+            ```python
+            >>> char.traits.add_mod('DEF', 'shield spell', 2, duration=60)
+            ```
+        """
+        if self.get(trait) is None:
+            raise TraitException("Trait not found: {}".format(trait))
+        if stacks < 1:
+            raise TraitException("Modifier stacks must be at least 1.")
+
+        same = sorted(i for i, mod in self._mods['active'].items()
+                      if mod['trait'] == trait and mod['name'] == name)
+        for mod_id in same[:len(same) - stacks + 1]:
+            self._remove_mod(mod_id)
+
+        if not self.obj.attributes.has(self._mods_attribute):
+            self.obj.attributes.add(self._mods_attribute, self._mods)
+            self._mods = self.obj.attributes.get(self._mods_attribute)
+        self._mods['seq'] += 1
+        mod_id = self._mods['seq']
+        expires = None if duration is None else time() + duration
+        self._mods['active'][mod_id] = dict(
+            trait=trait, name=name, value=value, expires=expires)
+        self.get(trait).mod += value
+        if expires is not None:
+            self.obj.tags.add(*TIMED_MODS_TAG)
+            MODIFIER_SCHEDULER.schedule(expires, self, mod_id)
+        return mod_id
+
+    def remove_mod(self, trait, name):
+        """Removes all instances of a named modifier from a trait.
+
+        Returns:
+            (int): number of modifier instances removed
+        """
+        ids = [i for i, mod in self._mods['active'].items()
+               if mod['trait'] == trait and mod['name'] == name]
+        for mod_id in ids:
+            self._remove_mod(mod_id)
+        return len(ids)
+
+    def get_mods(self, trait=None):
+        """Returns the active modifiers, optionally for a single trait.
+
+        Returns:
+            (list[dict]): copies of modifier data with `id`, `trait`,
+                `name`, `value` and `expires` keys, oldest first
+        """
+        return [dict(mod, id=mod_id) for mod_id, mod
+                in sorted(self._mods['active'].items())
+                if trait is None or mod['trait'] == trait]
+
+    def _remove_mod(self, mod_id):
+        """Reverts and deletes a modifier by id."""
+        mod = self._mods['active'].pop(mod_id)
+        trait = self.get(mod['trait'])
+        if trait is not None:
+            trait.mod -= mod['value']
+
+    def _expire_mod(self, mod_id):
+        """Called by `MODIFIER_SCHEDULER` when a modifier is due."""
+        if not getattr(self.obj, 'pk', True):
+            # object was deleted
+            return
+        if mod_id in self._mods['active']:
+            self._remove_mod(mod_id)
+
+    # Write batching
+
+    @contextmanager
+    def batch(self):
+        """Context manager that defers trait writes until it exits.
+
+        Scopes may be nested; only the outermost scope writes.
+
+        Example:
+            ```python
+            with char.traits.batch():
+                char.traits.ATKR.mod += 1
+                damage = atk_roll + char.traits.ATKR - target.traits.DEF
+                char.traits.ATKR.mod -= 1
+            ```
+        """
+        self.start_batch()
+        try:
+            yield self
+        finally:
+            self.end_batch()
+
+    @property
+    def batching(self):
+        """True while trait changes are being held in memory."""
+        return self._batch_depth > 0
+
+    def start_batch(self, held=False):
+        """Opens a batch scope; see `batch()`.
+
+        Trait data is only copied into memory when the first change is
+        made within the scope, so scopes that only read traits are free.
+
+        Args:
+            held (bool): if True, the scope may stay open across reactor
+                ticks and is never closed as abandoned; its owner must
+                close it with `end_batch`
+        """
+        if self._batch_depth == 0:
+            self._batch_held = held
+        self._batch_depth += 1
+
+    def _before_write(self):
+        """Copies trait data into memory before the first batched change."""
+        if self._batch_depth and self._batch_saved is None:
+            if not self._batch_held:
+                # guard against scopes whose end is never reached
+                utils.delay(0, self._close_abandoned_batch)
+            self._batch_saved = _plain_copy(self._store)
+            self._bind(dict((k, _BatchDict(v) if isinstance(v, dict) else v)
+                            for k, v in _plain_copy(self._store).items()))
+
+    def end_batch(self):
+        """Closes a batch scope, writing changes if it was the outermost."""
+        if self._batch_depth == 0:
+            return
+        self._batch_depth -= 1
+        if self._batch_depth == 0:
+            self._flush()
+
+    def _flush(self):
+        """Writes batched data to the database attribute if it changed."""
+        if self._batch_saved is None:
+            # nothing was changed in the scope
+            return
+        if self._store != self._batch_saved:
+            self.obj.attributes.add(self.db_attribute, self._store)
+        self._batch_saved = None
+        self._bind(self.obj.attributes.get(self.db_attribute))
+
+    def _migrate_compact(self):
+        """Converts dict trait data to compact records in one write."""
+        store = self.obj.attributes.get(self.db_attribute)
+        if any(hasattr(data, 'items') for data in store.values()):
+            self.obj.attributes.add(self.db_attribute, dict(
+                (key, _compact(key, data) if hasattr(data, 'items')
+                 else _plain_copy(data))
+                for key, data in store.items()))
+
+    def _close_abandoned_batch(self):
+        """Reactor callback that closes a scope left open past its tick."""
+        if self._batch_depth:
+            logger.log_warn(
+                "Closing abandoned trait batch on {}.".format(self.obj))
+            self._batch_depth = 0
+            self._flush()
+
+    @property
+    def _store(self):
+        """The trait data as persisted in `db_attribute`."""
+        if self._view is None:
+            return self.attr_dict
+        return self.attr_dict.store
+
+    def _bind(self, attr_dict):
+        """Points the handler and its loaded `Trait`s at new trait data."""
+        if self._view is not None:
+            attr_dict = self._view(attr_dict)
+        self.attr_dict = attr_dict
+        for key, trait in self.cache.items():
+            if key in attr_dict:
+                trait._data = attr_dict[key]
+            else:
+                del self.cache[key]
+
+
+_HANDLER_ATTRS = ('obj', 'db_attribute', 'attr_dict', 'cache', '_view',
+                  '_batch_depth', '_batch_saved', '_batch_held',
+                  '_version', '_snapshots',
+                  '_mods', '_mods_attribute', '_derived', '_dependents', '_stale',
+                  '_observers', '_observed', '_pending')
+
+
+TraitValues = namedtuple('TraitValues', 'actual current base mod max')
+
+
+class TraitSnapshot(Mapping):
+    """Immutable mapping of trait keys to `TraitValues` tuples.
+
+    Values are available as dict keys or attributes, so a snapshot can
+    be passed to `str.format` in place of a `TraitHandler`.
+
+    Args:
+        values (dict): trait key to `TraitValues` mapping
+        version (int): `TraitHandler.version` the values were read at
+    """
+    def __init__(self, values, version):
+        object.__setattr__(self, '_values', values)
+        object.__setattr__(self, 'version', version)
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __getattr__(self, key):
+        if key == '_values':
+            raise AttributeError(key)
+        try:
+            return self._values[key]
+        except KeyError:
+            raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        raise TypeError("'TraitSnapshot' object is immutable.")
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "TraitSnapshot({!r}, version={})".format(
+            self._values, self.version)
+
 
 @total_ordering
 class Trait(object):
     """Represents an object or Character trait.
 
+    Calling `Trait(data)` directly returns an instance of the subclass
+    registered for `data['type']`, so the type-specific behavior of a
+    trait is selected once, when it is constructed.
+
     Note:
         See module docstring for configuration details.
     """
+    __slots__ = ('_data', '_type', '_actual', '_handler', '_key')
+
+    _keys = ('name', 'type', 'base', 'mod',
+             'current', 'min', 'max', 'extra')
+
+    # defaults for the optional range keys; overridden per type
+    _default_min = None
+    _default_max = None
+
+    def __new__(cls, data):
+        if cls is Trait:
+            cls = _TRAIT_CLASSES.get(data.get('type'), StaticTrait)
+        return super(Trait, cls).__new__(cls)
+
     def __init__(self, data):
         if not 'name' in data:
             raise TraitException(
@@ -346,6 +1233,22 @@ class Trait(object):
             raise TraitException(
                 "Required key not found in trait data: 'type'")
         self._type = data['type']
+        self._actual = None
+        self._handler = None
+        self._key = None
+        self._normalize(data)
+        self._data = data
+
+        if not isinstance(data, (_SaverDict, _BatchDict,
+                                 _TemplateData, _CompactData)):
+            logger.log_warn(
+                'Non-persistent {} class loaded.'.format(
+                    type(self).__name__
+                ))
+
+    @classmethod
+    def _normalize(cls, data):
+        """Fills in default values missing from trait data."""
         if not 'base' in data:
             data['base'] = 0
         if not 'mod' in data:
@@ -353,20 +1256,9 @@ class Trait(object):
         if not 'extra' in data:
             data['extra'] = {}
         if 'min' not in data:
-            data['min'] = 0 if self._type == 'gauge' else None
+            data['min'] = cls._default_min
         if 'max' not in data:
-            data['max'] = 'base' if self._type == 'gauge' else None
-
-        self._data = data
-        self._keys = ('name', 'type', 'base', 'mod',
-                      'current', 'min', 'max', 'extra')
-        self._locked = True
-
-        if not isinstance(data, _SaverDict):
-            logger.log_warn(
-                'Non-persistent {} class loaded.'.format(
-                    type(self).__name__
-                ))
+            data['max'] = cls._default_max
 
     def __repr__(self):
         """Debug-friendly representation of this Trait."""
@@ -377,12 +1269,7 @@ class Trait(object):
 
     def __str__(self):
         """User-friendly string representation of this `Trait`"""
-        if self._type == 'gauge':
-            status = "{actual:4} / {base:4}".format(
-                actual=self.actual,
-                base=self.base)
-        else:
-            status = "{actual:11}".format(actual=self.actual)
+        status = "{actual:11}".format(actual=self.actual)
 
         return "{name:12} {status} ({mod:+3})".format(
             name=self.name,
@@ -412,6 +1299,9 @@ class Trait(object):
 
     def __getattr__(self, key):
         """Access extra parameters as attributes."""
+        if key in Trait.__slots__:
+            # slot not yet assigned; avoid recursing into `_data`
+            raise AttributeError(key)
         if key in self._data['extra']:
             return self._data['extra'][key]
         else:
@@ -423,28 +1313,30 @@ class Trait(object):
     def __setattr__(self, key, value):
         """Set extra parameters as attributes.
 
-        Arbitrary attributes set on a Trait object will be
-        stored in the 'extra' key of the `_data` attribute.
-
-        This behavior is enabled by setting the instance
-        variable `_locked` to True.
+        Slots and properties defined on the class are assigned
+        normally. Any other attribute set on a Trait object will
+        be stored in the 'extra' key of the `_data` attribute.
         """
-        propobj = getattr(self.__class__, key, None)
-        if isinstance(propobj, property):
-            if propobj.fset is None:
-                raise AttributeError("can't set attribute")
-            propobj.fset(self, value)
+        if key in Trait.__slots__:
+            object.__setattr__(self, key, value)
+            return
+        descriptor = getattr(type(self), key, None)
+        if hasattr(descriptor, '__set__'):
+            descriptor.__set__(self, value)
         else:
-            if (self.__dict__.get('_locked', False) and
-                    key not in ('_keys',)):
-                self._data['extra'][key] = value
-            else:
-                super(Trait, self).__setattr__(key, value)
+            # replaced rather than mutated, so template data is not shared
+            self._writing()
+            extra = dict(self._data['extra'])
+            extra[key] = value
+            self._data['extra'] = extra
 
     def __delattr__(self, key):
         """Delete extra parameters as attributes."""
         if key in self._data['extra']:
-            del self._data['extra'][key]
+            self._writing()
+            extra = dict(self._data['extra'])
+            del extra[key]
+            self._data['extra'] = extra
 
     # Numeric operations magic
 
@@ -456,7 +1348,7 @@ class Trait(object):
             complete the rich comparison implementation, therefore only
             `__eq__` and `__lt__` are implemented.
         """
-        if type(other) == Trait:
+        if isinstance(other, Trait):
             return self.actual == other.actual
         elif type(other) in (float, int):
             return self.actual == other
@@ -543,30 +1435,29 @@ class Trait(object):
 
     @property
     def actual(self):
-        """The "actual" value of the trait."""
-        if self._type == 'gauge':
-            return self.current
-        elif self._type == 'counter':
-            return self._mod_current()
-        else:
-            return self._mod_base()
-
-    @property
-    def base(self):
-        """The trait's base value.
+        """The "actual" value of the trait.
 
         Note:
-            The setter for this property will enforce any range bounds set
-            on this `Trait`.
+            The value is computed on first access and cached until one
+            of the `base`, `mod`, `current`, `min` or `max` setters
+            is called.
         """
+        actual = self._actual
+        if actual is None:
+            actual = self._actual = self._compute_actual()
+        return actual
+
+    @property
+    def base(self):
+        """The trait's base value."""
         return self._data['base']
 
     @base.setter
     def base(self, amount):
-        if self._data.get('max', None) == 'base':
-            self._data['base'] = amount
         if type(amount) in (int, float):
-            self._data['base'] = self._enforce_bounds(amount)
+            self._writing()
+            self._data['base'] = amount
+            self._changed()
 
     @property
     def mod(self):
@@ -576,80 +1467,41 @@ class Trait(object):
     @mod.setter
     def mod(self, amount):
         if type(amount) in (int, float):
-            delta = amount - self._data['mod']
+            self._writing()
             self._data['mod'] = amount
-            if self._type == 'gauge':
-                if delta >= 0:
-                    # apply increases to current
-                    self.current = self._enforce_bounds(self.current + delta)
-                else:
-                    # but not decreases, unless current goes out of range
-                    self.current = self._enforce_bounds(self.current)
+            self._changed()
 
     @property
     def min(self):
         """The lower bound of the range."""
-        if self._type in RANGE_TRAITS:
-            return self._data['min']
-        else:
-            raise AttributeError(
-                "static 'Trait' object has no attribute 'min'.")
+        raise AttributeError(
+            "static 'Trait' object has no attribute 'min'.")
 
     @min.setter
     def min(self, amount):
-        if self._type in RANGE_TRAITS:
-            if amount is None: self._data['min'] = amount
-            elif type(amount) in (int, float):
-                self._data['min'] = amount if amount < self.base else self.base
-        else:
-            raise AttributeError(
-                "static 'Trait' object has no attribute 'min'.")
+        raise AttributeError(
+            "static 'Trait' object has no attribute 'min'.")
 
     @property
     def max(self):
-        """The maximum value of the `Trait`.
-
-        Note:
-            This property may be set to the string literal 'base'.
-            When set this way, the property returns the value of the
-            `mod`+`base` properties.
-        """
-        if self._type in RANGE_TRAITS:
-            if self._data['max'] == 'base':
-                return self._mod_base()
-            else:
-                return self._data['max']
-        else:
-            raise AttributeError(
-                "static 'Trait' object has no attribute 'max'.")
+        """The maximum value of the `Trait`."""
+        raise AttributeError(
+            "static 'Trait' object has no attribute 'max'.")
 
     @max.setter
     def max(self, value):
-        if self._type in RANGE_TRAITS:
-            if value == 'base' or value is None:
-                self._data['max'] = value
-            elif type(value) in (int, float):
-                self._data['max'] = value if value > self.base else self.base
-        else:
-            raise AttributeError(
-                "static 'Trait' object has no attribute 'max'.")
+        raise AttributeError(
+            "static 'Trait' object has no attribute 'max'.")
 
     @property
     def current(self):
         """The `current` value of the `Trait`."""
-        if self._type == 'gauge':
-            return self._data.get('current', self._mod_base())
-        else:
-            return self._data.get('current', self.base)
+        return self._data.get('current', self._data['base'])
 
     @current.setter
     def current(self, value):
-        if self._type in RANGE_TRAITS:
-            if type(value) in (int, float):
-                self._data['current'] = self._enforce_bounds(value)
-        else:
-            raise AttributeError(
-                "'current' property is read-only on static 'Trait'.")
+        raise AttributeError(
+            "'current' property is read-only on static 'Trait'.")
 
     @property
     def extra(self):
@@ -675,33 +1527,238 @@ class Trait(object):
 
     def percent(self):
         """Returns the value formatted as a percentage."""
-        if self._type in RANGE_TRAITS:
-            if self.max:
-                return "{:3.1f}%".format(self.current * 100.0 / self.max)
-            elif self._type == 'counter' and self.base != 0:
-                return "{:3.1f}%".format(self.current * 100.0 / self._mod_base())
-            elif self._type == 'gauge' and self._mod_base() != 0:
-                return "{:3.1f}%".format(self.current * 100.0 / self._mod_base())
-        # if we get to this point, it's either a static trait or
-        # a divide by zero situation
+        # static traits have no range to measure against
         return "100.0%"
 
+    def subscribe(self, callback):
+        """Registers a change callback for this trait.
+
+        See `TraitHandler.subscribe` for details.
+        """
+        if self._handler is None:
+            raise TraitException("Trait is not bound to a TraitHandler.")
+        self._handler.subscribe(callback, (self._key,))
+
+    def unsubscribe(self, callback):
+        """Removes a change callback registered with `subscribe()`."""
+        if self._handler is not None:
+            self._handler.unsubscribe(callback, (self._key,))
+
     # Private members
 
+    def _writing(self):
+        """Called by the value setters before they change `_data`."""
+        if self._handler is not None:
+            self._handler._before_write()
+
+    def _changed(self):
+        """Invalidates cached values after one of the value setters runs."""
+        self._actual = None
+        if self._handler is not None:
+            self._handler._on_change(self._key)
+
+    def _compute_actual(self):
+        """Calculates the uncached `actual` value of the trait."""
+        return self._mod_base()
+
     def _mod_base(self):
-        return self._enforce_bounds(self.mod + self.base)
+        return self._enforce_bounds(self._data['mod'] + self._data['base'])
 
     def _mod_current(self):
-        return self._enforce_bounds(self.mod + self.current)
+        return self._enforce_bounds(self._data['mod'] + self.current)
+
+    def _enforce_bounds(self, value):
+        """Ensures that incoming value falls within trait's range."""
+        return value
+
+
+class StaticTrait(Trait):
+    """A `Trait` with a base value and a modifier.
+
+    The `actual` value of a static trait is simply `base`+`mod`.
+    """
+    __slots__ = ()
+
+    def _compute_actual(self):
+        data = self._data
+        return data['mod'] + data['base']
+
+
+class CounterTrait(Trait):
+    """A `Trait` whose `current` value varies along a bounded range.
+
+    The `actual` value of a counter trait is `current`+`mod`, constrained
+    to the range defined by `min` and `max`.
+    """
+    __slots__ = ()
+
+    def _compute_actual(self):
+        data = self._data
+        return self._enforce_bounds(
+            data['mod'] + data.get('current', data['base']))
+
+    @property
+    def base(self):
+        """The trait's base value.
+
+        Note:
+            The setter for this property will enforce any range bounds set
+            on this `Trait`.
+        """
+        return self._data['base']
+
+    @base.setter
+    def base(self, amount):
+        self._writing()
+        if self._data['max'] == 'base':
+            self._data['base'] = amount
+        if type(amount) in (int, float):
+            self._data['base'] = self._enforce_bounds(amount)
+        self._changed()
+
+    @property
+    def min(self):
+        """The lower bound of the range."""
+        return self._data['min']
+
+    @min.setter
+    def min(self, amount):
+        self._writing()
+        if amount is None: self._data['min'] = amount
+        elif type(amount) in (int, float):
+            self._data['min'] = amount if amount < self.base else self.base
+        self._changed()
+
+    @property
+    def max(self):
+        """The maximum value of the `Trait`.
+
+        Note:
+            This property may be set to the string literal 'base'.
+            When set this way, the property returns the value of the
+            `mod`+`base` properties.
+        """
+        if self._data['max'] == 'base':
+            return self._mod_base()
+        else:
+            return self._data['max']
+
+    @max.setter
+    def max(self, value):
+        self._writing()
+        if value == 'base' or value is None:
+            self._data['max'] = value
+        elif type(value) in (int, float):
+            self._data['max'] = value if value > self.base else self.base
+        self._changed()
+
+    @property
+    def current(self):
+        """The `current` value of the `Trait`."""
+        return self._data.get('current', self._data['base'])
+
+    @current.setter
+    def current(self, value):
+        if type(value) in (int, float):
+            self._writing()
+            self._data['current'] = self._enforce_bounds(value)
+            self._changed()
+
+    def percent(self):
+        """Returns the value formatted as a percentage."""
+        if self.max:
+            return "{:3.1f}%".format(self.current * 100.0 / self.max)
+        elif self.base != 0:
+            return "{:3.1f}%".format(self.current * 100.0 / self._mod_base())
+        # divide by zero situation
+        return "100.0%"
 
     def _enforce_bounds(self, value):
         """Ensures that incoming value falls within trait's range."""
-        if self._type in RANGE_TRAITS:
-            if self.min is not None and value <= self.min:
-                return self.min
-            if self._data['max'] == 'base' and value >= self.mod + self.base:
-                return self.mod + self.base
-            if self.max is not None and value >= self.max:
-                return self.max
+        data = self._data
+        lower = data['min']
+        if lower is not None and value <= lower:
+            return lower
+        upper = data['max']
+        if upper == 'base':
+            upper = data['mod'] + data['base']
+        if upper is not None and value >= upper:
+            return upper
         return value
 
+
+class GaugeTrait(CounterTrait):
+    """A `Trait` modeling a gauge that can be emptied and refilled.
+
+    The `actual` value of a gauge trait is its `current` value; `mod`
+    adjusts the "full" value of the gauge instead.
+    """
+    __slots__ = ()
+
+    _default_min = 0
+    _default_max = 'base'
+
+    def __str__(self):
+        """User-friendly string representation of this `Trait`"""
+        status = "{actual:4} / {base:4}".format(
+            actual=self.actual,
+            base=self.base)
+
+        return "{name:12} {status} ({mod:+3})".format(
+            name=self.name,
+            status=status,
+            mod=self.mod)
+
+    def _compute_actual(self):
+        return self.current
+
+    @property
+    def mod(self):
+        """The trait's modifier."""
+        return self._data['mod']
+
+    @mod.setter
+    def mod(self, amount):
+        if type(amount) in (int, float):
+            self._writing()
+            delta = amount - self._data['mod']
+            self._data['mod'] = amount
+            self._changed()
+            if delta >= 0:
+                # apply increases to current
+                self.current = self._enforce_bounds(self.current + delta)
+            else:
+                # but not decreases, unless current goes out of range
+                self.current = self._enforce_bounds(self.current)
+
+    @property
+    def current(self):
+        """The `current` value of the `Trait`."""
+        data = self._data
+        if 'current' in data:
+            return data['current']
+        return self._mod_base()
+
+    @current.setter
+    def current(self, value):
+        if type(value) in (int, float):
+            self._writing()
+            self._data['current'] = self._enforce_bounds(value)
+            self._changed()
+
+    def percent(self):
+        """Returns the value formatted as a percentage."""
+        if self.max:
+            return "{:3.1f}%".format(self.current * 100.0 / self.max)
+        elif self._mod_base() != 0:
+            return "{:3.1f}%".format(self.current * 100.0 / self._mod_base())
+        # divide by zero situation
+        return "100.0%"
+
+
+# maps the persisted 'type' key of trait data to its `Trait` class
+_TRAIT_CLASSES = {
+    'static': StaticTrait,
+    'counter': CounterTrait,
+    'gauge': GaugeTrait,
+}